@@ -3,6 +3,7 @@ import os
 
 from sqlalchemy import engine_from_config
 from sqlalchemy import pool
+from sqlalchemy import text
 
 from alembic import context
 
@@ -19,6 +20,7 @@ if config.config_file_name is not None:
 # for 'autogenerate' support
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
+from app.migrations import PROGRESS
 from app.repository import Base
 
 target_metadata = Base.metadata
@@ -39,6 +41,27 @@ DATABASE_URL = f"postgresql+psycopg://{DATABASE_USER}:{DATABASE_PASSWORD}@{DATAB
 config.set_main_option("sqlalchemy.url", DATABASE_URL)
 
 
+def include_name(name, type_, parent_names) -> bool:
+    """Leave the progress of chunked migrations, see `app.migrations`, unchecked."""
+    return not (type_ == "table" and name == PROGRESS.name)
+
+
+def include_object(object, name, type_, reflected, compare_to) -> bool:
+    """Leave the partitions of partitioned tables unchecked.
+
+    They are created by migrations, e.g. those of user_account, not by the models,
+    and have the columns and indexes of their partitioned table.
+    """
+    if type_ != "table" or not reflected or compare_to is not None:
+        return True
+    qualified_name = f"{object.schema}.{name}" if object.schema else name
+    is_partition = context.get_bind().scalar(
+        text("SELECT relispartition FROM pg_class WHERE oid = to_regclass(:name)"),
+        {"name": qualified_name},
+    )
+    return not is_partition
+
+
 def run_migrations_offline() -> None:
     """Run migrations in 'offline' mode.
 
@@ -55,6 +78,7 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_name=include_name,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
     )
@@ -77,7 +101,15 @@ def run_migrations_online() -> None:
     )
 
     with connectable.connect() as connection:
-        context.configure(connection=connection, target_metadata=target_metadata)
+        # Commit each migration on its own, rather than all of them in a single
+        # transaction holding every lock until the last one is done:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            include_name=include_name,
+            include_object=include_object,
+            transaction_per_migration=True,
+        )
 
         with context.begin_transaction():
             context.run_migrations()
@@ -0,0 +1,61 @@
+"""Add user_account search indexes
+
+Revision ID: 3f8b2c7d9e41
+Revises: 6a9d159c5fee
+Create Date: 2026-10-17 09:12:31.118402
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3f8b2c7d9e41"
+down_revision: Union[str, Sequence[str], None] = "6a9d159c5fee"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    # Build the indexes without locking the table against writes, which has to
+    # happen outside of the migration's transaction:
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "ix_user_account_name",
+            "user_account",
+            ["name"],
+            postgresql_ops={"name": "varchar_pattern_ops"},
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            "ix_user_account_fullname_trgm",
+            "user_account",
+            ["fullname"],
+            postgresql_using="gin",
+            postgresql_ops={"fullname": "gin_trgm_ops"},
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_user_account_fullname_trgm",
+            table_name="user_account",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.drop_index(
+            "ix_user_account_name",
+            table_name="user_account",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
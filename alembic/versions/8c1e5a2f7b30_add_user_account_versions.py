@@ -0,0 +1,57 @@
+"""Add user_account versions
+
+Revision ID: 8c1e5a2f7b30
+Revises: 3f8b2c7d9e41
+Create Date: 2026-10-17 11:04:52.730214
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8c1e5a2f7b30"
+down_revision: Union[str, Sequence[str], None] = "3f8b2c7d9e41"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # A constant default does not rewrite the table on PostgreSQL 11+:
+    op.add_column(
+        "user_account",
+        sa.Column("version", sa.Integer(), server_default="1", nullable=False),
+    )
+    # Increment the version on every update, whoever runs it. An update setting
+    # it, as the ORM does for its optimistic locking, is left alone:
+    op.execute(
+        """
+        CREATE FUNCTION increment_version() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            IF NEW.version = OLD.version THEN
+                NEW.version := OLD.version + 1;
+            END IF;
+            RETURN NEW;
+        END
+        $$
+        """
+    )
+    op.execute(
+        """
+        CREATE TRIGGER user_account_increment_version
+        BEFORE UPDATE ON user_account
+        FOR EACH ROW EXECUTE FUNCTION increment_version()
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute("DROP TRIGGER user_account_increment_version ON user_account")
+    op.execute("DROP FUNCTION increment_version()")
+    op.drop_column("user_account", "version")
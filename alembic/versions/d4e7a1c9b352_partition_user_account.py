@@ -0,0 +1,198 @@
+"""Partition user_account
+
+Revision ID: d4e7a1c9b352
+Revises: 8c1e5a2f7b30
+Create Date: 2026-10-17 15:21:07.492611
+
+"""
+
+import os
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from app.migrations import run_in_chunks
+
+
+# revision identifiers, used by Alembic.
+revision: str = "d4e7a1c9b352"
+down_revision: Union[str, Sequence[str], None] = "8c1e5a2f7b30"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Number of hash partitions of user_account, fixed once migrated:
+DATABASE_USER_PARTITIONS = int(os.getenv("DATABASE_USER_PARTITIONS", "16"))
+
+COLUMNS = "id, name, fullname, version"
+
+
+def _user_table(name: str) -> sa.TableClause:
+    """Return a table with the columns of user_account."""
+    return sa.table(
+        name,
+        sa.column("id", sa.Uuid()),
+        sa.column("name", sa.String()),
+        sa.column("fullname", sa.String()),
+        sa.column("version", sa.Integer()),
+    )
+
+
+def _create_indexes(table: str) -> None:
+    """Create the search indexes of user_account on a table."""
+    op.create_index(
+        f"ix_{table}_name",
+        table,
+        ["name"],
+        postgresql_ops={"name": "varchar_pattern_ops"},
+        if_not_exists=True,
+    )
+    op.create_index(
+        f"ix_{table}_fullname_trgm",
+        table,
+        ["fullname"],
+        postgresql_using="gin",
+        postgresql_ops={"fullname": "gin_trgm_ops"},
+        if_not_exists=True,
+    )
+
+
+def _rename_table(table: str, new_name: str) -> None:
+    """Rename a user table along with its primary key and search indexes."""
+    op.rename_table(table, new_name)
+    op.execute(
+        f"ALTER TABLE {new_name} RENAME CONSTRAINT {table}_pkey TO {new_name}_pkey"
+    )
+    for index in ("name", "fullname_trgm"):
+        op.execute(f"ALTER INDEX ix_{table}_{index} RENAME TO ix_{new_name}_{index}")
+
+
+def _create_version_trigger() -> None:
+    """Increment the version of a user on every update.
+
+    See the add_user_account_versions migration.
+    """
+    op.execute(
+        """
+        CREATE TRIGGER user_account_increment_version
+        BEFORE UPDATE ON user_account
+        FOR EACH ROW EXECUTE FUNCTION increment_version()
+        """
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema.
+
+    Builds a hash-partitioned copy of user_account while the table stays in use,
+    then swaps it in:
+
+    1. A trigger mirrors every write to user_account into the copy.
+    2. The existing rows are copied in chunks, each committed on its own, see
+       `app.migrations.run_in_chunks`.
+    3. The tables are swapped in one short transaction, locking out writes only
+       for as long as renaming takes.
+
+    Starting the copy commits the steps before it, so they are written to run
+    again when the migration is re-run after the copy failed.
+    """
+    op.create_table(
+        "user_account_partitioned",
+        sa.Column("id", sa.Uuid(), nullable=False),
+        sa.Column("name", sa.String(length=30), nullable=False),
+        sa.Column("fullname", sa.String(), nullable=True),
+        sa.Column("version", sa.Integer(), server_default="1", nullable=False),
+        sa.PrimaryKeyConstraint("id", name="user_account_partitioned_pkey"),
+        postgresql_partition_by="HASH (id)",
+        if_not_exists=True,
+    )
+    for remainder in range(DATABASE_USER_PARTITIONS):
+        op.execute(
+            f"CREATE TABLE IF NOT EXISTS user_account_p{remainder}"
+            " PARTITION OF user_account_partitioned FOR VALUES"
+            f" WITH (MODULUS {DATABASE_USER_PARTITIONS}, REMAINDER {remainder})"
+        )
+    # Indexes on a partitioned table cannot be built concurrently, but the copy is
+    # not in use yet. Each partition gets its own index:
+    _create_indexes("user_account_partitioned")
+    op.execute(
+        f"""
+        CREATE OR REPLACE FUNCTION mirror_user_account() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                DELETE FROM user_account_partitioned WHERE id = OLD.id;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO user_account_partitioned ({COLUMNS})
+                VALUES (NEW.id, NEW.name, NEW.fullname, NEW.version);
+            END IF;
+            RETURN NULL;
+        END
+        $$
+        """
+    )
+    op.execute("DROP TRIGGER IF EXISTS user_account_mirror ON user_account")
+    op.execute(
+        """
+        CREATE TRIGGER user_account_mirror
+        AFTER INSERT OR UPDATE OR DELETE ON user_account
+        FOR EACH ROW EXECUTE FUNCTION mirror_user_account()
+        """
+    )
+
+    # Commit the trigger before copying, so that no write is missed, and every
+    # chunk on its own, so that writes are never blocked for long:
+    user_account = _user_table("user_account")
+    partitioned = _user_table("user_account_partitioned")
+    with op.get_context().autocommit_block():
+        run_in_chunks(
+            op.get_bind().engine,
+            "partition_user_account",
+            user_account.c.id,
+            # Locking the rows copied keeps them from being updated or deleted
+            # before the chunk commits, which the trigger would mirror before the
+            # copy:
+            lambda in_chunk: (
+                postgresql.insert(partitioned)
+                .from_select(
+                    list(partitioned.c),
+                    sa.select(*user_account.c)
+                    .where(in_chunk)
+                    .with_for_update(read=True),
+                )
+                .on_conflict_do_nothing(index_elements=["id"])
+            ),
+        )
+
+    op.execute("LOCK TABLE user_account IN ACCESS EXCLUSIVE MODE")
+    op.execute("DROP TABLE user_account")
+    op.execute("DROP FUNCTION mirror_user_account()")
+    _rename_table("user_account_partitioned", "user_account")
+    _create_version_trigger()
+
+
+def downgrade() -> None:
+    """Downgrade schema.
+
+    Copies the users back into a table that is not partitioned, locking out
+    writes for as long as the copy takes.
+    """
+    op.execute("LOCK TABLE user_account IN ACCESS EXCLUSIVE MODE")
+    _rename_table("user_account", "user_account_partitioned")
+    op.create_table(
+        "user_account",
+        sa.Column("id", sa.Uuid(), nullable=False),
+        sa.Column("name", sa.String(length=30), nullable=False),
+        sa.Column("fullname", sa.String(), nullable=True),
+        sa.Column("version", sa.Integer(), server_default="1", nullable=False),
+        sa.PrimaryKeyConstraint("id", name="user_account_pkey"),
+    )
+    op.execute(
+        f"INSERT INTO user_account ({COLUMNS})"
+        f" SELECT {COLUMNS} FROM user_account_partitioned"
+    )
+    op.drop_table("user_account_partitioned")
+    _create_indexes("user_account")
+    _create_version_trigger()
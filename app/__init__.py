@@ -1,5 +1,8 @@
 """Module for the main functionality of the package."""
 
-from .main import api
+from .startup import profile_imports
+
+with profile_imports(__name__):
+    from .main import api
 
 __all__ = ["api"]
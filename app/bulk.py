@@ -0,0 +1,70 @@
+"""Parsing of bulk user uploads."""
+
+from collections.abc import AsyncIterator
+
+from fastapi import Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import TypeAdapter, ValidationError
+
+from .models import User
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+user_list_adapter = TypeAdapter(list[User])
+
+
+def _validation_error(e: ValidationError, *loc: int) -> RequestValidationError:
+    """Convert a pydantic error into a request error located in the body."""
+    return RequestValidationError(
+        [{**error, "loc": ("body", *loc, *error["loc"])} for error in e.errors()]
+    )
+
+
+async def _read_json_array(request: Request) -> AsyncIterator[User]:
+    """Read users from a JSON array body."""
+    try:
+        users = user_list_adapter.validate_json(await request.body())
+    except ValidationError as e:
+        raise _validation_error(e) from e
+    for user in users:
+        yield user
+
+
+async def _read_ndjson(request: Request) -> AsyncIterator[User]:
+    """Read users from a newline-delimited JSON body as it arrives."""
+    buffer = b""
+    line_number = 0
+    async for data in request.stream():
+        buffer += data
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            line_number += 1
+            if line.strip():
+                yield _parse_line(line, line_number)
+    if buffer.strip():
+        yield _parse_line(buffer, line_number + 1)
+
+
+def _parse_line(line: bytes, line_number: int) -> User:
+    """Parse one NDJSON line, reporting errors by line number."""
+    try:
+        return User.model_validate_json(line)
+    except ValidationError as e:
+        raise _validation_error(e, line_number) from e
+
+
+async def read_users(request: Request, chunk_size: int) -> AsyncIterator[list[User]]:
+    """Read users from a JSON array or an NDJSON stream, `chunk_size` at a time."""
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith(NDJSON_MEDIA_TYPE):
+        users = _read_ndjson(request)
+    else:
+        users = _read_json_array(request)
+    chunk: list[User] = []
+    async for user in users:
+        chunk.append(user)
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
@@ -0,0 +1,177 @@
+"""Compression of large responses, negotiated through `Accept-Encoding`."""
+
+import os
+import zlib
+from collections.abc import Callable
+from typing import Protocol
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    from compression import zstd  # Python 3.14+  # ty: ignore[unresolved-import]
+except ImportError:  # pragma: no cover
+    zstd = None
+
+RESPONSE_COMPRESSION = os.getenv("RESPONSE_COMPRESSION", "true").lower() == "true"
+RESPONSE_COMPRESSION_MIN_SIZE = int(os.getenv("RESPONSE_COMPRESSION_MIN_SIZE", "1024"))
+
+# Only text formats compress well:
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+
+class Compressor(Protocol):
+    """The interface shared by `zlib` and `zstd` compressor objects."""
+
+    def compress(self, data: bytes, /) -> bytes:
+        """Compress a chunk, returning output that is ready."""
+        ...
+
+    def flush(self, mode: int = ..., /) -> bytes:
+        """Finish the stream, or flush it with `mode`, returning the output."""
+        ...
+
+
+# By order of preference, when the client accepts several equally:
+ENCODINGS: dict[str, Callable[[], Compressor]] = {}
+# The flush mode of each encoding that outputs everything compressed so far,
+# without finishing the stream:
+SYNC_FLUSH: dict[str, int] = {}
+if zstd is not None:  # pragma: no cover
+    ENCODINGS["zstd"] = zstd.ZstdCompressor
+    SYNC_FLUSH["zstd"] = zstd.ZstdCompressor.FLUSH_BLOCK
+# The fastest level: on lists of users, level 6 takes twice as long to save 7%:
+ENCODINGS["gzip"] = lambda: zlib.compressobj(1, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+SYNC_FLUSH["gzip"] = zlib.Z_SYNC_FLUSH
+
+
+def choose_encoding(accept_encoding: str) -> str | None:
+    """Choose the preferred supported encoding from an `Accept-Encoding` header."""
+    accepted: dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.partition(";")
+        quality = 1.0
+        name, _, value = params.strip().partition("=")
+        if name.strip() == "q":
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+        accepted[coding.strip().lower()] = quality
+    candidates = [encoding for encoding in ENCODINGS if accepted.get(encoding, 0.0) > 0]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda encoding: accepted[encoding])
+
+
+def _is_compressible(headers: Headers) -> bool:
+    """Check that a response is not compressed yet and of a text format."""
+    return "content-encoding" not in headers and headers.get(
+        "content-type", ""
+    ).startswith(COMPRESSIBLE_TYPES)
+
+
+class _CompressingSend:
+    """Compress the messages of one response on their way to `send`."""
+
+    def __init__(self, send: Send, encoding: str, minimum_size: int) -> None:
+        """Wrap the `send` of a response."""
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.start: Message | None = None
+        self.compressor: Compressor | None = None
+
+    async def __call__(self, message: Message) -> None:
+        """Send a message, compressing it if it is part of a compressed body."""
+        if message["type"] == "http.response.start":
+            # Hold back the headers until the first chunk of the body shows
+            # whether to compress:
+            self.start = message
+            return
+        if message["type"] != "http.response.body":
+            await self.send(message)
+            return
+        if self.start is not None:
+            message = self._begin(self.start, message)
+            await self.send(self.start)
+            self.start = None
+        if self.compressor is None:
+            await self.send(message)
+            return
+        more_body = message.get("more_body", False)
+        chunk = message.get("body", b"")
+        if not more_body:
+            body = self.compressor.compress(chunk) + self.compressor.flush()
+        elif not chunk:
+            return
+        else:
+            # Send every chunk as it comes, e.g. the first rows of an export,
+            # rather than wait for the compressor to fill a block:
+            body = self.compressor.compress(chunk) + self.compressor.flush(
+                SYNC_FLUSH[self.encoding]
+            )
+        await self.send(
+            {"type": "http.response.body", "body": body, "more_body": more_body}
+        )
+
+    def _begin(self, start: Message, message: Message) -> Message:
+        """Decide from the first chunk of the body whether to compress the response.
+
+        Updates the headers in `start` and returns the first chunk to send, which
+        is already compressed if it is the whole body.
+        """
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        headers = MutableHeaders(scope=start)
+        if not _is_compressible(headers) or (
+            not more_body and len(body) < self.minimum_size
+        ):
+            return message
+        compressor = ENCODINGS[self.encoding]()
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        # A strong ETag promises the exact bytes, which compression changes:
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["ETag"] = "W/" + etag
+        if more_body:
+            if "content-length" in headers:
+                del headers["Content-Length"]
+            self.compressor = compressor
+            return message
+        body = compressor.compress(body) + compressor.flush()
+        headers["Content-Length"] = str(len(body))
+        return {**message, "body": body}
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses with zstd or gzip.
+
+    Bodies sent in one piece are compressed if at least `minimum_size` bytes.
+    Streamed bodies, like exports, are always compressed, chunk by chunk.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = RESPONSE_COMPRESSION_MIN_SIZE,
+        *,
+        enabled: bool = True,
+    ) -> None:
+        """Wrap an ASGI application."""
+        self.app = app
+        self.minimum_size = minimum_size
+        self.enabled = enabled
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Handle a request, compressing the response if the client accepts it."""
+        encoding = None
+        if self.enabled and scope["type"] == "http":
+            encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(
+            scope, receive, _CompressingSend(send, encoding, self.minimum_size)
+        )
@@ -0,0 +1,52 @@
+"""Entity tags and caching headers for conditional requests on users."""
+
+import hashlib
+import os
+from collections.abc import Iterable
+from uuid import UUID
+
+from fastapi import Response
+
+USERS_CACHE_CONTROL = os.getenv("USERS_CACHE_CONTROL", "no-cache")
+
+
+def make_etag(version: int) -> str:
+    """Make a strong ETag from the version of a resource."""
+    return f'"{version}"'
+
+
+def make_list_etag(versions: Iterable[tuple[UUID, int]]) -> str:
+    """Make a strong ETag from the IDs and versions of the resources in a list.
+
+    It changes when a resource listed is updated, added or left out.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for resource_id, version in versions:
+        digest.update(resource_id.bytes)
+        digest.update(version.to_bytes(8, signed=True))
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Check whether an `If-None-Match` header matches an ETag.
+
+    `If-None-Match` uses the weak comparison, so an ETag weakened on the way,
+    e.g. by compression, still matches.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(
+        tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(",")
+    )
+
+
+def cache_headers(etag: str) -> dict[str, str]:
+    """Return the headers letting clients and caches revalidate a response."""
+    return {"ETag": etag, "Cache-Control": USERS_CACHE_CONTROL}
+
+
+def not_modified(etag: str) -> Response:
+    """Return a `304 Not Modified` response for an ETag."""
+    return Response(status_code=304, headers=cache_headers(etag))
@@ -0,0 +1,45 @@
+"""Serializers for streaming exports of users."""
+
+import csv
+import io
+from collections.abc import AsyncIterable, AsyncIterator
+
+from .models import User
+
+CSV_HEADER = ("id", "name", "fullname")
+
+
+async def _batched(
+    users: AsyncIterable[User], batch_size: int
+) -> AsyncIterator[list[User]]:
+    """Group users into lists of `batch_size`, the last one possibly shorter."""
+    batch: list[User] = []
+    async for user in users:
+        batch.append(user)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+async def to_ndjson(
+    users: AsyncIterable[User], batch_size: int
+) -> AsyncIterator[bytes]:
+    """Serialize users as newline-delimited JSON, one write per batch of users."""
+    async for batch in _batched(users, batch_size):
+        yield "".join(user.model_dump_json() + "\n" for user in batch).encode()
+
+
+async def to_csv(users: AsyncIterable[User], batch_size: int) -> AsyncIterator[bytes]:
+    """Serialize users as CSV with a header row, one write per batch of users."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    # Send the header right away, so the first byte is not held back by the query:
+    yield buffer.getvalue().encode()
+    async for batch in _batched(users, batch_size):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows((user.id, user.name, user.fullname) for user in batch)
+        yield buffer.getvalue().encode()
@@ -0,0 +1,69 @@
+"""Cached database schema check for the health endpoints."""
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+
+from fastapi.concurrency import run_in_threadpool
+
+from .repository import AsyncRepository, Repository
+
+HEALTH_SCHEMA_TTL = float(os.getenv("HEALTH_SCHEMA_TTL", "300"))
+# Seconds a failed check is cached, short so that a migrated schema is seen soon:
+HEALTH_SCHEMA_FAILURE_TTL = float(os.getenv("HEALTH_SCHEMA_FAILURE_TTL", "10"))
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class SchemaCheck:
+    """The outcome of comparing the database schema with the migrations."""
+
+    up_to_date: bool
+    current_revision: str | None
+    current_head: str | None
+    checked_at: float
+
+
+_schema_check: SchemaCheck | None = None
+_schema_check_lock = asyncio.Lock()
+
+
+async def run_schema_check() -> SchemaCheck:
+    """Run the schema check and cache the result.
+
+    This reflects the whole database schema and diffs it against the models, so
+    it is expensive and should only run on startup or when the cache expires.
+    """
+    global _schema_check  # noqa: PLW0603
+    # Alembic's commands are blocking, so keep them off the event loop:
+    up_to_date = await run_in_threadpool(Repository.check)
+    current_revision = await AsyncRepository.get_current_revision()
+    current_head = await run_in_threadpool(Repository.get_current_head)
+    _schema_check = SchemaCheck(
+        up_to_date=up_to_date,
+        current_revision=current_revision,
+        current_head=current_head,
+        checked_at=time.monotonic(),
+    )
+    return _schema_check
+
+
+async def get_schema_check() -> SchemaCheck:
+    """Return the cached schema check, running it again if older than the TTL.
+
+    A failed check is cached for `HEALTH_SCHEMA_FAILURE_TTL` seconds only, so a
+    fixed schema (e.g. after running the migrations) is picked up soon, while
+    probes during a rollout do not each run the check again.
+    """
+    async with _schema_check_lock:
+        if _schema_check is None:
+            return await run_schema_check()
+        ttl = (
+            HEALTH_SCHEMA_TTL if _schema_check.up_to_date else HEALTH_SCHEMA_FAILURE_TTL
+        )
+        if time.monotonic() - _schema_check.checked_at > ttl:
+            return await run_schema_check()
+        return _schema_check
@@ -1,58 +1,424 @@
 """Main module to demonstrate SQLAlchemy and pydantic integration."""
 
+import asyncio
+import contextlib
+import logging
+import math
+import os
+import time
 import uuid
+from collections.abc import AsyncGenerator, AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Annotated, Literal
 
-from fastapi import FastAPI, HTTPException
+from fastapi import (
+    Body,
+    Cookie,
+    Depends,
+    FastAPI,
+    Header,
+    HTTPException,
+    Query,
+    Request,
+    Response,
+)
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.exc import SQLAlchemyError
 
-from .models import User
-from .repository import Repository
+from .bulk import read_users
+from .compression import RESPONSE_COMPRESSION, CompressionMiddleware
+from .etags import (
+    cache_headers,
+    etag_matches,
+    make_etag,
+    make_list_etag,
+    not_modified,
+)
+from .export import to_csv, to_ndjson
+from .health import get_schema_check
+from .metrics import CONTENT_TYPE, MetricsMiddleware, render
+from .models import (
+    BulkInsertError,
+    BulkInsertResult,
+    User,
+    UserLookupResult,
+    decode_cursor,
+    encode_cursor,
+)
+from .repository import UserRepository, UserSession
+from .repository.cache import user_cache
+from .repository.limiter import OverloadedError
+from .repository.repository import DATABASE_BACKEND
+from .repository.writer import user_writer
+from .responses import UserJSONResponse
+from .startup import report_startup, timed_phase
 
-api = FastAPI()
+logger = logging.getLogger(__name__)
+
+USERS_PAGE_SIZE = int(os.getenv("USERS_PAGE_SIZE", "100"))
+USERS_MAX_PAGE_SIZE = int(os.getenv("USERS_MAX_PAGE_SIZE", "1000"))
+USERS_EXPORT_CHUNK_SIZE = int(os.getenv("USERS_EXPORT_CHUNK_SIZE", "1000"))
+USERS_BULK_CHUNK_SIZE = int(os.getenv("USERS_BULK_CHUNK_SIZE", "1000"))
+USERS_SEARCH_MIN_LENGTH = int(os.getenv("USERS_SEARCH_MIN_LENGTH", "3"))
+USERS_LOOKUP_MAX_IDS = int(os.getenv("USERS_LOOKUP_MAX_IDS", "1000"))
+USERS_WRITE_BATCHING = os.getenv("USERS_WRITE_BATCHING", "false").lower() == "true"
+# Seconds a client rejected by load shedding is asked to wait before retrying:
+OVERLOAD_RETRY_AFTER = int(os.getenv("OVERLOAD_RETRY_AFTER", "1"))
+# Seconds a client reads from the primary after a write, 0 to disable:
+DATABASE_READ_YOUR_WRITES = float(os.getenv("DATABASE_READ_YOUR_WRITES", "0"))
+
+LAST_WRITE_COOKIE = "last_write"
+
+
+async def check_schema_on_startup() -> None:
+    """Check the database schema, only logging if it cannot be checked yet."""
+    try:
+        await get_schema_check()
+    except SQLAlchemyError:
+        logger.exception("Could not check the database schema on startup.")
+
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncGenerator[None]:
+    """Create the database engine on startup and dispose of it on shutdown."""
+    with timed_phase("create engines"):
+        UserRepository.create_engine()
+    tasks = [asyncio.create_task(UserRepository.replicas.monitor())]
+    if DATABASE_BACKEND == "postgresql":
+        # Check the schema in the background, so startup does not wait for Alembic
+        # to be imported and to compare the whole schema:
+        tasks.append(asyncio.create_task(check_schema_on_startup()))
+    else:
+        # Not managed by Alembic, so created from the models:
+        with timed_phase("create schema"):
+            await UserRepository.create_schema()
+    if USERS_WRITE_BATCHING:
+        user_writer.start()
+    report_startup()
+    yield
+    await user_writer.stop()
+    for task in tasks:
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+    await UserRepository.dispose_engine()
+
+
+api = FastAPI(lifespan=lifespan)
+api.add_middleware(CompressionMiddleware, enabled=RESPONSE_COMPRESSION)
+api.add_middleware(MetricsMiddleware)
+
+
+@api.exception_handler(OverloadedError)
+async def shed_load(_: Request, e: OverloadedError) -> JSONResponse:
+    """Reject a request quickly while the database is saturated."""
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(e)},
+        headers={"Retry-After": str(OVERLOAD_RETRY_AFTER)},
+    )
+
+
+def _written_at(last_write: str | None) -> float | None:
+    """Parse the time of a client's last write, `None` if absent or invalid.
+
+    The cookie is sent by the client, so an invalid one is ignored rather than
+    failing the request.
+    """
+    if not last_write:
+        return None
+    try:
+        written_at = float(last_write)
+    except ValueError:
+        return None
+    return written_at if math.isfinite(written_at) else None
+
+
+async def get_read_session(
+    last_write: Annotated[str | None, Cookie(alias=LAST_WRITE_COOKIE)] = None,
+) -> AsyncIterator[UserSession]:
+    """Yield one session per request on a read replica.
+
+    A client that wrote within the last `DATABASE_READ_YOUR_WRITES` seconds reads
+    from the primary instead, so it sees its own writes despite replication lag.
+    """
+    written_at = _written_at(last_write)
+    primary = (
+        written_at is not None and time.time() - written_at < DATABASE_READ_YOUR_WRITES
+    )
+    async with UserRepository.read_session(primary=primary) as session:
+        yield session
+
+
+def pin_to_primary(response: Response) -> None:
+    """Mark the client as having written, see `get_read_session`.
+
+    Set on the response returned, as FastAPI leaves out the headers set by
+    dependencies from a response returned directly.
+    """
+    if DATABASE_READ_YOUR_WRITES > 0 and UserRepository.replicas.engines:
+        response.set_cookie(
+            LAST_WRITE_COOKIE,
+            str(time.time()),
+            max_age=max(1, int(DATABASE_READ_YOUR_WRITES)),
+            httponly=True,
+        )
+
+
+async def get_write_session() -> AsyncIterator[UserSession | None]:
+    """Yield one session per request that creates a user, none if writes are batched.
+
+    A batched write is committed by `user_writer` on a session of its own, so the
+    request holds neither a session nor a slot of the limiter while it waits for
+    its batch, which would cap every batch at the limiter's capacity.
+    """
+    if USERS_WRITE_BATCHING:
+        yield None
+        return
+    async with contextlib.aclosing(UserRepository.get_session()) as sessions:
+        async for session in sessions:
+            yield session
+
+
+# One session per request, committed before the response is sent:
+SessionDep = Annotated[
+    UserSession, Depends(UserRepository.get_session, scope="function")
+]
+ReadSessionDep = Annotated[UserSession, Depends(get_read_session, scope="function")]
+WriteSessionDep = Annotated[
+    UserSession | None, Depends(get_write_session, scope="function")
+]
 
 
 @api.get("/health", include_in_schema=False)
-def health_check() -> dict:
-    """Health check endpoint to verify the API is running.
+async def health_check() -> dict:
+    """Liveness check, verifying that the database is reachable.
+
+    This is cheap enough to be probed every few seconds.
+    """
+    try:
+        await UserRepository.ping()
+    except SQLAlchemyError as e:
+        logger.exception("Database is not reachable.")
+        raise HTTPException(status_code=503, detail="Database not reachable.") from e
+    return {"status": "ok"}
+
 
-    It will check the database schema version and return a simple status message.
+@api.get("/health/schema", include_in_schema=False)
+async def schema_health_check() -> dict:
+    """Health check endpoint to verify the database schema is up to date.
+
+    The check is expensive, so its result is cached for `HEALTH_SCHEMA_TTL` seconds,
+    or `HEALTH_SCHEMA_FAILURE_TTL` seconds if it failed.
     """
-    Repository.create_engine()  # Initialize the repository engine
-    up_to_date = Repository.check()
-    current_revision = Repository.get_current_revision()
-    current_head = Repository.get_current_head()
-    if not up_to_date:
+    schema_check = await get_schema_check()
+    if not schema_check.up_to_date:
         raise HTTPException(
             status_code=500,
             detail=(
                 "Database schema not up to date."
-                f" Current database schema revision is '{current_revision}'"
-                f" and current head is '{current_head}'"
+                " Current database schema revision is"
+                f" '{schema_check.current_revision}'"
+                f" and current head is '{schema_check.current_head}'"
             ),
         )
     return {
         "status": "ok",
-        "currentDatabaseSchemaRevision": current_revision,
-        "currentHead": current_head,
+        "currentDatabaseSchemaRevision": schema_check.current_revision,
+        "currentHead": schema_check.current_head,
     }
 
 
-@api.get("/users")
-def list_users() -> list[User]:
-    """List all users."""
-    return User.list()
+def _decode_cursor(cursor: str | None) -> uuid.UUID | None:
+    """Decode the cursor of a page request, if any."""
+    try:
+        return decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from e
+
 
+def _page(
+    users: list[User], limit: int, headers: dict[str, str] | None = None
+) -> UserJSONResponse:
+    """Cut one extra fetched user off a page, returning its cursor in a header."""
+    headers = headers or {}
+    if len(users) > limit:
+        users = users[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(users[-1].id)
+    return UserJSONResponse(users, headers=headers)
 
-@api.post("/users")
-def create_user(user: User) -> User:
-    """Create a new user."""
-    user.save()
-    return user
 
+@api.get("/metrics", include_in_schema=False)
+async def metrics() -> Response:
+    """Expose query, pool, cache and request metrics in the Prometheus format."""
+    return Response(render(), media_type=CONTENT_TYPE)
 
-@api.get("/users/{user_id}")
-def get_user(user_id: uuid.UUID) -> User:
-    """Retrieve a user by ID."""
-    user = User.get(user_id)
+
+@api.get("/cache/users", include_in_schema=False)
+async def user_cache_stats() -> dict:
+    """Report the size and hit, miss and eviction counters of the user cache."""
+    return user_cache.stats()
+
+
+@api.get("/users", response_model=list[User], responses={304: {}})
+async def list_users(
+    session: ReadSessionDep,
+    limit: Annotated[int, Query(ge=1, le=USERS_MAX_PAGE_SIZE)] = USERS_PAGE_SIZE,
+    cursor: str | None = None,
+    if_none_match: Annotated[str | None, Header()] = None,
+) -> Response:
+    """List one page of users ordered by ID.
+
+    If there are more users, the cursor for the next page is returned in the
+    `X-Next-Cursor` response header.
+
+    The ETag is derived from the IDs and versions of the users fetched, so it
+    changes with the page returned. If it matches `If-None-Match`,
+    `304 Not Modified` is returned without serializing the users.
+    """
+    after = _decode_cursor(cursor)
+    # Fetch one extra row to find out if there is a next page, and tag it too, as
+    # it decides whether there is one:
+    users = await User.list(session, limit + 1, after)
+    etag = make_list_etag((user.id, user.version) for user in users)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    return _page(users, limit, cache_headers(etag))
+
+
+@api.get("/users/search", response_model=list[User])
+async def search_users(  # noqa: PLR0913
+    *,
+    session: ReadSessionDep,
+    name: str | None = None,
+    prefix: Annotated[str | None, Query(min_length=1)] = None,
+    q: Annotated[str | None, Query(min_length=USERS_SEARCH_MIN_LENGTH)] = None,
+    limit: Annotated[int, Query(ge=1, le=USERS_MAX_PAGE_SIZE)] = USERS_PAGE_SIZE,
+    cursor: str | None = None,
+) -> UserJSONResponse:
+    """Search users by exact name, name prefix or case-insensitive fullname substring.
+
+    Results are paginated like `GET /users`.
+    """
+    if name is None and prefix is None and q is None:
+        raise HTTPException(
+            status_code=400, detail="One of 'name', 'prefix' or 'q' is required"
+        )
+    after = _decode_cursor(cursor)
+    users = await User.search(session, limit + 1, after, name=name, prefix=prefix, q=q)
+    return _page(users, limit)
+
+
+@api.get("/users/export")
+async def export_users(
+    *,
+    export_format: Annotated[
+        Literal["ndjson", "csv"], Query(alias="format")
+    ] = "ndjson",
+    parallel: bool = False,
+) -> StreamingResponse:
+    """Export all users as NDJSON or CSV.
+
+    The response is streamed from a server-side cursor, so memory use stays
+    constant regardless of the number of users. Users are ordered by ID, unless
+    `parallel` is set to read the partitions of the user table in parallel.
+    """
+    if parallel:
+        users = User.scan(USERS_EXPORT_CHUNK_SIZE)
+    else:
+        users = User.stream(USERS_EXPORT_CHUNK_SIZE)
+    if export_format == "csv":
+        return StreamingResponse(
+            to_csv(users, USERS_EXPORT_CHUNK_SIZE), media_type="text/csv"
+        )
+    return StreamingResponse(
+        to_ndjson(users, USERS_EXPORT_CHUNK_SIZE), media_type="application/x-ndjson"
+    )
+
+
+@api.post("/users", response_model=User)
+async def create_user(session: WriteSessionDep, user: User) -> UserJSONResponse:
+    """Create a new user.
+
+    With `USERS_WRITE_BATCHING`, the user is committed together with users created
+    by concurrent requests, see `app.repository.writer`.
+    """
+    if session is None:
+        await user_writer.save(user)
+    else:
+        await user.save(session)
+    response = UserJSONResponse(user)
+    pin_to_primary(response)
+    return response
+
+
+@api.post("/users/lookup", response_model=UserLookupResult)
+async def lookup_users(
+    session: ReadSessionDep,
+    ids: Annotated[
+        list[uuid.UUID], Body(embed=True, min_length=1, max_length=USERS_LOOKUP_MAX_IDS)
+    ],
+) -> UserJSONResponse:
+    """Retrieve many users by ID in a single query.
+
+    Users are returned in the order they were requested, and IDs without a user are
+    listed in `missing`.
+    """
+    requested = list(dict.fromkeys(ids))
+    users = await User.get_many(session, requested)
+    # Built from users and IDs that are valid already, so skip validation:
+    result = UserLookupResult.model_construct(
+        users=[users[user_id] for user_id in requested if user_id in users],
+        missing=[user_id for user_id in requested if user_id not in users],
+    )
+    return UserJSONResponse(result)
+
+
+@api.get("/users/{user_id}", response_model=User, responses={304: {}})
+async def get_user(
+    session: ReadSessionDep,
+    user_id: uuid.UUID,
+    if_none_match: Annotated[str | None, Header()] = None,
+) -> Response:
+    """Retrieve a user by ID.
+
+    The ETag is the version of the user. If it matches `If-None-Match`,
+    `304 Not Modified` is returned without loading the user.
+    """
+    if if_none_match:
+        version = await User.get_version(session, user_id)
+        if version is not None and etag_matches(if_none_match, make_etag(version)):
+            return not_modified(make_etag(version))
+    user = await User.get(session, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
-    return user
+    return UserJSONResponse(user, headers=cache_headers(make_etag(user.version)))
+
+
+@api.post("/users/bulk", response_model=BulkInsertResult)
+async def create_users_bulk(session: SessionDep, request: Request) -> UserJSONResponse:
+    """Create many users from a JSON array or an NDJSON stream.
+
+    Users are inserted in chunks of `USERS_BULK_CHUNK_SIZE`. A chunk that fails is
+    reported in `errors` and does not affect the other chunks.
+    """
+    result = BulkInsertResult()
+    chunk_number = 0
+    async for chunk in read_users(request, USERS_BULK_CHUNK_SIZE):
+        try:
+            await User.save_many(session, chunk)
+        except SQLAlchemyError as e:
+            logger.warning("Failed to insert chunk %d of bulk upload.", chunk_number)
+            result.errors.append(
+                BulkInsertError(
+                    chunk=chunk_number,
+                    count=len(chunk),
+                    detail=str(getattr(e, "orig", None) or e),
+                )
+            )
+        else:
+            result.inserted.extend(user.id for user in chunk)
+        chunk_number += 1
+    response = UserJSONResponse(result)
+    pin_to_primary(response)
+    return response
@@ -0,0 +1,341 @@
+"""Query, pool and request metrics in the Prometheus text format."""
+
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Callable, Iterator
+from typing import Any
+from weakref import WeakValueDictionary
+
+from sqlalchemy import Engine, event
+from sqlalchemy.engine.interfaces import CacheStats
+from sqlalchemy.pool import AsyncAdaptedQueuePool, ConnectionPoolEntry, Pool, QueuePool
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+# Compiled cache lookups are labelled as hits or misses, and statements that are
+# never cached, such as DDL, as uncached:
+CACHE_RESULTS = {CacheStats.CACHE_HIT: "hit", CacheStats.CACHE_MISS: "miss"}
+
+# Statements are labelled by their first keyword, limited to these to bound the
+# number of series:
+OPERATIONS = frozenset(("SELECT", "INSERT", "UPDATE", "DELETE"))
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    """Format label names and values as a Prometheus label set."""
+    if not names:
+        return ""
+    pairs = ",".join(
+        f'{name}="{value}"' for name, value in zip(names, values, strict=True)
+    )
+    return "{" + pairs + "}"
+
+
+REGISTRY: list["Metric"] = []
+
+
+class Metric:
+    """Base class for metrics, registered for exposition on creation."""
+
+    type_name = "untyped"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: tuple[str, ...]
+    ) -> None:
+        """Create and register a metric."""
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def collect(self) -> Iterator[str]:
+        """Yield the header lines of the metric."""
+        yield f"# HELP {self.name} {self.documentation}"
+        yield f"# TYPE {self.name} {self.type_name}"
+
+
+class Counter(Metric):
+    """A monotonically increasing count, per set of label values."""
+
+    type_name = "counter"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: tuple[str, ...] = ()
+    ) -> None:
+        """Create and register a counter."""
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        """Increase the count for the given label values."""
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def collect(self) -> Iterator[str]:
+        """Yield the exposition lines of the counter."""
+        yield from super().collect()
+        with self._lock:
+            values = list(self._values.items())
+        for labelvalues, value in values:
+            yield f"{self.name}{_format_labels(self.labelnames, labelvalues)} {value}"
+
+
+class Gauge(Metric):
+    """A value read when the metrics are collected."""
+
+    type_name = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...],
+        function: Callable[[], dict[tuple[str, ...], float]],
+    ) -> None:
+        """Create and register a gauge reading its values from `function`."""
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def collect(self) -> Iterator[str]:
+        """Yield the exposition lines of the gauge."""
+        yield from super().collect()
+        for labelvalues, value in self.function().items():
+            yield f"{self.name}{_format_labels(self.labelnames, labelvalues)} {value}"
+
+
+class CounterFunction(Gauge):
+    """A monotonically increasing count, read when the metrics are collected."""
+
+    type_name = "counter"
+
+
+class Histogram(Metric):
+    """A distribution of observed values in cumulative buckets."""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        """Create and register a histogram."""
+        super().__init__(name, documentation, labelnames)
+        self.buckets = buckets
+        # Per set of label values: the count in each bucket, the sum and the count.
+        self._values: dict[tuple[str, ...], tuple[list[int], list[float]]] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        """Record an observation for the given label values."""
+        with self._lock:
+            values = self._values.get(labelvalues)
+            if values is None:
+                values = self._values[labelvalues] = ([0] * len(self.buckets), [0.0, 0])
+            counts, total = values
+            # Index of the first bucket whose upper bound is at least the value:
+            i = bisect_left(self.buckets, value)
+            if i < len(counts):
+                counts[i] += 1
+            total[0] += value
+            total[1] += 1
+
+    def collect(self) -> Iterator[str]:
+        """Yield the exposition lines of the histogram."""
+        yield from super().collect()
+        with self._lock:
+            values = [
+                (labelvalues, list(counts), list(total))
+                for labelvalues, (counts, total) in self._values.items()
+            ]
+        bucket_labelnames = (*self.labelnames, "le")
+        for labelvalues, counts, (total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts, strict=True):
+                cumulative += bucket_count
+                labels = _format_labels(bucket_labelnames, (*labelvalues, str(bound)))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(bucket_labelnames, (*labelvalues, "+Inf"))
+            yield f"{self.name}_bucket{labels} {int(count)}"
+            labels = _format_labels(self.labelnames, labelvalues)
+            yield f"{self.name}_sum{labels} {total}"
+            yield f"{self.name}_count{labels} {int(count)}"
+
+
+def render() -> str:
+    """Render all registered metrics in the Prometheus text format."""
+    return "\n".join(line for metric in REGISTRY for line in metric.collect()) + "\n"
+
+
+# Engines are registered by name, and dropped once they are garbage collected:
+_engines: WeakValueDictionary[str, Engine] = WeakValueDictionary()
+
+
+def _pool_gauge(attribute: str) -> Callable[[], dict[tuple[str, ...], float]]:
+    """Read a statistic of the pool of every instrumented engine."""
+
+    def function() -> dict[tuple[str, ...], float]:
+        return {
+            (name,): getattr(engine.pool, attribute)()
+            for name, engine in list(_engines.items())
+            if hasattr(engine.pool, attribute)
+        }
+
+    return function
+
+
+STATEMENT_DURATION = Histogram(
+    "db_statement_duration_seconds",
+    "Time spent executing SQL statements.",
+    ("engine", "operation"),
+)
+STATEMENT_ROWS = Counter(
+    "db_statement_rows_total",
+    "Rows returned or affected by SQL statements, where the driver reports it.",
+    ("engine", "operation"),
+)
+STATEMENT_CACHE = Counter(
+    "db_compiled_cache_total",
+    "SQL statements executed, by whether SQLAlchemy's compiled cache had them.",
+    ("engine", "result"),
+)
+POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds",
+    "Time spent waiting for a connection from the pool.",
+)
+Gauge(
+    "db_pool_size",
+    "Number of connections the pool keeps open.",
+    ("engine",),
+    _pool_gauge("size"),
+)
+Gauge(
+    "db_pool_checked_out",
+    "Number of connections currently checked out of the pool.",
+    ("engine",),
+    _pool_gauge("checkedout"),
+)
+Gauge(
+    "db_pool_overflow",
+    "Number of connections open above the pool size.",
+    ("engine",),
+    _pool_gauge("overflow"),
+)
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds",
+    "Time spent handling HTTP requests, until the response is fully sent.",
+    ("method", "route", "status"),
+)
+
+
+class _TimedCheckout(Pool):
+    """Pool mixin measuring how long a checkout waits for a connection."""
+
+    def _do_get(self) -> ConnectionPoolEntry:
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            POOL_CHECKOUT_WAIT.observe(time.perf_counter() - start)
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    """A `QueuePool` that records checkout wait times."""
+
+
+class TimedAsyncAdaptedQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    """An `AsyncAdaptedQueuePool` that records checkout wait times."""
+
+
+def instrument_engine(engine: Engine, name: str) -> None:
+    """Record statement latencies, row counts and cache hits, and pool gauges.
+
+    For an `AsyncEngine`, pass its `sync_engine`.
+    """
+    _engines[name] = engine
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(
+        conn: Any,  # noqa: ANN401
+        *_: Any,  # noqa: ANN401
+    ) -> None:
+        conn.info["statement_start"] = time.perf_counter()
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context: Any) -> None:  # noqa: ANN401
+        # A statement that fails never ends, so forget when it started:
+        if context.connection is not None:
+            context.connection.info.pop("statement_start", None)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(
+        conn: Any,  # noqa: ANN401
+        cursor: Any,  # noqa: ANN401
+        statement: str,
+        parameters: Any,  # noqa: ANN401, ARG001
+        context: Any,  # noqa: ANN401
+        *_: Any,  # noqa: ANN401
+    ) -> None:
+        elapsed = time.perf_counter() - conn.info.pop("statement_start")
+        keyword = statement.lstrip()[:6].upper()
+        operation = keyword if keyword in OPERATIONS else "OTHER"
+        STATEMENT_DURATION.observe(elapsed, name, operation)
+        cache_hit = getattr(context, "cache_hit", None)
+        STATEMENT_CACHE.inc(name, CACHE_RESULTS.get(cache_hit, "uncached"))
+        rowcount = getattr(cursor, "rowcount", -1)
+        if rowcount > 0:
+            STATEMENT_ROWS.inc(name, operation, amount=rowcount)
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording the latency of each request by route."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        """Wrap an ASGI application."""
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Handle a request, recording how long it took."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            REQUEST_DURATION.observe(
+                time.perf_counter() - start,
+                scope["method"],
+                route.path if route else "unmatched",
+                str(status),
+            )
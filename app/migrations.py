@@ -0,0 +1,249 @@
+"""Helpers for Alembic migrations that keep large tables online.
+
+A plain migration runs in a single transaction, holding its locks for as long
+as it takes. These helpers instead fill tables in chunks committed one by one,
+and build indexes without locking out writes, e.g.::
+
+    from app.migrations import backfill, create_index_concurrently
+
+    user_account = sa.table(
+        "user_account",
+        sa.column("id", sa.Uuid()),
+        sa.column("name", sa.String()),
+        sa.column("name_lower", sa.String()),
+    )
+
+    def upgrade() -> None:
+        op.add_column(
+            "user_account",
+            sa.Column("name_lower", sa.String(30)),
+            if_not_exists=True,
+        )
+        # Commit the new column first, so that its lock is not held meanwhile:
+        with op.get_context().autocommit_block():
+            backfill(
+                op.get_bind().engine,
+                "user_account_name_lower",
+                user_account.c.id,
+                {"name_lower": sa.func.lower(user_account.c.name)},
+                where=user_account.c.name_lower.is_(None),
+            )
+        create_index_concurrently(
+            "ix_user_account_name_lower", "user_account", ["name_lower"]
+        )
+
+Chunks run on a connection of their own, so call them in an `autocommit_block`,
+with the migration's transaction committed. The progress of each is saved as
+its chunks commit, so a migration that failed resumes where it stopped. As the
+`autocommit_block` commits what came before it, that is run again along with
+the rest of the migration, so make it idempotent, e.g. with `if_not_exists`.
+"""
+
+import logging
+import os
+import time
+from collections.abc import Callable, Mapping, Sequence
+from typing import Any
+
+from sqlalchemy import (
+    Column,
+    ColumnClause,
+    ColumnElement,
+    DateTime,
+    Engine,
+    Executable,
+    MetaData,
+    String,
+    Table,
+    TableClause,
+    and_,
+    delete,
+    func,
+    insert,
+    select,
+    text,
+    true,
+    update,
+)
+
+from alembic import op
+
+# Rows changed per chunk, each in a transaction holding their locks until it ends:
+DATABASE_MIGRATION_BATCH_SIZE = int(os.getenv("DATABASE_MIGRATION_BATCH_SIZE", "10000"))
+# Seconds to pause between chunks, to leave the database to other work:
+DATABASE_MIGRATION_PAUSE = float(os.getenv("DATABASE_MIGRATION_PAUSE", "0"))
+# Seconds between progress logs:
+DATABASE_MIGRATION_LOG_INTERVAL = float(
+    os.getenv("DATABASE_MIGRATION_LOG_INTERVAL", "10")
+)
+
+logger = logging.getLogger(__name__)
+
+# The last key done by each unfinished chunked migration, to resume from. Left out
+# of `alembic check`, see `alembic/env.py`:
+PROGRESS = Table(
+    "migration_progress",
+    MetaData(),
+    Column("name", String(255), primary_key=True),
+    Column("last_key", String),
+    Column("updated_at", DateTime(timezone=True), server_default=func.now()),
+)
+
+
+def _resume_after(engine: Engine, name: str, key: ColumnClause[Any]) -> Any:  # noqa: ANN401
+    """Return the last key done by a chunked migration, `None` if there is none."""
+    PROGRESS.create(engine, checkfirst=True)
+    with engine.begin() as connection:
+        progress = connection.execute(
+            select(PROGRESS.c.last_key).where(PROGRESS.c.name == name)
+        ).first()
+        if progress is None:
+            connection.execute(insert(PROGRESS).values(name=name))
+    if progress is None or progress.last_key is None:
+        return None
+    logger.info("Resuming %s after %s", name, progress.last_key)
+    return key.expression.type.python_type(progress.last_key)
+
+
+def run_in_chunks(  # noqa: PLR0913
+    engine: Engine,
+    name: str,
+    key: ColumnClause[Any],
+    statement: Callable[[ColumnElement[bool]], Executable],
+    *,
+    where: ColumnElement[bool] | None = None,
+    batch_size: int | None = None,
+    pause: float | None = None,
+) -> int:
+    """Run a statement over a table in chunks of rows, committing each chunk.
+
+    The rows of the table of `key`, a typed unique column such as the primary
+    key, are split into chunks of `batch_size` in order of `key`, leaving out
+    rows not matching `where`. `statement` is called with the condition selecting a
+    chunk, and returns the statement to run on it. Each chunk is committed
+    together with the progress of the migration `name`, then followed by a
+    pause of `pause` seconds.
+
+    Defaults to `DATABASE_MIGRATION_BATCH_SIZE` and `DATABASE_MIGRATION_PAUSE`.
+    Returns the number of rows the statement reported changing.
+    """
+    batch_size = batch_size or DATABASE_MIGRATION_BATCH_SIZE
+    pause = DATABASE_MIGRATION_PAUSE if pause is None else pause
+    after = _resume_after(engine, name, key)
+    rows = 0
+    start = logged = time.monotonic()
+    with engine.connect() as connection:
+        while True:
+            with connection.begin():
+                conditions = [] if where is None else [where]
+                if after is not None:
+                    conditions.append(key > after)
+                selected = and_(true(), *conditions)
+                # The last key of the chunk, none if the rest of the rows fit in it:
+                last = connection.scalar(
+                    select(key)
+                    .where(selected)
+                    .order_by(key)
+                    .offset(batch_size - 1)
+                    .limit(1)
+                )
+                in_chunk = and_(selected, key <= last) if last is not None else selected
+                rows += max(connection.execute(statement(in_chunk)).rowcount, 0)
+                if last is None:
+                    connection.execute(delete(PROGRESS).where(PROGRESS.c.name == name))
+                    break
+                connection.execute(
+                    update(PROGRESS)
+                    .where(PROGRESS.c.name == name)
+                    .values(last_key=str(last), updated_at=func.now())
+                )
+            after = last
+            if time.monotonic() - logged >= DATABASE_MIGRATION_LOG_INTERVAL:
+                logged = time.monotonic()
+                logger.info(
+                    "%s: %d rows, %.0f rows/s, at %s",
+                    name,
+                    rows,
+                    rows / (logged - start),
+                    last,
+                )
+            time.sleep(pause)
+    logger.info("%s: done, %d rows in %.1f s", name, rows, time.monotonic() - start)
+    return rows
+
+
+def backfill(  # noqa: PLR0913
+    engine: Engine,
+    name: str,
+    key: ColumnClause[Any],
+    values: Mapping[str, Any],
+    *,
+    where: ColumnElement[bool] | None = None,
+    batch_size: int | None = None,
+    pause: float | None = None,
+) -> int:
+    """Set columns of existing rows to `values`, in chunks, see `run_in_chunks`.
+
+    Pass a `where` leaving out the rows already filled, so that rows written
+    meanwhile by an application filling the columns itself are left alone.
+    """
+    table = key.table
+    if not isinstance(table, TableClause):
+        msg = f"The key {key} is not a column of a table."
+        raise TypeError(msg)
+    return run_in_chunks(
+        engine,
+        name,
+        key,
+        lambda in_chunk: update(table).where(in_chunk).values(values),
+        where=where,
+        batch_size=batch_size,
+        pause=pause,
+    )
+
+
+def _drop_invalid_index(name: str) -> None:
+    """Drop an index left invalid by a concurrent build that failed."""
+    bind = op.get_bind()
+    if bind.dialect.name == "postgresql":  # pragma: no cover
+        invalid = bind.scalar(
+            text(
+                "SELECT NOT indisvalid FROM pg_index"
+                " WHERE indexrelid = to_regclass(:name)"
+            ),
+            {"name": name},
+        )
+        if invalid:
+            op.drop_index(name, postgresql_concurrently=True, if_exists=True)
+
+
+def create_index_concurrently(
+    name: str,
+    table: str,
+    columns: Sequence[str],
+    **kwargs: Any,  # noqa: ANN401
+) -> None:
+    """Create an index without locking out writes to its table.
+
+    The index is built outside of the migration's transaction, as PostgreSQL
+    requires. An invalid index left by a build that failed is built again,
+    while a valid one is kept. Other arguments are those of `op.create_index`.
+    """
+    with op.get_context().autocommit_block():
+        _drop_invalid_index(name)
+        op.create_index(
+            name,
+            table,
+            columns,
+            postgresql_concurrently=True,
+            if_not_exists=True,
+            **kwargs,
+        )
+
+
+def drop_index_concurrently(name: str, table: str) -> None:
+    """Drop an index without locking out writes to its table."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            name, table_name=table, postgresql_concurrently=True, if_exists=True
+        )
@@ -1,7 +1,15 @@
 """Model package for user management."""
 
+from .bulk import BulkInsertError, BulkInsertResult
+from .cursor import decode_cursor, encode_cursor
+from .lookup import UserLookupResult
 from .user import User
 
 __all__ = [
+    "BulkInsertError",
+    "BulkInsertResult",
     "User",
+    "UserLookupResult",
+    "decode_cursor",
+    "encode_cursor",
 ]
@@ -0,0 +1,20 @@
+"""Result models for bulk user creation."""
+
+from uuid import UUID
+
+from pydantic import BaseModel, Field
+
+
+class BulkInsertError(BaseModel):
+    """A chunk of users that could not be inserted."""
+
+    chunk: int
+    count: int
+    detail: str
+
+
+class BulkInsertResult(BaseModel):
+    """The outcome of a bulk insert, chunk by chunk."""
+
+    inserted: list[UUID] = Field(default_factory=list)
+    errors: list[BulkInsertError] = Field(default_factory=list)
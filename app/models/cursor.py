@@ -0,0 +1,18 @@
+"""Opaque cursors for keyset pagination."""
+
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from uuid import UUID
+
+
+def encode_cursor(user_id: UUID) -> str:
+    """Encode the key of the last row on a page as an opaque cursor."""
+    return urlsafe_b64encode(user_id.bytes).rstrip(b"=").decode("ascii")
+
+
+def decode_cursor(cursor: str) -> UUID:
+    """Decode a cursor back into the key of the last row on the previous page.
+
+    Raises ValueError if the cursor is malformed.
+    """
+    padded = cursor + "=" * (-len(cursor) % 4)
+    return UUID(bytes=urlsafe_b64decode(padded.encode("ascii")))
@@ -0,0 +1,35 @@
+"""Generation of user IDs."""
+
+import os
+import secrets
+import time
+from uuid import UUID, uuid4
+
+# Version of the UUIDs generated for new users, either "7" (time-ordered) or "4":
+USER_ID_VERSION = os.getenv("USER_ID_VERSION", "7")
+
+
+def uuid7() -> UUID:
+    """Generate a time-ordered UUID, version 7 as specified in RFC 9562.
+
+    The first 48 bits are the Unix time in milliseconds, so IDs generated later
+    sort after earlier ones and new rows are appended to the end of the primary
+    key index instead of being scattered across it.
+    """
+    timestamp_ms = time.time_ns() // 1_000_000
+    random_bits = secrets.randbits(74)
+    value = (
+        (timestamp_ms & 0xFFFF_FFFF_FFFF) << 80
+        | 0x7 << 76  # version
+        | (random_bits >> 62) << 64  # 12 random bits
+        | 0b10 << 62  # variant
+        | random_bits & 0x3FFF_FFFF_FFFF_FFFF  # 62 random bits
+    )
+    return UUID(int=value)
+
+
+def new_user_id() -> UUID:
+    """Generate the ID of a new user, of the configured UUID version."""
+    if USER_ID_VERSION == "4":
+        return uuid4()
+    return uuid7()
@@ -0,0 +1,14 @@
+"""Result model for looking up many users by ID."""
+
+from uuid import UUID
+
+from pydantic import BaseModel
+
+from .user import User
+
+
+class UserLookupResult(BaseModel):
+    """The users found, in request order, and the IDs that were not found."""
+
+    users: list[User]
+    missing: list[UUID]
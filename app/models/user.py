@@ -1,9 +1,15 @@
 """User model for the application."""
 
-from typing import Union
-from uuid import UUID, uuid4
+from collections.abc import AsyncIterator, Sequence
+from typing import TYPE_CHECKING, Union
+from uuid import UUID
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, PrivateAttr
+
+from .ids import new_user_id
+
+if TYPE_CHECKING:
+    from app.repository import UserSession
 
 
 class User(BaseModel):
@@ -11,38 +17,110 @@ class User(BaseModel):
 
     name: str
     fullname: str
-    id: UUID = Field(default_factory=uuid4)
+    id: UUID = Field(default_factory=new_user_id)
+    # The version of the stored user, not part of the API:
+    _version: int = PrivateAttr(default=1)
+
+    @property
+    def version(self) -> int:
+        """The version of the stored user, incremented on every update."""
+        return self._version
+
+    @version.setter
+    def version(self, version: int) -> None:
+        self._version = version
 
-    def save(self) -> None:
+    async def save(self, session: "UserSession") -> None:
         """Simulate saving the user to a database."""
         # lazy import to avoid circular dependencies:
-        from app.repository import Repository  # noqa: PLC0415
+        from app.repository import UserRepository  # noqa: PLC0415
 
-        repository = Repository()
-        repository.create_engine()
-        # Create the repository and initialize the database connection.
-        repository.add_user(self)
+        await UserRepository.add_user(session, self)
 
     @classmethod
-    def list(cls) -> list["User"]:
-        """List all users."""
+    async def save_many(cls, session: "UserSession", users: Sequence["User"]) -> None:
+        """Save many users in one statement.
+
+        Either all of the given users are saved or, if the insert fails, none are.
+        """
         # lazy import to avoid circular dependencies:
-        from app.repository import Repository  # noqa: PLC0415
+        from app.repository import UserRepository  # noqa: PLC0415
+
+        await UserRepository.add_users(session, users)
 
-        repository = Repository()
-        repository.create_engine()
+    @classmethod
+    async def search(  # noqa: PLR0913
+        cls,
+        session: "UserSession",
+        limit: int,
+        after: UUID | None = None,
+        *,
+        name: str | None = None,
+        prefix: str | None = None,
+        q: str | None = None,
+    ) -> list["User"]:
+        """Search up to `limit` users ordered by ID, starting after the given ID."""
+        # lazy import to avoid circular dependencies:
+        from app.repository import UserRepository  # noqa: PLC0415
 
-        return repository.list_users()
+        return await UserRepository.search_users(
+            session, limit, after, name=name, prefix=prefix, q=q
+        )
 
     @classmethod
-    def get(cls, user_id: UUID) -> Union[None, "User"]:
+    async def list(
+        cls, session: "UserSession", limit: int, after: UUID | None = None
+    ) -> list["User"]:
+        """List up to `limit` users ordered by ID, starting after the given ID."""
+        # lazy import to avoid circular dependencies:
+        from app.repository import UserRepository  # noqa: PLC0415
+
+        return await UserRepository.list_users(session, limit, after)
+
+    @classmethod
+    def stream(cls, chunk_size: int) -> AsyncIterator["User"]:
+        """Stream all users ordered by ID, fetching `chunk_size` rows at a time."""
+        # lazy import to avoid circular dependencies:
+        from app.repository import UserRepository  # noqa: PLC0415
+
+        return UserRepository.stream_users(chunk_size)
+
+    @classmethod
+    def scan(cls, chunk_size: int) -> AsyncIterator["User"]:
+        """Stream all users, reading the partitions of the user table in parallel.
+
+        Faster than `stream` on a large table, but the users are not in order.
+        """
+        # lazy import to avoid circular dependencies:
+        from app.repository import UserRepository  # noqa: PLC0415
+
+        return UserRepository.scan_users(chunk_size)
+
+    @classmethod
+    async def get(cls, session: "UserSession", user_id: UUID) -> Union[None, "User"]:
         """Get a user by ID."""
         # lazy import to avoid circular dependencies:
-        from app.repository import Repository  # noqa: PLC0415
+        from app.repository import UserRepository  # noqa: PLC0415
 
-        repository = Repository()
-        repository.create_engine()
-        user = repository.get_user(user_id)
+        user = await UserRepository.get_user(session, user_id)
         if user:
             return user
         return None
+
+    @classmethod
+    async def get_version(cls, session: "UserSession", user_id: UUID) -> int | None:
+        """Get the version of a user by ID, without loading the user."""
+        # lazy import to avoid circular dependencies:
+        from app.repository import UserRepository  # noqa: PLC0415
+
+        return await UserRepository.get_user_version(session, user_id)
+
+    @classmethod
+    async def get_many(
+        cls, session: "UserSession", user_ids: Sequence[UUID]
+    ) -> dict[UUID, "User"]:
+        """Get the users with the given IDs, leaving out IDs that do not exist."""
+        # lazy import to avoid circular dependencies:
+        from app.repository import UserRepository  # noqa: PLC0415
+
+        return await UserRepository.get_users(session, user_ids)
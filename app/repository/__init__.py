@@ -1,5 +1,16 @@
 """Package for managing repositories."""
 
+from .async_repository import AsyncRepository
+from .backends import UserBackend, UserRepository, UserSession
+from .memory import MemoryRepository
 from .repository import Base, Repository
 
-__all__ = ["Base", "Repository"]
+__all__ = [
+    "AsyncRepository",
+    "Base",
+    "MemoryRepository",
+    "Repository",
+    "UserBackend",
+    "UserRepository",
+    "UserSession",
+]
@@ -0,0 +1,509 @@
+"""Asynchronous repository for managing user accounts using SQLAlchemy."""
+
+import asyncio
+import os
+from collections.abc import AsyncGenerator, AsyncIterator, Callable, Sequence
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, cast
+from uuid import UUID
+
+from sqlalchemy import event, select, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    create_async_engine,
+)
+from sqlalchemy.orm import Session
+
+from app.metrics import Gauge, TimedAsyncAdaptedQueuePool, instrument_engine
+from app.models import User
+
+from .cache import user_cache
+from .limiter import ConcurrencyLimiter, create_limiter
+from .replicas import ReplicaSet
+from .repository import (
+    DATABASE_COPY_THRESHOLD,
+    DATABASE_REPLICA_URLS,
+    DATABASE_SCAN_PARALLELISM,
+    DATABASE_STATEMENT_TIMEOUT,
+    DATABASE_URL,
+    GET_USER,
+    GET_USER_VERSION,
+    GET_USERS,
+    INSERT_USERS,
+    LIST_USERS,
+    LIST_USERS_AFTER,
+    USER_COLUMNS,
+    Base,
+    UserDAO,
+    engine_options,
+    row_to_user,
+    search_users_statement,
+    user_partition,
+)
+
+if TYPE_CHECKING:
+    import psycopg
+
+# Increment the version of a user on every update like the PostgreSQL migrations
+# do, but after the update, as SQLite triggers cannot change the row updated:
+SQLITE_VERSION_TRIGGER = text(
+    """
+    CREATE TRIGGER IF NOT EXISTS user_account_increment_version
+    AFTER UPDATE ON user_account WHEN NEW.version = OLD.version BEGIN
+        UPDATE user_account SET version = OLD.version + 1 WHERE id = NEW.id;
+    END
+    """
+)
+
+# The key of the IDs of the users written by a session, in `Session.info`:
+WRITTEN_USERS = "written_users"
+
+
+class AsyncRepository:
+    """Asynchronous repository for managing user accounts.
+
+    Mirrors `Repository`, but runs on an `AsyncEngine` so that database waits do
+    not block a thread. The `postgresql+psycopg` URL selects psycopg's async
+    driver when used with `create_async_engine`.
+
+    Writes go to the primary, `engine`. Reads through `read_session` are spread
+    across the healthy read `replicas`, and fall back to the primary if there are
+    none.
+
+    Connections are handed out through the limiter of their engine, see
+    `get_limiter`, which sheds load rather than letting requests pile up on a
+    saturated connection pool.
+    """
+
+    engine: AsyncEngine
+    replicas = ReplicaSet([])
+    limiter: ConcurrencyLimiter = create_limiter()
+
+    @classmethod
+    def create_engine(cls) -> None:
+        """Create the process-wide engines and their connection pools.
+
+        Called once on application startup, see `app.main.lifespan`.
+        """
+        cls.engine = create_async_engine(
+            DATABASE_URL, poolclass=TimedAsyncAdaptedQueuePool, **engine_options()
+        )
+        instrument_engine(cls.engine.sync_engine, "primary")
+        replicas = [
+            create_async_engine(
+                url, poolclass=TimedAsyncAdaptedQueuePool, **engine_options()
+            )
+            for url in DATABASE_REPLICA_URLS
+        ]
+        for i, replica in enumerate(replicas):
+            instrument_engine(replica.sync_engine, f"replica{i}")
+        # New limiters, as their queues belong to the running event loop:
+        cls.replicas = ReplicaSet(replicas)
+        cls.limiter = create_limiter()
+
+    @classmethod
+    async def dispose_engine(cls) -> None:
+        """Close all pooled connections, called on application shutdown."""
+        await cls.engine.dispose()
+        await cls.replicas.dispose()
+
+    @classmethod
+    async def create_schema(cls) -> None:
+        """Create the tables from the models on SQLite, not managed by Alembic.
+
+        A trigger increments the version of users, see `UserDAO.version`.
+        """
+        async with cls.engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+            await connection.execute(SQLITE_VERSION_TRIGGER)
+
+    @classmethod
+    def reset_after_fork(cls) -> None:
+        """Give a forked child process fresh connection pools.
+
+        See `Repository.reset_after_fork`.
+        """
+        engines = [cls.engine] if hasattr(cls, "engine") else []
+        for engine in [*engines, *cls.replicas.engines]:
+            engine.sync_engine.dispose(close=False)
+
+    @classmethod
+    def get_read_engine(cls, *, primary: bool = False) -> AsyncEngine:
+        """Return the engine to read from: a healthy replica, or else the primary.
+
+        Pass `primary=True` to read from the primary regardless, e.g. to see a write
+        that may not have reached the replicas yet.
+        """
+        replica = None if primary else cls.replicas.choose()
+        return replica or cls.engine
+
+    @classmethod
+    def get_limiter(cls, engine: AsyncEngine) -> ConcurrencyLimiter:
+        """Return the limiter of an engine, the primary's `limiter` or a replica's.
+
+        Every engine has a pool of its own, sized by `pool_limits`, and so a
+        limiter of its own: a saturated replica does not hold back reads from
+        the others, nor writes.
+        """
+        if engine is cls.engine:
+            return cls.limiter
+        return cls.replicas.limiters[engine]
+
+    @classmethod
+    async def get_session(cls) -> AsyncGenerator[AsyncSession]:
+        """Yield one session per request.
+
+        The session runs in a single transaction that is committed when the request
+        succeeds and rolled back if it raises. Its connection is always returned to
+        the pool afterwards.
+        """
+        async with cls._session(cls.engine) as session:
+            yield session
+
+    @classmethod
+    @asynccontextmanager
+    async def read_session(
+        cls, *, primary: bool = False
+    ) -> AsyncGenerator[AsyncSession]:
+        """Open a session for reads, see `get_read_engine` and `get_session`."""
+        async with cls._session(cls.get_read_engine(primary=primary)) as session:
+            yield session
+
+    @classmethod
+    @asynccontextmanager
+    async def _session(cls, engine: AsyncEngine) -> AsyncGenerator[AsyncSession]:
+        """Open a session in a transaction, once the engine's limiter lets it through.
+
+        Raises `OverloadedError` if the database is saturated.
+        """
+        async with (
+            cls.get_limiter(engine).acquire(),
+            AsyncSession(engine) as session,
+            session.begin(),
+        ):
+            if (
+                DATABASE_STATEMENT_TIMEOUT > 0 and engine.dialect.name == "postgresql"
+            ):  # pragma: no cover
+                # Local to the transaction, so it ends with the request:
+                await session.execute(
+                    text("SELECT set_config('statement_timeout', :timeout, true)"),
+                    {"timeout": f"{DATABASE_STATEMENT_TIMEOUT * 1000:.0f}ms"},
+                )
+            yield session
+
+    @classmethod
+    @asynccontextmanager
+    async def transaction(cls) -> AsyncGenerator[AsyncSession]:
+        """Open a session on the primary for work in the background.
+
+        Unlike `get_session`, it does not go through the limiter, so background
+        work that requests wait for cannot be starved by those requests.
+        """
+        async with AsyncSession(cls.engine) as session, session.begin():
+            yield session
+
+    @classmethod
+    def _on_primary(cls, session: AsyncSession) -> bool:
+        """Return whether a session reads from the primary, not a replica."""
+        return session.bind is cls.engine
+
+    @classmethod
+    async def ping(cls) -> None:
+        """Check that the database is reachable with a single `SELECT 1`."""
+        async with cls.engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+    @classmethod
+    async def get_current_revision(cls) -> str | None:  # pragma: no cover
+        """Get the current database schema revision."""
+        # lazy import, as Alembic is slow to import and only needed here:
+        from alembic.migration import MigrationContext  # noqa: PLC0415
+
+        async with cls.engine.connect() as connection:
+            return await connection.run_sync(
+                lambda conn: MigrationContext.configure(conn).get_current_revision()
+            )
+
+    @classmethod
+    async def add_user(cls, session: AsyncSession, user: User) -> None:
+        """Add a new user to the repository."""
+        await session.execute(
+            INSERT_USERS, {"id": user.id, "name": user.name, "fullname": user.fullname}
+        )
+        session.info.setdefault(WRITTEN_USERS, set()).add(user.id)
+
+    @classmethod
+    async def add_users(cls, session: AsyncSession, users: Sequence[User]) -> None:
+        """Add many users to the repository in one round-trip.
+
+        See `Repository.add_users`.
+        """
+        async with session.begin_nested():
+            connection = await session.connection()
+            if (
+                connection.dialect.name == "postgresql"
+                and len(users) >= DATABASE_COPY_THRESHOLD
+            ):  # pragma: no cover
+                raw_connection = await connection.get_raw_connection()
+                # Set while the connection is checked out, and from psycopg here:
+                driver_connection = raw_connection.driver_connection
+                await cls._copy_users(
+                    cast("psycopg.AsyncConnection", driver_connection), users
+                )
+            else:
+                await session.execute(
+                    INSERT_USERS,
+                    [
+                        {"id": user.id, "name": user.name, "fullname": user.fullname}
+                        for user in users
+                    ],
+                )
+        session.info.setdefault(WRITTEN_USERS, set()).update(user.id for user in users)
+
+    @staticmethod
+    async def _copy_users(
+        connection: "psycopg.AsyncConnection", users: Sequence[User]
+    ) -> None:  # pragma: no cover
+        """Load users with PostgreSQL `COPY`, the fastest bulk load path."""
+        # lazy import, as psycopg is only needed once connected to PostgreSQL:
+        import psycopg  # noqa: PLC0415
+
+        statement = "COPY user_account (id, name, fullname) FROM STDIN"
+        try:
+            async with connection.cursor() as cursor, cursor.copy(statement) as copy:
+                for user in users:
+                    await copy.write_row((user.id, user.name, user.fullname))
+        except psycopg.Error as e:
+            raise DBAPIError(statement, None, e) from e
+
+    @classmethod
+    async def get_user(cls, session: AsyncSession, user_id: UUID) -> User | None:
+        """Retrieve a user by ID, reading through the user cache.
+
+        A user missing from a replica may only not have been replicated yet, so
+        it is cached as missing only if read from the primary.
+        """
+        cached, user = user_cache.get(user_id)
+        if cached:
+            return user
+        result = await session.execute(GET_USER, {"user_id": user_id})
+        row = result.first()
+        user = row_to_user(row) if row else None
+        if user is not None or cls._on_primary(session):
+            user_cache.set(user_id, user)
+        return user
+
+    @classmethod
+    async def get_user_version(cls, session: AsyncSession, user_id: UUID) -> int | None:
+        """Retrieve the version of a user by ID, reading through the user cache.
+
+        Returns `None` if there is no user with this ID.
+        """
+        cached, user = user_cache.get(user_id)
+        if cached:
+            return user.version if user else None
+        return await session.scalar(GET_USER_VERSION, {"user_id": user_id})
+
+    @classmethod
+    async def get_users(
+        cls, session: AsyncSession, user_ids: Sequence[UUID]
+    ) -> dict[UUID, User]:
+        """Retrieve many users by ID in one query, reading through the user cache.
+
+        Returns the users found by ID; IDs without a user are left out. Like
+        `get_user`, IDs are cached as missing only if read from the primary.
+        """
+        users: dict[UUID, User] = {}
+        uncached: set[UUID] = set()
+        for user_id in user_ids:
+            cached, user = user_cache.get(user_id)
+            if not cached:
+                uncached.add(user_id)
+            elif user is not None:
+                users[user_id] = user
+        if uncached:
+            result = await session.execute(GET_USERS, {"user_ids": list(uncached)})
+            for row in result:
+                users[row.id] = row_to_user(row)
+            on_primary = cls._on_primary(session)
+            for user_id in uncached:
+                if user_id in users or on_primary:
+                    user_cache.set(user_id, users.get(user_id))
+        return users
+
+    @classmethod
+    async def list_users(
+        cls, session: AsyncSession, limit: int, after: UUID | None = None
+    ) -> list[User]:
+        """List one page of users, using keyset pagination on the primary key."""
+        if after is None:
+            result = await session.execute(LIST_USERS, {"limit": limit})
+        else:
+            result = await session.execute(
+                LIST_USERS_AFTER, {"limit": limit, "after": after}
+            )
+        return [row_to_user(row) for row in result]
+
+    @classmethod
+    async def search_users(  # noqa: PLR0913
+        cls,
+        session: AsyncSession,
+        limit: int,
+        after: UUID | None = None,
+        *,
+        name: str | None = None,
+        prefix: str | None = None,
+        q: str | None = None,
+    ) -> list[User]:
+        """Search one page of users, using keyset pagination on the primary key.
+
+        Users match if their name equals `name`, their name starts with `prefix`
+        and their fullname contains `q` regardless of case; filters left out are
+        not applied. See `search_users_statement`.
+        """
+        statement = search_users_statement(limit, after, name=name, prefix=prefix, q=q)
+        return [row_to_user(row) for row in await session.execute(statement)]
+
+    @classmethod
+    async def stream_users(cls, chunk_size: int) -> AsyncIterator[User]:
+        """Stream all users ordered by ID through a server-side cursor.
+
+        See `Repository.stream_users`.
+        """
+        statement = select(*USER_COLUMNS).order_by(UserDAO.id)
+        engine = cls.get_read_engine()
+        async with cls.get_limiter(engine).acquire(), engine.connect() as connection:
+            result = await connection.stream(
+                statement, execution_options={"yield_per": chunk_size}
+            )
+            async for row in result:
+                yield row_to_user(row)
+
+    @classmethod
+    async def get_user_partitions(cls) -> list[str]:
+        """List the tables holding the users: the partitions of the user table.
+
+        A table that is not partitioned, e.g. on SQLite, is its only partition.
+        See the `partition_user_account` migration.
+        """
+        engine = cls.get_read_engine()
+        async with cls.get_limiter(engine).acquire(), engine.connect() as connection:
+            if connection.dialect.name == "postgresql":  # pragma: no cover
+                result = await connection.execute(
+                    text(
+                        "SELECT inhrelid::regclass::text FROM pg_inherits"
+                        " WHERE inhparent = CAST(:table AS regclass) ORDER BY 1"
+                    ),
+                    {"table": UserDAO.__tablename__},
+                )
+                if partitions := list(result.scalars()):
+                    return partitions
+        return [UserDAO.__tablename__]
+
+    @classmethod
+    async def scan_users(cls, chunk_size: int) -> AsyncGenerator[User]:
+        """Stream all users, scanning the partitions of the user table in parallel.
+
+        Up to `DATABASE_SCAN_PARALLELISM` partitions are read at once, each through
+        a server-side cursor on a connection of its own, so a full scan is spread
+        over as many database backends. Each connection goes through the
+        engine's limiter, like a request's session. Users are ordered by ID
+        within a partition, but not across partitions. Memory use is bounded by
+        one chunk of `chunk_size` rows per partition being read.
+        """
+        partitions = await cls.get_user_partitions()
+        engine = cls.get_read_engine()
+        limiter = cls.get_limiter(engine)
+        connections = asyncio.Semaphore(DATABASE_SCAN_PARALLELISM)
+        # Bounds the chunks read ahead of the consumer:
+        read_ahead = asyncio.Semaphore(DATABASE_SCAN_PARALLELISM)
+        # Chunks read, then `None` once all partitions are read or a scan failed:
+        chunks: asyncio.Queue[list[User] | None] = asyncio.Queue()
+
+        async def scan(partition: str) -> None:
+            table = user_partition(partition)
+            statement = select(*table.columns).order_by(table.c.id)
+            async with connections, limiter.acquire(), engine.connect() as connection:
+                result = await connection.stream(
+                    statement, execution_options={"yield_per": chunk_size}
+                )
+                async for rows in result.partitions():
+                    await read_ahead.acquire()
+                    chunks.put_nowait([row_to_user(row) for row in rows])
+
+        async def scan_all() -> None:
+            try:
+                # Cancels the other scans as soon as one fails:
+                async with asyncio.TaskGroup() as group:
+                    for partition in partitions:
+                        group.create_task(scan(partition))
+            except ExceptionGroup as e:
+                raise e.exceptions[0] from None
+            finally:
+                chunks.put_nowait(None)
+
+        producer = asyncio.create_task(scan_all())
+        try:
+            while (chunk := await chunks.get()) is not None:
+                read_ahead.release()
+                for user in chunk:
+                    yield user
+        finally:
+            # Also when the consumer stops early, to return the connections:
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+        # Raise the error of a failed scan, rather than end the stream early:
+        producer.result()
+
+
+# See `Repository.reset_after_fork`:
+os.register_at_fork(after_in_child=AsyncRepository.reset_after_fork)
+
+
+@event.listens_for(Session, "after_commit")
+def invalidate_written_users(session: Session) -> None:
+    """Drop the users written by a session from the user cache, once committed.
+
+    Not before, or a read in the meantime would cache them as missing again.
+    """
+    # Also called when a savepoint is released, before anything is committed:
+    if not session.in_nested_transaction():
+        for user_id in session.info.pop(WRITTEN_USERS, ()):
+            user_cache.invalidate(user_id)
+
+
+def _limiter_gauge(attribute: str) -> Callable[[], dict[tuple[str, ...], float]]:
+    """Read a statistic of the limiter of every engine, named like its metrics."""
+
+    def function() -> dict[tuple[str, ...], float]:
+        limiters = {"primary": AsyncRepository.limiter} | {
+            f"replica{i}": AsyncRepository.replicas.limiters[engine]
+            for i, engine in enumerate(AsyncRepository.replicas.engines)
+        }
+        return {
+            (name,): getattr(limiter, attribute) for name, limiter in limiters.items()
+        }
+
+    return function
+
+
+Gauge(
+    "db_replicas_healthy",
+    "Number of read replicas in rotation.",
+    (),
+    lambda: {(): len(AsyncRepository.replicas.healthy)},
+)
+Gauge(
+    "db_queue_depth",
+    "Number of requests waiting for a database connection.",
+    ("engine",),
+    _limiter_gauge("waiting"),
+)
+Gauge(
+    "db_sessions_active",
+    "Number of database connections in use by requests.",
+    ("engine",),
+    _limiter_gauge("active"),
+)
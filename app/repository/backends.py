@@ -0,0 +1,135 @@
+"""The repository used by the application, chosen with `DATABASE_BACKEND`.
+
+- `postgresql`, the default: `AsyncRepository` on PostgreSQL, with the schema
+  managed by Alembic.
+- `sqlite`: `AsyncRepository` on SQLite, in the file `DATABASE_SQLITE_PATH` or in
+  memory, with the schema created from the models on startup. Needs `aiosqlite`.
+- `memory`: `MemoryRepository`, keeping users in a dict, without any database.
+
+The SQLite and in-memory backends run the application in-process without outside
+services, e.g. to benchmark and profile it, see `benchmarks.in_process`.
+"""
+
+from collections.abc import AsyncGenerator, AsyncIterator, Sequence
+from contextlib import AbstractAsyncContextManager
+from typing import Any, Protocol
+from uuid import UUID
+
+from app.models import User
+
+from .async_repository import AsyncRepository
+from .memory import MemoryRepository
+from .replicas import ReplicaSet
+from .repository import DATABASE_BACKEND
+
+BACKENDS = ("postgresql", "sqlite", "memory")
+
+if DATABASE_BACKEND not in BACKENDS:  # pragma: no cover
+    msg = f"DATABASE_BACKEND must be one of {', '.join(BACKENDS)}."
+    raise ValueError(msg)
+
+
+class UserSession(Protocol):
+    """A session of the repository in use, only ever passed back to it.
+
+    An `AsyncSession` on `AsyncRepository`, a `MemorySession` on
+    `MemoryRepository`.
+    """
+
+
+class UserBackend[S](Protocol):
+    """The interface shared by `AsyncRepository` and `MemoryRepository`.
+
+    Both implement it with classmethods, on the class itself, each taking the
+    sessions of type `S` that it hands out.
+    """
+
+    @property
+    def replicas(self) -> ReplicaSet:
+        """The read replicas, see `AsyncRepository.get_read_engine`."""
+        ...
+
+    def create_engine(self) -> None:
+        """Set up the repository, called once on application startup."""
+        ...
+
+    async def dispose_engine(self) -> None:
+        """Release the repository, called on application shutdown."""
+        ...
+
+    async def create_schema(self) -> None:
+        """Create the tables that are not managed by Alembic."""
+        ...
+
+    def transaction(self) -> AbstractAsyncContextManager[S]:
+        """Open a session for work in the background, committed unless it raises."""
+        ...
+
+    def get_session(self) -> AsyncGenerator[S]:
+        """Yield one session per request, committed unless the request raises."""
+        ...
+
+    def read_session(self, *, primary: bool = False) -> AbstractAsyncContextManager[S]:
+        """Open a session for reads, from the primary if `primary` is set."""
+        ...
+
+    async def ping(self) -> None:
+        """Check that the users are reachable."""
+        ...
+
+    async def get_current_revision(self) -> str | None:
+        """Return the Alembic revision of the schema, if it is managed by Alembic."""
+        ...
+
+    async def add_user(self, session: S, user: User) -> None:
+        """Add a new user."""
+        ...
+
+    async def add_users(self, session: S, users: Sequence[User]) -> None:
+        """Add many users, either all of them or none."""
+        ...
+
+    async def get_user(self, session: S, user_id: UUID) -> User | None:
+        """Retrieve a user by ID."""
+        ...
+
+    async def get_user_version(self, session: S, user_id: UUID) -> int | None:
+        """Retrieve the version of a user by ID."""
+        ...
+
+    async def get_users(self, session: S, user_ids: Sequence[UUID]) -> dict[UUID, User]:
+        """Retrieve many users by ID, leaving out IDs that do not exist."""
+        ...
+
+    async def list_users(
+        self, session: S, limit: int, after: UUID | None = None
+    ) -> list[User]:
+        """List up to `limit` users ordered by ID, starting after the given ID."""
+        ...
+
+    async def search_users(  # noqa: PLR0913
+        self,
+        session: S,
+        limit: int,
+        after: UUID | None = None,
+        *,
+        name: str | None = None,
+        prefix: str | None = None,
+        q: str | None = None,
+    ) -> list[User]:
+        """Search up to `limit` users ordered by ID, starting after the given ID."""
+        ...
+
+    def stream_users(self, chunk_size: int) -> AsyncIterator[User]:
+        """Stream all users ordered by ID."""
+        ...
+
+    def scan_users(self, chunk_size: int) -> AsyncIterator[User]:
+        """Stream all users, not necessarily in order."""
+        ...
+
+
+# The session type differs between the backends, so callers get `UserSession`:
+UserRepository: UserBackend[Any] = (
+    MemoryRepository if DATABASE_BACKEND == "memory" else AsyncRepository
+)
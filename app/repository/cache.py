@@ -0,0 +1,112 @@
+"""In-process read-through cache for users looked up by ID."""
+
+import os
+import time
+from collections import OrderedDict
+from uuid import UUID
+
+from app.metrics import CounterFunction, Gauge
+from app.models import User
+
+USER_CACHE_ENABLED = os.getenv("USER_CACHE_ENABLED", "true").lower() == "true"
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "60"))
+USER_CACHE_NEGATIVE_TTL = float(os.getenv("USER_CACHE_NEGATIVE_TTL", "5"))
+
+
+class UserCache:
+    """A bounded LRU cache of users by ID, with a TTL per entry.
+
+    Misses are cached as well, as `None` with a shorter TTL, so repeated lookups
+    of a missing user do not go to the database every time.
+    """
+
+    def __init__(
+        self, maxsize: int, ttl: float, negative_ttl: float, *, enabled: bool = True
+    ) -> None:
+        """Create an empty cache holding at most `maxsize` entries."""
+        self.enabled = enabled
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: OrderedDict[UUID, tuple[float, User | None]] = OrderedDict()
+
+    def get(self, user_id: UUID) -> tuple[bool, User | None]:
+        """Look up a user, returning whether it was cached and the cached value."""
+        if not self.enabled:
+            return False, None
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] < time.monotonic():
+            self._entries.pop(user_id, None)
+            self.misses += 1
+            return False, None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return True, entry[1]
+
+    def set(self, user_id: UUID, user: User | None) -> None:
+        """Cache a user, or `None` if there is no user with this ID."""
+        if not self.enabled:
+            return
+        ttl = self.ttl if user is not None else self.negative_ttl
+        self._entries[user_id] = (time.monotonic() + ttl, user)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, user_id: UUID) -> None:
+        """Drop a user from the cache, e.g. after it has been written."""
+        self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        """Drop all users from the cache and reset the counters."""
+        self._entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        """Return the size of the cache and its hit, miss and eviction counters."""
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+user_cache = UserCache(
+    USER_CACHE_SIZE,
+    USER_CACHE_TTL,
+    USER_CACHE_NEGATIVE_TTL,
+    enabled=USER_CACHE_ENABLED,
+)
+
+Gauge(
+    "user_cache_size",
+    "Number of entries in the user cache.",
+    (),
+    lambda: {(): len(user_cache._entries)},  # noqa: SLF001
+)
+CounterFunction(
+    "user_cache_hits_total",
+    "Lookups served from the user cache.",
+    (),
+    lambda: {(): user_cache.hits},
+)
+CounterFunction(
+    "user_cache_misses_total",
+    "Lookups that missed the user cache.",
+    (),
+    lambda: {(): user_cache.misses},
+)
+CounterFunction(
+    "user_cache_evictions_total",
+    "Users evicted from the full user cache.",
+    (),
+    lambda: {(): user_cache.evictions},
+)
@@ -0,0 +1,82 @@
+"""Load shedding in front of the connection pool, with a bounded wait queue."""
+
+import asyncio
+import os
+import time
+from collections.abc import AsyncGenerator
+from contextlib import asynccontextmanager
+
+from app.metrics import Counter, Histogram
+
+from .repository import pool_limits
+
+# Requests allowed to wait for a session when all are in use, 0 to reject at once:
+DATABASE_QUEUE_SIZE = int(os.getenv("DATABASE_QUEUE_SIZE", "50"))
+# Seconds a request may wait for a session before being rejected:
+DATABASE_QUEUE_TIMEOUT = float(os.getenv("DATABASE_QUEUE_TIMEOUT", "5"))
+
+QUEUE_WAIT = Histogram(
+    "db_queue_wait_seconds",
+    "Time requests spent queued for a database session.",
+)
+REJECTED = Counter(
+    "db_requests_rejected_total",
+    "Requests rejected because the database was saturated, by reason.",
+    ("reason",),
+)
+
+
+class OverloadedError(Exception):
+    """Raised when a request cannot get a database session in time."""
+
+
+class ConcurrencyLimiter:
+    """Limit the sessions in use to the capacity of the connection pool.
+
+    Requests beyond `capacity` wait in a queue of at most `queue_size`, for at
+    most `timeout` seconds each. A request finding the queue full, or waiting
+    too long, is rejected with `OverloadedError` rather than piling up on the
+    pool.
+    """
+
+    def __init__(self, capacity: int, queue_size: int, timeout: float) -> None:
+        """Create a limiter, with all of its capacity free."""
+        self.capacity = capacity
+        self.queue_size = queue_size
+        self.timeout = timeout
+        self.active = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(capacity)
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncGenerator[None]:
+        """Hold one unit of capacity, waiting for it in the queue if needed."""
+        if self._semaphore.locked() and self.waiting >= self.queue_size:
+            REJECTED.inc("queue_full")
+            msg = "The database queue is full."
+            raise OverloadedError(msg)
+        self.waiting += 1
+        start = time.perf_counter()
+        try:
+            async with asyncio.timeout(self.timeout):
+                await self._semaphore.acquire()
+        except TimeoutError as e:
+            REJECTED.inc("timeout")
+            msg = "Timed out waiting for a database session."
+            raise OverloadedError(msg) from e
+        finally:
+            self.waiting -= 1
+            QUEUE_WAIT.observe(time.perf_counter() - start)
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+
+def create_limiter() -> ConcurrencyLimiter:
+    """Create a limiter following the capacity of the configured pool."""
+    return ConcurrencyLimiter(
+        sum(pool_limits()), DATABASE_QUEUE_SIZE, DATABASE_QUEUE_TIMEOUT
+    )
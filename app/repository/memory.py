@@ -0,0 +1,203 @@
+"""In-process repository keeping users in a dict, without any database."""
+
+import asyncio
+import bisect
+from collections.abc import AsyncGenerator, AsyncIterator, Sequence
+from contextlib import asynccontextmanager
+from uuid import UUID
+
+from sqlalchemy.exc import IntegrityError
+
+from app.models import User
+
+from .replicas import ReplicaSet
+
+
+class MemorySession:
+    """The writes of one transaction on `MemoryRepository`, applied on commit."""
+
+    def __init__(self) -> None:
+        """Start a transaction without any writes."""
+        self.added: dict[UUID, User] = {}
+
+
+def _duplicate(user_id: UUID) -> IntegrityError:
+    """Return the error of a database rejecting a duplicate user ID."""
+    return IntegrityError(
+        "INSERT INTO user_account", None, ValueError(f"Duplicate user ID {user_id}")
+    )
+
+
+class MemoryRepository:
+    """Repository keeping users in a dict, ordered by a sorted list of their IDs.
+
+    Mirrors `AsyncRepository` without any database, to measure and profile the
+    application's own code. Writes are applied when their transaction commits,
+    and conflicts are raised as the same `IntegrityError` as with a database.
+    Every worker process has its own users, lost when it stops.
+    """
+
+    users: dict[UUID, User] = {}  # noqa: RUF012
+    ids: list[UUID] = []  # noqa: RUF012
+    replicas = ReplicaSet([])
+
+    @classmethod
+    def create_engine(cls) -> None:
+        """Start with no users, called once on application startup."""
+        cls.users = {}
+        cls.ids = []
+
+    @classmethod
+    async def dispose_engine(cls) -> None:
+        """Do nothing, as there is no connection to close."""
+
+    @classmethod
+    async def create_schema(cls) -> None:
+        """Do nothing, as there are no tables to create."""
+
+    @classmethod
+    @asynccontextmanager
+    async def transaction(cls) -> AsyncGenerator[MemorySession]:
+        """Open a session, committed unless the block raises."""
+        session = MemorySession()
+        yield session
+        conflicts = session.added.keys() & cls.users.keys()
+        if conflicts:
+            raise _duplicate(min(conflicts))
+        for user_id, user in session.added.items():
+            cls.users[user_id] = user
+            bisect.insort(cls.ids, user_id)
+
+    @classmethod
+    async def get_session(cls) -> AsyncGenerator[MemorySession]:
+        """Yield one session per request, see `AsyncRepository.get_session`."""
+        async with cls.transaction() as session:
+            yield session
+
+    @classmethod
+    @asynccontextmanager
+    async def read_session(
+        cls,
+        *,
+        primary: bool = False,  # noqa: ARG003
+    ) -> AsyncGenerator[MemorySession]:
+        """Open a session for reads, see `AsyncRepository.read_session`."""
+        async with cls.transaction() as session:
+            yield session
+
+    @classmethod
+    async def ping(cls) -> None:
+        """Do nothing, as the users are always reachable."""
+
+    @classmethod
+    async def get_current_revision(cls) -> str | None:
+        """Return no revision, as there is no schema to migrate."""
+        return None
+
+    @classmethod
+    async def add_user(cls, session: MemorySession, user: User) -> None:
+        """Add a new user when the session commits."""
+        session.added[user.id] = user
+
+    @classmethod
+    async def add_users(cls, session: MemorySession, users: Sequence[User]) -> None:
+        """Add many users when the session commits.
+
+        Either all of the given users are added or, if one of their IDs is taken,
+        none are.
+        """
+        added: dict[UUID, User] = {}
+        for user in users:
+            if user.id in added or user.id in session.added or user.id in cls.users:
+                raise _duplicate(user.id)
+            added[user.id] = user
+        session.added.update(added)
+
+    @classmethod
+    async def get_user(
+        cls,
+        session: MemorySession,  # noqa: ARG003
+        user_id: UUID,
+    ) -> User | None:
+        """Retrieve a user by ID."""
+        return cls.users.get(user_id)
+
+    @classmethod
+    async def get_user_version(
+        cls,
+        session: MemorySession,  # noqa: ARG003
+        user_id: UUID,
+    ) -> int | None:
+        """Retrieve the version of a user by ID, `None` if there is no such user."""
+        user = cls.users.get(user_id)
+        return user.version if user else None
+
+    @classmethod
+    async def get_users(
+        cls,
+        session: MemorySession,  # noqa: ARG003
+        user_ids: Sequence[UUID],
+    ) -> dict[UUID, User]:
+        """Retrieve many users by ID, leaving out IDs without a user."""
+        return {
+            user_id: cls.users[user_id] for user_id in user_ids if user_id in cls.users
+        }
+
+    @classmethod
+    async def list_users(
+        cls,
+        session: MemorySession,  # noqa: ARG003
+        limit: int,
+        after: UUID | None = None,
+    ) -> list[User]:
+        """List one page of users ordered by ID, starting after the given ID."""
+        start = bisect.bisect_right(cls.ids, after) if after is not None else 0
+        return [cls.users[user_id] for user_id in cls.ids[start : start + limit]]
+
+    @classmethod
+    async def search_users(  # noqa: PLR0913
+        cls,
+        session: MemorySession,  # noqa: ARG003
+        limit: int,
+        after: UUID | None = None,
+        *,
+        name: str | None = None,
+        prefix: str | None = None,
+        q: str | None = None,
+    ) -> list[User]:
+        """Search one page of users, see `AsyncRepository.search_users`.
+
+        Scans the users in order of ID, like a database without indexes.
+        """
+        start = bisect.bisect_right(cls.ids, after) if after is not None else 0
+        q = q.lower() if q is not None else None
+        found: list[User] = []
+        for user_id in cls.ids[start:]:
+            user = cls.users[user_id]
+            if (
+                (name is None or user.name == name)
+                and (prefix is None or user.name.startswith(prefix))
+                and (q is None or q in user.fullname.lower())
+            ):
+                found.append(user)
+                if len(found) == limit:
+                    break
+        return found
+
+    @classmethod
+    async def stream_users(cls, chunk_size: int) -> AsyncIterator[User]:
+        """Stream all users ordered by ID, as of when the stream started."""
+        ids = list(cls.ids)
+        for start in range(0, len(ids), chunk_size):
+            for user_id in ids[start : start + chunk_size]:
+                yield cls.users[user_id]
+            # Let other requests run between chunks, like a database fetch would:
+            await asyncio.sleep(0)
+
+    @classmethod
+    def scan_users(cls, chunk_size: int) -> AsyncIterator[User]:
+        """Stream all users, see `AsyncRepository.scan_users`.
+
+        There is a single partition, so this is `stream_users`.
+        """
+        return cls.stream_users(chunk_size)
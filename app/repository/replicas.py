@@ -0,0 +1,83 @@
+"""Health-checked read replicas, used round-robin for reads."""
+
+import asyncio
+import itertools
+import logging
+import os
+from collections.abc import Sequence
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from .limiter import ConcurrencyLimiter, create_limiter
+
+DATABASE_REPLICA_CHECK_INTERVAL = float(
+    os.getenv("DATABASE_REPLICA_CHECK_INTERVAL", "5")
+)
+DATABASE_REPLICA_CHECK_TIMEOUT = float(os.getenv("DATABASE_REPLICA_CHECK_TIMEOUT", "2"))
+
+logger = logging.getLogger(__name__)
+
+
+class ReplicaSet:
+    """A set of read replicas, each with its own engine, connection pool and limiter.
+
+    Replicas are handed out round-robin. A replica failing its health check is
+    taken out of rotation until it passes again.
+    """
+
+    def __init__(self, engines: Sequence[AsyncEngine]) -> None:
+        """Create a replica set, assuming all replicas are healthy to begin with."""
+        self.engines = list(engines)
+        self.healthy = list(engines)
+        self.limiters: dict[AsyncEngine, ConcurrencyLimiter] = {
+            engine: create_limiter() for engine in engines
+        }
+        self._counter = itertools.count()
+
+    def choose(self) -> AsyncEngine | None:
+        """Return the next healthy replica, or `None` if there is none."""
+        healthy = self.healthy
+        if not healthy:
+            return None
+        return healthy[next(self._counter) % len(healthy)]
+
+    async def check(self) -> None:
+        """Ping all replicas concurrently and update the ones in rotation."""
+        results = await asyncio.gather(*(_ping(engine) for engine in self.engines))
+        healthy = [
+            engine for engine, ok in zip(self.engines, results, strict=True) if ok
+        ]
+        for engine in self.engines:
+            if engine in self.healthy and engine not in healthy:
+                logger.warning("Taking replica %s out of rotation.", engine.url)
+            elif engine not in self.healthy and engine in healthy:
+                logger.info("Putting replica %s back in rotation.", engine.url)
+        self.healthy = healthy
+
+    async def monitor(self, interval: float = DATABASE_REPLICA_CHECK_INTERVAL) -> None:
+        """Check the replicas every `interval` seconds, until cancelled."""
+        if not self.engines:
+            return
+        while True:
+            await self.check()
+            await asyncio.sleep(interval)
+
+    async def dispose(self) -> None:
+        """Close all pooled connections to the replicas."""
+        for engine in self.engines:
+            await engine.dispose()
+
+
+async def _ping(engine: AsyncEngine) -> bool:
+    """Check that a replica answers a `SELECT 1` in time."""
+    try:
+        async with (
+            asyncio.timeout(DATABASE_REPLICA_CHECK_TIMEOUT),
+            engine.connect() as connection,
+        ):
+            await connection.execute(text("SELECT 1"))
+    except (SQLAlchemyError, OSError, TimeoutError):
+        return False
+    return True
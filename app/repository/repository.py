@@ -2,39 +2,228 @@
 
 import logging
 import os
+from collections.abc import Generator, Iterator, Sequence
+from typing import TYPE_CHECKING, Any, cast
 from uuid import UUID
 
-from sqlalchemy import Engine, String, create_engine
+from sqlalchemy import (
+    Engine,
+    Index,
+    Row,
+    Select,
+    String,
+    TableClause,
+    bindparam,
+    column,
+    create_engine,
+    insert,
+    select,
+    table,
+)
+from sqlalchemy.exc import DBAPIError
 from sqlalchemy.orm import DeclarativeBase, Mapped, Session, mapped_column
 
-from alembic.command import check
-from alembic.config import Config
-from alembic.migration import MigrationContext
-from alembic.script import ScriptDirectory
-from alembic.util.exc import CommandError
+from app.metrics import TimedQueuePool, instrument_engine
 from app.models import User
 
+if TYPE_CHECKING:
+    import psycopg
+
 DATABASE_HOST = os.getenv("DATABASE_HOST")
 DATABASE_PORT = int(os.getenv("DATABASE_PORT", "5432"))
 DATABASE_NAME = os.getenv("DATABASE_NAME")
 DATABASE_USER = os.getenv("DATABASE_USER")
 DATABASE_PASSWORD = os.getenv("DATABASE_PASSWORD")
-DATABASE_URL = f"postgresql+psycopg://{DATABASE_USER}:{DATABASE_PASSWORD}@{DATABASE_HOST}:{DATABASE_PORT}/{DATABASE_NAME}"
+# "postgresql", "sqlite" or "memory", see `app.repository.backends`:
+DATABASE_BACKEND = os.getenv("DATABASE_BACKEND", "postgresql")
+# The database file of the "sqlite" backend, by default in memory:
+DATABASE_SQLITE_PATH = os.getenv("DATABASE_SQLITE_PATH", ":memory:")
+DATABASE_URL = (
+    f"sqlite+aiosqlite:///{DATABASE_SQLITE_PATH}"
+    if DATABASE_BACKEND == "sqlite"
+    else f"postgresql+psycopg://{DATABASE_USER}:{DATABASE_PASSWORD}@{DATABASE_HOST}:{DATABASE_PORT}/{DATABASE_NAME}"
+)
+# Comma-separated URLs of read replicas, if any:
+DATABASE_REPLICA_URLS = [
+    url.strip()
+    for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",")
+    if url.strip()
+]
+DATABASE_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", "5"))
+DATABASE_MAX_OVERFLOW = int(os.getenv("DATABASE_MAX_OVERFLOW", "10"))
+# Connections to each database server shared by all worker processes, 0 for no
+# limit. Keep it below the server's `max_connections`, less other clients. The
+# default leaves 20 of PostgreSQL's default 100 to migrations, admins and the like:
+DATABASE_MAX_CONNECTIONS = int(os.getenv("DATABASE_MAX_CONNECTIONS", "80"))
+# Worker processes of the server, see `app.serve`:
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+DATABASE_POOL_TIMEOUT = float(os.getenv("DATABASE_POOL_TIMEOUT", "30"))
+DATABASE_POOL_RECYCLE = int(os.getenv("DATABASE_POOL_RECYCLE", "-1"))
+DATABASE_POOL_PRE_PING = os.getenv("DATABASE_POOL_PRE_PING", "true").lower() == "true"
+# Seconds a statement may run before PostgreSQL cancels it, 0 for no limit:
+DATABASE_STATEMENT_TIMEOUT = float(os.getenv("DATABASE_STATEMENT_TIMEOUT", "0"))
+DATABASE_COPY_THRESHOLD = int(os.getenv("DATABASE_COPY_THRESHOLD", "5000"))
+DATABASE_ECHO = os.getenv("DATABASE_ECHO", "false").lower() == "true"
+# Compiled statements kept by SQLAlchemy per engine, see `db_compiled_cache_total`:
+DATABASE_QUERY_CACHE_SIZE = int(os.getenv("DATABASE_QUERY_CACHE_SIZE", "500"))
+# Executions of a statement on a connection before psycopg prepares it on the
+# server, empty to never prepare, e.g. behind PgBouncer in transaction mode:
+DATABASE_PREPARE_THRESHOLD = os.getenv("DATABASE_PREPARE_THRESHOLD", "5")
+# Partitions of the user table scanned at once by `scan_users`, each on a connection:
+DATABASE_SCAN_PARALLELISM = int(os.getenv("DATABASE_SCAN_PARALLELISM", "4"))
 
 logger = logging.getLogger(__name__)
 
 
+def pool_limits(workers: int | None = None) -> tuple[int, int]:
+    """Return the pool size and max overflow of the pool of each worker process.
+
+    With `DATABASE_MAX_CONNECTIONS`, the configured pool is shrunk as needed so
+    that the pools of all `workers` together never open more connections.
+    """
+    workers = workers or WEB_CONCURRENCY
+    if DATABASE_BACKEND == "sqlite":
+        # SQLite allows one writer at a time, and an in-memory database lives only
+        # as long as its connection, so keep a single one:
+        return 1, 0
+    if not DATABASE_MAX_CONNECTIONS:
+        return DATABASE_POOL_SIZE, DATABASE_MAX_OVERFLOW
+    per_worker = DATABASE_MAX_CONNECTIONS // workers
+    if per_worker < 1:
+        msg = (
+            f"DATABASE_MAX_CONNECTIONS={DATABASE_MAX_CONNECTIONS} leaves no "
+            f"connection for some of the {workers} workers."
+        )
+        raise ValueError(msg)
+    pool_size = min(DATABASE_POOL_SIZE, per_worker)
+    return pool_size, min(DATABASE_MAX_OVERFLOW, per_worker - pool_size)
+
+
+def engine_options() -> dict[str, Any]:
+    """Return the engine and pool options configured through the environment."""
+    pool_size, max_overflow = pool_limits()
+    options: dict[str, Any] = {
+        "echo": DATABASE_ECHO,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": DATABASE_POOL_TIMEOUT,
+        "pool_recycle": DATABASE_POOL_RECYCLE,
+        "pool_pre_ping": DATABASE_POOL_PRE_PING,
+        "query_cache_size": DATABASE_QUERY_CACHE_SIZE,
+    }
+    if DATABASE_BACKEND == "postgresql":
+        options["connect_args"] = {
+            "prepare_threshold": (
+                int(DATABASE_PREPARE_THRESHOLD) if DATABASE_PREPARE_THRESHOLD else None
+            )
+        }
+    return options
+
+
 class Base(DeclarativeBase):
     """Base class for SQLAlchemy models."""
 
 
 class UserDAO(Base):
-    """Data Access Object for User entity."""
+    """Data Access Object for User entity.
+
+    On PostgreSQL, the table is hash-partitioned on `id` by the
+    `partition_user_account` migration, see `AsyncRepository.scan_users`.
+    """
 
     __tablename__ = "user_account"
+    __table_args__ = (
+        # Serves exact and prefix (`LIKE 'abc%'`) matches on name:
+        Index(
+            "ix_user_account_name",
+            "name",
+            postgresql_ops={"name": "varchar_pattern_ops"},
+        ),
+        # Serves case-insensitive substring (`ILIKE '%abc%'`) matches on fullname:
+        Index(
+            "ix_user_account_fullname_trgm",
+            "fullname",
+            postgresql_using="gin",
+            postgresql_ops={"fullname": "gin_trgm_ops"},
+        ),
+    )
+
     id: Mapped[UUID] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(30))
     fullname: Mapped[str | None]
+    # Incremented by a trigger on every update that does not set it, whoever runs
+    # it, see the `add_user_account_versions` migration, and used for ETags:
+    version: Mapped[int] = mapped_column(server_default="1")
+
+    __mapper_args__ = {"version_id_col": version}  # noqa: RUF012
+
+
+def escape_like(value: str) -> str:
+    """Escape the `LIKE` wildcards in a value, using backslash as escape character."""
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+# The columns needed to build a `User`, read without loading `UserDAO` instances:
+USER_COLUMNS = (UserDAO.id, UserDAO.name, UserDAO.fullname, UserDAO.version)
+
+
+def search_users_statement(
+    limit: int,
+    after: UUID | None = None,
+    *,
+    name: str | None = None,
+    prefix: str | None = None,
+    q: str | None = None,
+) -> Select:
+    """Build the query of `AsyncRepository.search_users`.
+
+    Each filter is served by an index on PostgreSQL.
+    """
+    statement = select(*USER_COLUMNS).order_by(UserDAO.id).limit(limit)
+    if after is not None:
+        statement = statement.where(UserDAO.id > after)
+    if name is not None:
+        statement = statement.where(UserDAO.name == name)
+    if prefix is not None:
+        statement = statement.where(
+            UserDAO.name.like(escape_like(prefix) + "%", escape="\\")
+        )
+    if q is not None:
+        statement = statement.where(
+            UserDAO.fullname.ilike("%" + escape_like(q) + "%", escape="\\")
+        )
+    return statement
+
+
+# The statements of the hot paths, built once and executed with their parameters.
+# Building a statement, and the key of its compiled form in SQLAlchemy's cache,
+# takes more CPU time than running it, while a statement reused keeps its key:
+GET_USER = select(*USER_COLUMNS).where(UserDAO.id == bindparam("user_id"))
+GET_USER_VERSION = select(UserDAO.version).where(UserDAO.id == bindparam("user_id"))
+GET_USERS = select(*USER_COLUMNS).where(
+    UserDAO.id.in_(bindparam("user_ids", expanding=True))
+)
+LIST_USERS = select(*USER_COLUMNS).order_by(UserDAO.id).limit(bindparam("limit"))
+LIST_USERS_AFTER = LIST_USERS.where(UserDAO.id > bindparam("after"))
+INSERT_USERS = insert(UserDAO)
+
+
+def user_partition(name: str) -> TableClause:
+    """Return a table holding users, e.g. a partition of `user_account`.
+
+    Its columns are those of `USER_COLUMNS`, to be read with `row_to_user`.
+    """
+    return table(name, *(column(c.name, c.type) for c in UserDAO.__table__.columns))
+
+
+def row_to_user(row: Row) -> User:
+    """Build a `User` from a database row.
+
+    The row comes from our own table, so pydantic's validation is skipped.
+    """
+    user = User.model_construct(id=row.id, name=row.name, fullname=row.fullname or "")
+    user.version = row.version
+    return user
 
 
 class Repository:
@@ -44,12 +233,48 @@ class Repository:
 
     @classmethod
     def create_engine(cls) -> None:
-        """Initialize the repository with a SQLAlchemy session."""
-        cls.engine = create_engine(DATABASE_URL, echo=True)
+        """Create the process-wide engine and its connection pool.
+
+        Meant for scripts and other synchronous callers; the application itself
+        uses `AsyncRepository`.
+        """
+        cls.engine = create_engine(
+            DATABASE_URL, poolclass=TimedQueuePool, **engine_options()
+        )
+        instrument_engine(cls.engine, "sync")
+
+    @classmethod
+    def dispose_engine(cls) -> None:
+        """Close all pooled connections."""
+        cls.engine.dispose()
+
+    @classmethod
+    def reset_after_fork(cls) -> None:
+        """Give a forked child process a fresh connection pool.
+
+        The pooled connections belong to the parent process, so the child leaves
+        them open, for the parent, and connects anew on demand.
+        """
+        if hasattr(cls, "engine"):
+            cls.engine.dispose(close=False)
+
+    @classmethod
+    def get_session(cls) -> Generator[Session]:
+        """Yield one session per request.
+
+        The session runs in a single transaction that is committed when the request
+        succeeds and rolled back if it raises. Its connection is always returned to
+        the pool afterwards.
+        """
+        with Session(cls.engine) as session, session.begin():
+            yield session
 
     @classmethod
     def get_current_revision(cls) -> str | None:  # pragma: no cover
         """Get the current database schema revision."""
+        # lazy import, as Alembic is slow to import and only needed here:
+        from alembic.migration import MigrationContext  # noqa: PLC0415
+
         # This method should return the current revision of the database schema.
         conn = cls.engine.connect()
         context = MigrationContext.configure(conn)
@@ -60,6 +285,11 @@ class Repository:
     @classmethod
     def check(cls) -> bool:  # pragma: no cover
         """Check if the database schema is up to date."""
+        # lazy import, as Alembic is slow to import and only needed here:
+        from alembic.command import check  # noqa: PLC0415
+        from alembic.config import Config  # noqa: PLC0415
+        from alembic.util.exc import CommandError  # noqa: PLC0415
+
         # Get the alembic configuration:
         alembic_config_file = os.getenv("ALEMBIC_CONFIG", "alembic.ini")
         alembic_config = Config(alembic_config_file)
@@ -74,6 +304,10 @@ class Repository:
     @classmethod
     def get_current_head(cls) -> str | None:  # pragma: no cover
         """Get the current head of the database schema."""
+        # lazy import, as Alembic is slow to import and only needed here:
+        from alembic.config import Config  # noqa: PLC0415
+        from alembic.script import ScriptDirectory  # noqa: PLC0415
+
         alembic_config_file = os.getenv("ALEMBIC_CONFIG", "alembic.ini")
         config = Config(alembic_config_file)
         script = ScriptDirectory.from_config(config)
@@ -81,35 +315,91 @@ class Repository:
         return script.get_current_head()
 
     @classmethod
-    def add_user(cls, user: User) -> None:
+    def add_user(cls, session: Session, user: User) -> None:
         """Add a new user to the repository."""
-        with Session(cls.engine) as session:  # pragma: no cover
-            user_dao = UserDAO(id=user.id, name=user.name, fullname=user.fullname)
-            session.add(user_dao)
-            session.commit()
+        session.execute(
+            INSERT_USERS, {"id": user.id, "name": user.name, "fullname": user.fullname}
+        )
 
     @classmethod
-    def get_user(cls, user_id: UUID) -> User | None:  # pragma: no cover
+    def add_users(cls, session: Session, users: Sequence[User]) -> None:
+        """Add many users to the repository in one round-trip.
+
+        The users are inserted inside a savepoint, so a failure only rolls back this
+        batch and leaves the rest of the transaction intact. Batches of at least
+        `DATABASE_COPY_THRESHOLD` users are loaded with `COPY` on PostgreSQL, smaller
+        ones with a single multi-row `INSERT`.
+        """
+        with session.begin_nested():
+            connection = session.connection()
+            if (
+                connection.dialect.name == "postgresql"
+                and len(users) >= DATABASE_COPY_THRESHOLD
+            ):  # pragma: no cover
+                # Set while the connection is checked out, and from psycopg here:
+                driver_connection = connection.connection.driver_connection
+                cls._copy_users(cast("psycopg.Connection", driver_connection), users)
+            else:
+                session.execute(
+                    INSERT_USERS,
+                    [
+                        {"id": user.id, "name": user.name, "fullname": user.fullname}
+                        for user in users
+                    ],
+                )
+
+    @staticmethod
+    def _copy_users(
+        connection: "psycopg.Connection", users: Sequence[User]
+    ) -> None:  # pragma: no cover
+        """Load users with PostgreSQL `COPY`, the fastest bulk load path."""
+        # lazy import, as psycopg is only needed once connected to PostgreSQL:
+        import psycopg  # noqa: PLC0415
+
+        statement = "COPY user_account (id, name, fullname) FROM STDIN"
+        try:
+            with connection.cursor() as cursor, cursor.copy(statement) as copy:
+                for user in users:
+                    copy.write_row((user.id, user.name, user.fullname))
+        except psycopg.Error as e:
+            raise DBAPIError(statement, None, e) from e
+
+    @classmethod
+    def get_user(
+        cls, session: Session, user_id: UUID
+    ) -> User | None:  # pragma: no cover
         """Retrieve a user by ID."""
-        session = Session(cls.engine)
-        user_dao = session.query(UserDAO).filter(UserDAO.id == user_id).first()
-        if user_dao:
-            return User(
-                id=user_dao.id,
-                name=user_dao.name,
-                fullname=user_dao.fullname if user_dao.fullname else "",
-            )
-        return None
+        row = session.execute(GET_USER, {"user_id": user_id}).first()
+        return row_to_user(row) if row else None
 
     @classmethod
-    def list_users(cls) -> list[User]:  # pragma: no cover
-        """List all users in the repository."""
-        session = Session(cls.engine)
-        return [
-            User(
-                id=user_dao.id,
-                name=user_dao.name,
-                fullname=user_dao.fullname if user_dao.fullname else "",
+    def stream_users(cls, chunk_size: int) -> Iterator[User]:  # pragma: no cover
+        """Stream all users ordered by ID through a server-side cursor.
+
+        Rows are fetched `chunk_size` at a time, so memory use does not grow with
+        the size of the table. The stream holds its own connection until it is
+        exhausted or closed.
+        """
+        statement = select(*USER_COLUMNS).order_by(UserDAO.id)
+        with cls.engine.connect() as connection:
+            result = connection.execution_options(yield_per=chunk_size).execute(
+                statement
             )
-            for user_dao in session.query(UserDAO).all()
-        ]
+            for row in result:
+                yield row_to_user(row)
+
+    @classmethod
+    def list_users(
+        cls, session: Session, limit: int, after: UUID | None = None
+    ) -> list[User]:  # pragma: no cover
+        """List one page of users, using keyset pagination on the primary key."""
+        if after is None:
+            result = session.execute(LIST_USERS, {"limit": limit})
+        else:
+            result = session.execute(LIST_USERS_AFTER, {"limit": limit, "after": after})
+        return [row_to_user(row) for row in result]
+
+
+# Engines are created on startup, but a process forked afterwards, e.g. by a server
+# preloading the application, must not share their connections:
+os.register_at_fork(after_in_child=Repository.reset_after_fork)
@@ -0,0 +1,142 @@
+"""Background writer group-committing users created by concurrent requests."""
+
+import asyncio
+import logging
+import os
+
+from sqlalchemy.exc import DataError, IntegrityError
+
+from app.metrics import Histogram
+from app.models import User
+
+from .backends import UserRepository
+from .limiter import REJECTED, OverloadedError
+
+USERS_WRITE_BATCH_SIZE = int(os.getenv("USERS_WRITE_BATCH_SIZE", "100"))
+USERS_WRITE_BATCH_WINDOW_MS = float(os.getenv("USERS_WRITE_BATCH_WINDOW_MS", "0"))
+# Users allowed to wait for their batch, beyond which requests are rejected. The
+# writer holds a single connection, outside of the limiter, so it sheds load here:
+USERS_WRITE_QUEUE_SIZE = int(os.getenv("USERS_WRITE_QUEUE_SIZE", "1000"))
+
+logger = logging.getLogger(__name__)
+
+WRITE_BATCH_SIZE = Histogram(
+    "user_write_batch_size",
+    "Number of users inserted and committed together by the batch writer.",
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+)
+
+_Pending = tuple[User, asyncio.Future[None]]
+
+
+class BatchWriter:
+    """Queue users from concurrent requests and insert them in batches.
+
+    A batch is flushed as one multi-row `INSERT` and one commit once it holds
+    `max_size` users, or `window` seconds after its first user was queued. With
+    a window of 0, a batch holds the users queued while the previous batch was
+    being committed. Each caller of `save` waits until its batch is committed.
+    Callers beyond `queue_size` waiting are rejected with `OverloadedError`.
+    """
+
+    def __init__(
+        self, max_size: int, window: float, queue_size: int = USERS_WRITE_QUEUE_SIZE
+    ) -> None:
+        """Create a writer, which must be started before use."""
+        self.max_size = max_size
+        self.window = window
+        self.queue_size = queue_size
+        self._queue: asyncio.Queue[_Pending | None]
+        self._task: asyncio.Task[None] | None = None
+
+    def start(self) -> None:
+        """Start flushing batches in a background task on the running loop."""
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Flush the users queued so far and stop the background task."""
+        if self._task is None:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def save(self, user: User) -> None:
+        """Queue a user and wait until its batch is committed.
+
+        Raises the error of the `INSERT` if the user could not be saved, or
+        `OverloadedError` if too many users are waiting already.
+        """
+        if self._queue.qsize() >= self.queue_size:
+            REJECTED.inc("write_queue_full")
+            msg = "The write queue is full."
+            raise OverloadedError(msg)
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((user, future))
+        await future
+
+    async def _run(self) -> None:
+        """Collect and flush batches until stopped."""
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            pending = await self._queue.get()
+            if pending is None:
+                return
+            batch = [pending]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_size:
+                try:
+                    # Take what is already queued without waiting, then wait for
+                    # more until the window closes:
+                    pending = self._queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    try:
+                        async with asyncio.timeout_at(deadline):
+                            pending = await self._queue.get()
+                    except TimeoutError:
+                        break
+                if pending is None:
+                    stopping = True
+                    break
+                batch.append(pending)
+            WRITE_BATCH_SIZE.observe(len(batch))
+            await self._flush(batch)
+
+    async def _flush(self, batch: list[_Pending]) -> None:
+        """Insert and commit a batch, resolving the futures of its callers."""
+        try:
+            async with UserRepository.transaction() as session:
+                await UserRepository.add_users(session, [user for user, _ in batch])
+        except (IntegrityError, DataError) as e:
+            if len(batch) > 1:
+                # A single bad user fails the whole batch, so retry one by one to
+                # fail only the callers at fault. Other errors, e.g. the database
+                # being down, would fail every retry, so they fail the batch:
+                logger.warning("Failed to insert a batch of %d users.", len(batch))
+                for pending in batch:
+                    await self._flush([pending])
+                return
+            _resolve(batch, e)
+        except Exception as e:  # noqa: BLE001
+            # Never leave callers waiting on a batch that will not be written:
+            _resolve(batch, e)
+        else:
+            _resolve(batch)
+
+
+def _resolve(batch: list[_Pending], error: BaseException | None = None) -> None:
+    """Resolve the futures of a batch, unless their callers gave up waiting."""
+    for _, future in batch:
+        if future.done():
+            continue
+        if error is None:
+            future.set_result(None)
+        else:
+            future.set_exception(error)
+
+
+user_writer = BatchWriter(
+    USERS_WRITE_BATCH_SIZE, USERS_WRITE_BATCH_WINDOW_MS / 1000, USERS_WRITE_QUEUE_SIZE
+)
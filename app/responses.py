@@ -0,0 +1,27 @@
+"""JSON responses serializing users straight to bytes."""
+
+from typing import Any
+
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter
+
+from .models import User
+
+_USER_LIST = TypeAdapter(list[User])
+
+
+class UserJSONResponse(Response):
+    """A JSON response rendering users, or any model, in one pass with pydantic-core.
+
+    Returning a response directly skips FastAPI's validation of the content
+    against the response model, which for users read from the database would
+    only build the same list again.
+    """
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:  # noqa: ANN401
+        """Serialize a model, or a list of users, to JSON bytes."""
+        if isinstance(content, BaseModel):
+            return content.model_dump_json().encode()
+        return _USER_LIST.dump_json(content)
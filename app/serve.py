@@ -0,0 +1,49 @@
+"""Production server, running the API in several worker processes.
+
+    uv run hello-sql-alchemy
+
+Runs `WEB_CONCURRENCY` uvicorn workers, by default one per core. Each worker is a
+process of its own, which creates its engines and connection pools on startup,
+see `app.main.lifespan`. The workers split a budget of `DATABASE_MAX_CONNECTIONS`
+connections between them.
+"""
+
+import os
+
+import uvicorn
+
+from .repository.repository import pool_limits
+
+SERVER_HOST = os.getenv("SERVER_HOST", "127.0.0.1")
+SERVER_PORT = int(os.getenv("SERVER_PORT", "8000"))
+# Seconds for in-flight requests to finish on shutdown:
+SERVER_GRACEFUL_TIMEOUT = int(os.getenv("SERVER_GRACEFUL_TIMEOUT", "30"))
+
+
+def worker_count() -> int:
+    """Return the number of workers, `WEB_CONCURRENCY` or the number of cores.
+
+    Counts the cores the process may run on, e.g. those a container is pinned to,
+    rather than all the cores of the host.
+    """
+    return int(os.getenv("WEB_CONCURRENCY") or os.process_cpu_count() or 1)
+
+
+def main() -> None:
+    """Run the API until interrupted."""
+    workers = worker_count()
+    # Fail here, rather than in every worker, if the connections do not go round:
+    pool_limits(workers)
+    # The workers size their pools by it:
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    uvicorn.run(
+        "app:api",
+        host=SERVER_HOST,
+        port=SERVER_PORT,
+        workers=workers,
+        timeout_graceful_shutdown=SERVER_GRACEFUL_TIMEOUT,
+    )
+
+
+if __name__ == "__main__":  # pragma: no cover
+    main()
@@ -0,0 +1,124 @@
+"""Startup-time profiling, reported on stderr with `STARTUP_PROFILE=true`."""
+
+import importlib.abc
+import importlib.machinery
+import os
+import sys
+import time
+from collections.abc import Callable, Generator, Sequence
+from contextlib import contextmanager
+from types import ModuleType
+
+STARTUP_PROFILE = os.getenv("STARTUP_PROFILE", "false").lower() == "true"
+STARTUP_PROFILE_TOP = int(os.getenv("STARTUP_PROFILE_TOP", "20"))
+
+# Loaders with one instance per module, whose `exec_module` can be wrapped without
+# affecting other modules:
+_FILE_LOADERS = (
+    importlib.machinery.SourceFileLoader,
+    importlib.machinery.SourcelessFileLoader,
+    importlib.machinery.ExtensionFileLoader,
+)
+
+_ExecModule = Callable[[ModuleType], None]
+
+_phases: dict[str, float] = {}
+
+
+class ImportProfiler(importlib.abc.MetaPathFinder):
+    """Time the execution of every module imported while installed.
+
+    Like `python -X importtime`, records for each module the time spent in its own
+    code and the cumulative time including the modules it imported.
+    """
+
+    def __init__(self) -> None:
+        """Create a profiler, which records nothing until installed."""
+        # Per module, the self and the cumulative time in seconds:
+        self.timings: dict[str, tuple[float, float]] = {}
+        # Per module being executed, the cumulative time of its imports so far:
+        self._children: list[float] = []
+
+    def find_spec(
+        self,
+        fullname: str,
+        path: Sequence[str] | None,
+        target: ModuleType | None = None,
+    ) -> importlib.machinery.ModuleSpec | None:
+        """Find a module with the other finders, and time its execution."""
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        else:
+            return None
+        loader = spec.loader
+        if isinstance(loader, _FILE_LOADERS):
+            # Shadow the method on this loader only:
+            vars(loader)["exec_module"] = self._timed(fullname, loader.exec_module)
+        return spec
+
+    def _timed(self, fullname: str, exec_module: _ExecModule) -> _ExecModule:
+        """Wrap the `exec_module` of a loader to record its timings."""
+
+        def timed_exec_module(module: ModuleType) -> None:
+            self._children.append(0.0)
+            start = time.perf_counter()
+            try:
+                exec_module(module)
+            finally:
+                cumulative = time.perf_counter() - start
+                self.timings[fullname] = (cumulative - self._children.pop(), cumulative)
+                if self._children:
+                    self._children[-1] += cumulative
+
+        return timed_exec_module
+
+    def report(self, top: int = STARTUP_PROFILE_TOP) -> str:
+        """Format the `top` slowest modules by cumulative time."""
+        slowest = sorted(
+            self.timings.items(), key=lambda item: item[1][1], reverse=True
+        )[:top]
+        lines = [f"{'cumulative ms':>14} | {'self ms':>9} | module"]
+        lines.extend(
+            f"{cumulative * 1000:>14.1f} | {self_time * 1000:>9.1f} | {name}"
+            for name, (self_time, cumulative) in slowest
+        )
+        return "\n".join(lines)
+
+
+@contextmanager
+def timed_phase(name: str) -> Generator[None]:
+    """Record how long a phase of the startup takes, see `report_startup`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _phases[name] = time.perf_counter() - start
+
+
+@contextmanager
+def profile_imports(name: str) -> Generator[None]:
+    """Time an import as a startup phase and, if profiling, each module it imports."""
+    profiler = ImportProfiler()
+    if STARTUP_PROFILE:
+        sys.meta_path.insert(0, profiler)
+    try:
+        with timed_phase(f"import {name}"):
+            yield
+    finally:
+        if STARTUP_PROFILE:
+            sys.meta_path.remove(profiler)
+            sys.stderr.write(f"Slowest imports of {name}:\n{profiler.report()}\n")
+
+
+def report_startup() -> None:
+    """Report the duration of each startup phase, if profiling."""
+    if not STARTUP_PROFILE:
+        return
+    phases = "\n".join(
+        f"{seconds * 1000:>14.1f} | {name}" for name, seconds in _phases.items()
+    )
+    sys.stderr.write(f"Startup phases:\n{'ms':>14} | phase\n{phases}\n")
@@ -0,0 +1 @@
+"""Benchmarks of the application's database access."""
@@ -0,0 +1,168 @@
+"""Benchmark a backfill of millions of rows, and the writes waiting on it.
+
+Seeds a table of `--rows` users, then fills a new column of every row, first in
+a single transaction like a plain migration, then in chunks of each of
+`--batch-sizes` with `app.migrations.backfill`. Meanwhile, a writer updates
+random rows one at a time, like the application would:
+
+    uv run python -m benchmarks.backfill --rows 2000000 --batch-sizes 1000 10000
+
+Reports the time the backfill took, its longest transaction, and the longest a
+write waited. Without `--url`, a SQLite file in a temporary directory stands in
+for PostgreSQL. SQLite locks the whole database for each transaction, so the
+writes wait for as long as a chunk takes, and without a `--pause` may not get
+in between chunks at all.
+"""
+
+import argparse
+import random
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any
+
+from sqlalchemy import (
+    Column,
+    Engine,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    create_engine,
+    event,
+    func,
+    insert,
+    update,
+)
+
+from app.migrations import backfill
+
+SEED_CHUNK_SIZE = 100_000
+
+USERS = Table(
+    "benchmark_user",
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("name", String(30), nullable=False),
+    Column("name_upper", String(30)),
+)
+
+
+def _seed(engine: Engine, rows: int) -> None:
+    """Create the table with `rows` users, without `name_upper` filled."""
+    USERS.drop(engine, checkfirst=True)
+    USERS.create(engine)
+    for start in range(0, rows, SEED_CHUNK_SIZE):
+        with engine.begin() as connection:
+            connection.execute(
+                insert(USERS),
+                [
+                    {"id": i, "name": f"user{i}"}
+                    for i in range(start, min(start + SEED_CHUNK_SIZE, rows))
+                ],
+            )
+
+
+def _write(engine: Engine, rows: int, stop: threading.Event) -> list[float]:
+    """Update random users one at a time until stopped, returning the latencies."""
+    latencies: list[float] = []
+    with engine.connect() as connection:
+        while not stop.is_set():
+            start = time.perf_counter()
+            with connection.begin():
+                connection.execute(
+                    update(USERS)
+                    .where(USERS.c.id == random.randrange(rows))  # noqa: S311
+                    .values(name=USERS.c.name)
+                )
+            latencies.append(time.perf_counter() - start)
+            time.sleep(0.01)
+    return latencies
+
+
+def _transaction_times(engine: Engine) -> list[float]:
+    """Record how long each transaction of the engine lasts, until it is disposed."""
+    times: list[float] = []
+    started: dict[int, float] = {}
+
+    @event.listens_for(engine, "begin")
+    def begin(connection: Any) -> None:  # noqa: ANN401
+        started[id(connection)] = time.perf_counter()
+
+    @event.listens_for(engine, "commit")
+    def commit(connection: Any) -> None:  # noqa: ANN401
+        times.append(time.perf_counter() - started.pop(id(connection)))
+
+    return times
+
+
+def _run(engine: Engine, args: argparse.Namespace, batch_size: int | None) -> str:
+    """Fill `name_upper` of every user, in chunks of `batch_size` if given."""
+    with engine.begin() as connection:
+        connection.execute(update(USERS).values(name_upper=None))
+    writer_engine = create_engine(engine.url, connect_args={"timeout": 600})
+    stop = threading.Event()
+    latencies: list[float] = []
+    writer = threading.Thread(
+        target=lambda: latencies.extend(_write(writer_engine, args.rows, stop))
+    )
+    backfill_engine = create_engine(engine.url, connect_args={"timeout": 600})
+    transactions = _transaction_times(backfill_engine)
+    writer.start()
+    start = time.perf_counter()
+    if batch_size is None:
+        with backfill_engine.begin() as connection:
+            connection.execute(
+                update(USERS).values(name_upper=func.upper(USERS.c.name))
+            )
+    else:
+        backfill(
+            backfill_engine,
+            "benchmark_backfill",
+            USERS.c.id,
+            {"name_upper": func.upper(USERS.c.name)},
+            batch_size=batch_size,
+            pause=args.pause,
+        )
+    elapsed = time.perf_counter() - start
+    stop.set()
+    writer.join()
+    backfill_engine.dispose()
+    writer_engine.dispose()
+    label = "one" if batch_size is None else str(batch_size)
+    return (
+        f"{label:>10} {elapsed:>8.1f} {args.rows / elapsed:>10.0f}/s"
+        f" {max(transactions):>8.2f} {len(latencies):>7}"
+        f" {statistics.median(latencies) * 1000:>8.1f}"
+        f" {max(latencies) * 1000:>9.1f}"
+    )
+
+
+def main(args: argparse.Namespace) -> None:
+    """Run the backfill in one transaction, then in chunks of each batch size."""
+    with tempfile.TemporaryDirectory() as directory:
+        url = args.url or f"sqlite:///{Path(directory) / 'benchmark.db'}"
+        engine = create_engine(url)
+        _seed(engine, args.rows)
+        print(  # noqa: T201
+            f"{'chunk':>10} {'time s':>8} {'rows/s':>12} {'max tx s':>8}"
+            f" {'writes':>7} {'p50 ms':>8} {'max ms':>9}",
+            flush=True,
+        )
+        for batch_size in [None, *args.batch_sizes]:
+            print(_run(engine, args, batch_size), flush=True)  # noqa: T201
+        USERS.drop(engine)
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=str(__doc__).splitlines()[0])
+    parser.add_argument("--url", help="database URL, defaults to a SQLite file")
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument(
+        "--batch-sizes", type=int, nargs="+", default=[1000, 10_000, 100_000]
+    )
+    parser.add_argument("--pause", type=float, default=0)
+    main(parser.parse_args())
@@ -0,0 +1,323 @@
+"""Benchmark the user API in-process, on the SQLite and in-memory backends.
+
+Drives the real FastAPI application, middleware included, through an in-process
+ASGI transport, so that no server, network or outside database takes part. Every
+endpoint is measured with the user table grown to each of `--rows` in turn:
+
+    uv run poe benchmark
+
+Reports the latency percentiles, the throughput and the peak RSS of the process
+so far. Each scenario is warmed up with `--warmup` requests, then timed over
+`--repeat` runs of `--requests` requests, and reports the median of each
+statistic over the runs. With `--output`, the results are saved as JSON, and
+with `--baseline` compared with results saved before, failing if any got worse by
+more than `--threshold`:
+
+    uv run poe benchmark --output benchmarks/baseline.json
+    uv run poe benchmark-compare
+
+Results only compare on the same machine, so no baseline is committed, and the
+comparison is skipped until one is saved.
+
+Each backend runs in a process of its own, as `DATABASE_BACKEND` is read on
+import. With `--profile`, the functions taking the most time are reported for
+each backend, to find the hot spots of the application's own code.
+"""
+
+import argparse
+import asyncio
+import cProfile
+import io
+import json
+import os
+import platform
+import pstats
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+from typing import Any
+from uuid import UUID
+
+import httpx
+
+from app.repository.backends import BACKENDS
+
+Request = Callable[[httpx.AsyncClient], Awaitable[httpx.Response]]
+
+SEED_CHUNK_SIZE = 10_000
+# IDs of seeded users to request, as keeping all of them would inflate the RSS:
+SAMPLE_SIZE = 10_000
+
+
+def _scenarios(user_ids: list[UUID]) -> dict[str, Request]:
+    """Return the requests to measure, by name."""
+    from app.models import encode_cursor  # noqa: PLC0415
+
+    return {
+        "GET /health": lambda client: client.get("/health"),
+        "GET /users": lambda client: client.get(
+            "/users",
+            params={"limit": 100, "cursor": encode_cursor(random.choice(user_ids))},  # noqa: S311
+        ),
+        "GET /users/{id}": lambda client: client.get(
+            f"/users/{random.choice(user_ids)}"  # noqa: S311
+        ),
+        "POST /users/lookup": lambda client: client.post(
+            "/users/lookup",
+            json={"ids": [str(user_id) for user_id in random.sample(user_ids, 100)]},
+        ),
+        "POST /users": lambda client: client.post(
+            "/users", json={"name": "benchmark", "fullname": "Benchmark User"}
+        ),
+    }
+
+
+async def _seed(start: int, stop: int, sample: list[UUID]) -> None:
+    """Create users `start` to `stop`, keeping a random sample of their IDs.
+
+    Goes straight to the repository, as seeding is not what is measured.
+    """
+    from app.models import User  # noqa: PLC0415
+    from app.repository import UserRepository  # noqa: PLC0415
+
+    for chunk_start in range(start, stop, SEED_CHUNK_SIZE):
+        users = [
+            User(name=f"user{i}", fullname=f"User {i:07}")
+            for i in range(chunk_start, min(chunk_start + SEED_CHUNK_SIZE, stop))
+        ]
+        async with UserRepository.transaction() as session:
+            await UserRepository.add_users(session, users)
+        for i, user in enumerate(users, chunk_start):
+            # Reservoir sampling, so that every user is as likely to be requested:
+            if len(sample) < SAMPLE_SIZE:
+                sample.append(user.id)
+            elif (j := random.randrange(i + 1)) < SAMPLE_SIZE:  # noqa: S311
+                sample[j] = user.id
+
+
+def _peak_rss_mb() -> float:
+    """Return the peak resident set size of this process so far, in MB."""
+    # In kilobytes on Linux, but in bytes on macOS:
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6
+
+
+async def _send(
+    client: httpx.AsyncClient, request: Request, count: int, concurrency: int
+) -> dict[str, float]:
+    """Send `count` requests from `concurrency` clients, and time them."""
+    latencies: list[float] = []
+    remaining = iter(range(count))
+
+    async def worker() -> None:
+        for _ in remaining:
+            start = time.perf_counter()
+            response = await request(client)
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "throughput": count / elapsed,
+        "p50_ms": quantiles[49] * 1000,
+        "p95_ms": quantiles[94] * 1000,
+        "p99_ms": quantiles[98] * 1000,
+    }
+
+
+async def _measure(
+    client: httpx.AsyncClient, scenarios: dict[str, Request], args: argparse.Namespace
+) -> dict[str, dict[str, float]]:
+    """Warm up, then time `--repeat` runs, returning the median of each statistic.
+
+    A single run is at the mercy of the garbage collector, caches being filled and
+    other processes, so that back-to-back runs of the same code differ widely. The
+    runs of the scenarios take turns, so that a slow spell is spread over all of
+    them rather than skewing one.
+    """
+    for request in scenarios.values():
+        if args.warmup:
+            await _send(client, request, args.warmup, args.concurrency)
+    runs: dict[str, list[dict[str, float]]] = {scenario: [] for scenario in scenarios}
+    for _ in range(args.repeat):
+        for scenario, request in scenarios.items():
+            runs[scenario].append(
+                await _send(client, request, args.requests, args.concurrency)
+            )
+    return {
+        scenario: {
+            key: statistics.median(run[key] for run in scenario_runs)
+            for key in scenario_runs[0]
+        }
+        for scenario, scenario_runs in runs.items()
+    }
+
+
+async def _run(args: argparse.Namespace) -> None:
+    """Benchmark every scenario on the backend of this process.
+
+    Writes each result to stdout as a line of JSON.
+    """
+    # Imported here, once `DATABASE_BACKEND` is set for this process:
+    from app import api  # noqa: PLC0415
+
+    backend = os.environ["DATABASE_BACKEND"]
+    transport = httpx.ASGITransport(app=api)
+    sample: list[UUID] = []
+    seeded = 0
+    async with (
+        api.router.lifespan_context(api),
+        httpx.AsyncClient(transport=transport, base_url="http://test") as client,
+    ):
+        for rows in sorted(args.rows):
+            await _seed(seeded, rows, sample)
+            seeded = rows
+            results = await _measure(client, _scenarios(sample), args)
+            for scenario, result in results.items():
+                key = {"backend": backend, "scenario": scenario, "rows": rows}
+                result["peak_rss_mb"] = _peak_rss_mb()
+                print(json.dumps(key | result), flush=True)  # noqa: T201
+
+
+def run(args: argparse.Namespace) -> None:
+    """Run the benchmark on the backend of this process, profiling if asked."""
+    if not args.profile:
+        asyncio.run(_run(args))
+        return
+    profiler = cProfile.Profile()
+    profiler.runcall(asyncio.run, _run(args))
+    output = io.StringIO()
+    pstats.Stats(profiler, stream=output).sort_stats("tottime").print_stats(25)
+    print(output.getvalue(), file=sys.stderr)  # noqa: T201
+
+
+def compare(
+    results: list[dict[str, Any]], baseline: list[dict[str, Any]], threshold: float
+) -> list[str]:
+    """Return the results that regressed beyond `threshold` from the baseline.
+
+    A result regressed if its p95 latency is higher, or its throughput lower, by
+    more than the `threshold` fraction. Both are medians over repeated runs, see
+    `_measure`. Results missing from the baseline are not compared.
+    """
+    baseline_by_key = {
+        (result["backend"], result["scenario"], result["rows"]): result
+        for result in baseline
+    }
+    regressions = []
+    for result in results:
+        before = baseline_by_key.get(
+            (result["backend"], result["scenario"], result["rows"])
+        )
+        if before is None:
+            continue
+        name = f"{result['scenario']} on {result['backend']} at {result['rows']} rows"
+        if result["p95_ms"] > before["p95_ms"] * (1 + threshold):
+            regressions.append(
+                f"{name}: p95 {before['p95_ms']:.2f} -> {result['p95_ms']:.2f} ms"
+            )
+        if result["throughput"] < before["throughput"] * (1 - threshold):
+            regressions.append(
+                f"{name}: throughput {before['throughput']:.0f}"
+                f" -> {result['throughput']:.0f}/s"
+            )
+    return regressions
+
+
+def main(args: argparse.Namespace) -> None:
+    """Run the benchmark on each backend, then save and compare the results."""
+    if args.baseline and not args.baseline.exists():
+        print(  # noqa: T201
+            f"No baseline at {args.baseline}, skipping the comparison. Save one on"
+            f" this machine first, with --output {args.baseline}.",
+            file=sys.stderr,
+        )
+        return
+    print(  # noqa: T201
+        f"{'backend':>8} {'rows':>9} {'request':<18} {'throughput':>10}"
+        f" {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'RSS MB':>8}",
+        flush=True,
+    )
+    results: list[dict[str, Any]] = []
+    for backend in args.backends:
+        with (
+            subprocess.Popen(  # noqa: S603
+                [sys.executable, "-m", "benchmarks.in_process", *sys.argv[1:], "--run"],
+                env={**os.environ, "DATABASE_BACKEND": backend},
+                stdout=subprocess.PIPE,
+                text=True,
+            ) as process
+        ):
+            for line in process.stdout or ():
+                result = json.loads(line)
+                results.append(result)
+                print(  # noqa: T201
+                    f"{backend:>8} {result['rows']:>9} {result['scenario']:<18}"
+                    f" {result['throughput']:>8.0f}/s {result['p50_ms']:>8.2f}"
+                    f" {result['p95_ms']:>8.2f} {result['p99_ms']:>8.2f}"
+                    f" {result['peak_rss_mb']:>8.0f}",
+                    flush=True,
+                )
+        if process.returncode:
+            sys.exit(process.returncode)
+
+    if args.output:
+        report = {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "warmup": args.warmup,
+            "repeat": args.repeat,
+            "results": results,
+        }
+        args.output.write_text(json.dumps(report, indent=2) + "\n")
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text())["results"]
+        regressions = compare(results, baseline, args.threshold)
+        for regression in regressions:
+            print(f"Regression: {regression}", file=sys.stderr)  # noqa: T201
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=str(__doc__).splitlines()[0])
+    parser.add_argument(
+        "--backends", nargs="+", choices=BACKENDS[1:], default=list(BACKENDS[1:])
+    )
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[1_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument(
+        "--warmup", type=int, default=200, help="requests sent before timing"
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="timed runs, of which the median counts"
+    )
+    parser.add_argument("--output", type=Path, help="save the results as JSON")
+    parser.add_argument("--baseline", type=Path, help="results to compare with")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="regression to fail on, as a fraction of the baseline",
+    )
+    parser.add_argument("--profile", action="store_true")
+    parser.add_argument("--run", action="store_true", help=argparse.SUPPRESS)
+    parsed = parser.parse_args()
+    if parsed.run:
+        run(parsed)
+    else:
+        main(parsed)
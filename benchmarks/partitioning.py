@@ -0,0 +1,163 @@
+"""Benchmark point lookups and full scans of a hash-partitioned user table.
+
+Loads the same users into a plain and a hash-partitioned `user_account`, each in
+a schema of its own, then compares the two as the number of users grows:
+
+    uv run python -m benchmarks.partitioning --url postgresql+psycopg://... \
+        --rows 100000 1000000 --parallelism 1 2 4 8
+
+Point lookups should take as long on either table, as a lookup by ID goes to a
+single partition. A full scan of the partitioned table, with `scan_users`, should
+take less time with more partitions read in parallel, until the database runs
+out of cores or disk bandwidth. Needs PostgreSQL, and drops the schemas after.
+"""
+
+import argparse
+import asyncio
+import random
+import statistics
+import time
+from collections.abc import AsyncIterator, Callable
+from uuid import UUID
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from app.models import User
+from app.repository import AsyncRepository, async_repository
+from app.repository.cache import user_cache
+
+SCHEMAS = ("benchmark_plain", "benchmark_partitioned")
+
+
+async def _create_tables(engine: AsyncEngine, partitions: int) -> None:
+    """Create an empty plain and hash-partitioned user table, one in each schema."""
+    async with engine.begin() as connection:
+        for schema in SCHEMAS:
+            await connection.execute(text(f"DROP SCHEMA IF EXISTS {schema} CASCADE"))
+            await connection.execute(text(f"CREATE SCHEMA {schema}"))
+        columns = (
+            "id uuid PRIMARY KEY, name varchar(30) NOT NULL, fullname varchar,"
+            " version integer NOT NULL DEFAULT 1"
+        )
+        await connection.execute(
+            text(f"CREATE TABLE benchmark_plain.user_account ({columns})")
+        )
+        await connection.execute(
+            text(
+                f"CREATE TABLE benchmark_partitioned.user_account ({columns})"
+                " PARTITION BY HASH (id)"
+            )
+        )
+        for remainder in range(partitions):
+            await connection.execute(
+                text(
+                    f"CREATE TABLE benchmark_partitioned.user_account_p{remainder}"
+                    " PARTITION OF benchmark_partitioned.user_account FOR VALUES"
+                    f" WITH (MODULUS {partitions}, REMAINDER {remainder})"
+                )
+            )
+
+
+async def _grow(engine: AsyncEngine, start: int, stop: int) -> None:
+    """Add users `start` to `stop` to both tables."""
+    async with engine.begin() as connection:
+        await connection.execute(
+            text(
+                "WITH added AS ("
+                " INSERT INTO benchmark_plain.user_account (id, name, fullname)"
+                " SELECT gen_random_uuid(), 'user' || i, 'User ' || i"
+                " FROM generate_series(:start, :stop - 1) AS i RETURNING *"
+                ") INSERT INTO benchmark_partitioned.user_account SELECT * FROM added"
+            ),
+            {"start": start, "stop": stop},
+        )
+    async with engine.connect() as connection:
+        autocommit = await connection.execution_options(isolation_level="AUTOCOMMIT")
+        for schema in SCHEMAS:
+            await autocommit.execute(text(f"VACUUM ANALYZE {schema}.user_account"))
+
+
+async def _lookups(user_ids: list[UUID]) -> tuple[float, float]:
+    """Look up users by ID one at a time, returning the p50 and p99 in ms."""
+    latencies: list[float] = []
+    async with AsyncRepository.read_session() as session:
+        for user_id in user_ids:
+            start = time.perf_counter()
+            await AsyncRepository.get_user(session, user_id)
+            latencies.append(time.perf_counter() - start)
+    quantiles = statistics.quantiles(latencies, n=100)
+    return quantiles[49] * 1000, quantiles[98] * 1000
+
+
+async def _time_scan(scan: Callable[[int], AsyncIterator[User]]) -> float:
+    """Read all users through `scan`, returning the seconds it took."""
+    start = time.perf_counter()
+    async for _ in scan(1000):
+        pass
+    return time.perf_counter() - start
+
+
+async def main(args: argparse.Namespace) -> None:
+    """Run the benchmark for each number of users."""
+    setup = create_async_engine(args.url)
+    await _create_tables(setup, args.partitions)
+    engines = {
+        schema: create_async_engine(
+            args.url,
+            pool_size=max(args.parallelism),
+            connect_args={"options": f"-csearch_path={schema}"},
+        )
+        for schema in SCHEMAS
+    }
+    print(  # noqa: T201
+        f"{'rows':>9} {'table':<12} {'p50 ms':>8} {'p99 ms':>8} {'stream s':>9}"
+        + "".join(f" {f'scan x{p} s':>11}" for p in args.parallelism)
+    )
+    seeded = 0
+    for rows in sorted(args.rows):
+        await _grow(setup, seeded, rows)
+        seeded = rows
+        async with setup.connect() as connection:
+            user_ids = list(
+                (
+                    await connection.execute(
+                        text(
+                            "SELECT id FROM benchmark_plain.user_account"
+                            " ORDER BY random() LIMIT :limit"
+                        ),
+                        {"limit": args.lookups},
+                    )
+                ).scalars()
+            )
+        for schema, engine in engines.items():
+            AsyncRepository.engine = engine
+            user_cache.clear()
+            random.shuffle(user_ids)
+            p50, p99 = await _lookups(user_ids)
+            line = f"{rows:>9} {schema.removeprefix('benchmark_'):<12}"
+            line += f" {p50:>8.2f} {p99:>8.2f}"
+            line += f" {await _time_scan(AsyncRepository.stream_users):>9.2f}"
+            for parallelism in args.parallelism:
+                # Read by `scan_users` when called:
+                async_repository.DATABASE_SCAN_PARALLELISM = parallelism
+                line += f" {await _time_scan(AsyncRepository.scan_users):>11.2f}"
+            print(line, flush=True)  # noqa: T201
+    for engine in engines.values():
+        await engine.dispose()
+    async with setup.begin() as connection:
+        for schema in SCHEMAS:
+            await connection.execute(text(f"DROP SCHEMA {schema} CASCADE"))
+    await setup.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=str(__doc__).splitlines()[0])
+    parser.add_argument("--url", required=True, help="PostgreSQL database URL")
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--partitions", type=int, default=16)
+    parser.add_argument("--parallelism", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--lookups", type=int, default=1000)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,132 @@
+"""Benchmark reading users through ORM instances and through Core column selects.
+
+Compares loading `UserDAO` instances and validating a `User` from each, as the
+repository used to, with selecting the columns and building each `User` with
+`row_to_user`, as it does now. Both read all `--rows` users, in pages of
+`--page-size` users on one session:
+
+    uv run python -m benchmarks.read_path --rows 200000 --page-size 100 200000
+
+Reports the rows read per second, and the peak memory allocated while reading
+them again, as traced by `tracemalloc`. Without `--url`, a SQLite file in a
+temporary directory stands in for PostgreSQL.
+"""
+
+import argparse
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+from pathlib import Path
+from uuid import UUID
+
+from sqlalchemy import Engine, create_engine, insert, select
+from sqlalchemy.orm import Session
+
+from app.models import User
+from app.repository import Base
+from app.repository.repository import (
+    LIST_USERS,
+    LIST_USERS_AFTER,
+    UserDAO,
+    row_to_user,
+)
+
+SEED_CHUNK_SIZE = 100_000
+
+ReadPage = Callable[[Session, int, UUID | None], list[User]]
+
+
+def _orm(session: Session, limit: int, after: UUID | None) -> list[User]:
+    """Read a page of users as ORM instances, copied into validated users."""
+    statement = select(UserDAO).order_by(UserDAO.id).limit(limit)
+    if after is not None:
+        statement = statement.where(UserDAO.id > after)
+    return [
+        User(id=user_dao.id, name=user_dao.name, fullname=user_dao.fullname or "")
+        for user_dao in session.scalars(statement)
+    ]
+
+
+def _core(session: Session, limit: int, after: UUID | None) -> list[User]:
+    """Read a page of users as rows, like `Repository.list_users`."""
+    if after is None:
+        result = session.execute(LIST_USERS, {"limit": limit})
+    else:
+        result = session.execute(LIST_USERS_AFTER, {"limit": limit, "after": after})
+    return [row_to_user(row) for row in result]
+
+
+READ_PATHS: dict[str, ReadPage] = {"ORM": _orm, "Core": _core}
+
+
+def _seed(engine: Engine, rows: int) -> None:
+    """Create the tables and `rows` users."""
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    for start in range(0, rows, SEED_CHUNK_SIZE):
+        users = [
+            User(name=f"user{i}", fullname=f"User {i:07}")
+            for i in range(start, min(start + SEED_CHUNK_SIZE, rows))
+        ]
+        with engine.begin() as connection:
+            connection.execute(
+                insert(UserDAO),
+                [
+                    {"id": user.id, "name": user.name, "fullname": user.fullname}
+                    for user in users
+                ],
+            )
+
+
+def _read_all(session: Session, read_page: ReadPage, page_size: int) -> int:
+    """Read every user page by page, returning how many were read."""
+    rows = 0
+    after = None
+    while page := read_page(session, page_size, after):
+        rows += len(page)
+        after = page[-1].id
+    return rows
+
+
+def _measure(engine: Engine, read_page: ReadPage, page_size: int) -> tuple[int, float]:
+    """Read every user, returning the rows per second and the peak MB allocated.
+
+    Memory is traced on a second read, so that tracing does not slow the first.
+    """
+    with Session(engine) as session:
+        # Warm up the connection, and the compiled cache:
+        read_page(session, 1, None)
+        start = time.perf_counter()
+        rows = _read_all(session, read_page, page_size)
+        elapsed = time.perf_counter() - start
+        tracemalloc.start()
+        _read_all(session, read_page, page_size)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return round(rows / elapsed), peak / 1e6
+
+
+def main(args: argparse.Namespace) -> None:
+    """Run the benchmark for each read path and page size."""
+    with tempfile.TemporaryDirectory() as directory:
+        url = args.url or f"sqlite:///{Path(directory) / 'benchmark.db'}"
+        engine = create_engine(url)
+        _seed(engine, args.rows)
+        print(f"{'page':>9} {'read':<5} {'rows/s':>10} {'peak MB':>8}")  # noqa: T201
+        for page_size in args.page_size:
+            for label, read_page in READ_PATHS.items():
+                throughput, peak = _measure(engine, read_page, page_size)
+                print(  # noqa: T201
+                    f"{page_size:>9} {label:<5} {throughput:>10} {peak:>8.1f}",
+                    flush=True,
+                )
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=str(__doc__).splitlines()[0])
+    parser.add_argument("--url", help="database URL, defaults to a SQLite file")
+    parser.add_argument("--rows", type=int, default=200_000)
+    parser.add_argument("--page-size", type=int, nargs="+", default=[100, 200_000])
+    main(parser.parse_args())
@@ -0,0 +1,84 @@
+"""Benchmark serializing lists of users to JSON response bodies.
+
+Compares the paths a list of users can take to the response body:
+
+    uv run python -m benchmarks.serialization --users 10000 100000
+"""
+
+import argparse
+import json
+import time
+from collections.abc import Callable
+from uuid import uuid4
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from app.compression import ENCODINGS
+from app.models import User
+from app.responses import UserJSONResponse
+
+_USER_LIST = TypeAdapter(list[User])
+
+
+def _jsonable_encoder(users: list[User]) -> bytes:
+    """Encode like a custom response class: `jsonable_encoder` and stdlib json."""
+    return json.dumps(jsonable_encoder(users)).encode()
+
+
+def _validate_and_dump(users: list[User]) -> bytes:
+    """Encode like FastAPI's response model: validate the list, then dump it."""
+    return _USER_LIST.dump_json(_USER_LIST.validate_python(users))
+
+
+def _user_json_response(users: list[User]) -> bytes:
+    """Encode through `UserJSONResponse`, dumping straight to bytes."""
+    return bytes(UserJSONResponse(users).body)
+
+
+def _compressed(encoding: str) -> Callable[[list[User]], bytes]:
+    """Encode through `UserJSONResponse` and compress the body."""
+
+    def encode(users: list[User]) -> bytes:
+        compressor = ENCODINGS[encoding]()
+        return compressor.compress(_user_json_response(users)) + compressor.flush()
+
+    return encode
+
+
+def _measure(encode: Callable[[list[User]], bytes], users: list[User]) -> str:
+    """Time the best of a few runs of `encode`, and report its throughput."""
+    best = float("inf")
+    for _ in range(5):
+        start = time.perf_counter()
+        body = encode(users)
+        best = min(best, time.perf_counter() - start)
+    raw_size = len(_user_json_response(users))
+    return (
+        f"{best * 1000:>10.1f} {raw_size / best / 1e6:>10.1f} {len(body) / 1e6:>10.2f}"
+    )
+
+
+def main(args: argparse.Namespace) -> None:
+    """Run the benchmark for each number of users."""
+    paths: dict[str, Callable[[list[User]], bytes]] = {
+        "jsonable_encoder": _jsonable_encoder,
+        "validate+dump_json": _validate_and_dump,
+        "UserJSONResponse": _user_json_response,
+    }
+    for encoding in ENCODINGS:
+        paths[f"UserJSONResponse+{encoding}"] = _compressed(encoding)
+    print(f"{'users':>7} {'path':<24} {'ms':>10} {'MB/s':>10} {'MB':>10}")  # noqa: T201
+    for count in args.users:
+        users = [
+            User.model_construct(id=uuid4(), name=f"user{i}", fullname="Benchmark User")
+            for i in range(count)
+        ]
+        for name, encode in paths.items():
+            print(f"{count:>7} {name:<24} {_measure(encode, users)}")  # noqa: T201
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=str(__doc__).splitlines()[0])
+    parser.add_argument("--users", type=int, nargs="+", default=[10_000, 100_000])
+    main(parser.parse_args())
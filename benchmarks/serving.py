@@ -0,0 +1,131 @@
+"""Load test the server's throughput as the number of worker processes grows.
+
+Starts `app.serve` with each number of `--workers` in turn, and sends it requests
+from `--concurrency` concurrent clients for `--duration` seconds:
+
+    uv run --env-file=.env python -m benchmarks.serving --workers 1 2 4 8
+
+The default `--path` reads a page of users, so the server needs a database with
+the migrations applied, configured with `DATABASE_*` as usual. Load `/metrics` to
+measure the web tier alone, without a database. The clients run in
+`--client-processes` processes next to the server, and take cores from it.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import httpx
+
+PORT = 8765
+# Seconds for the server to start up:
+READY_TIMEOUT = 30
+
+
+async def _wait_until_ready(client: httpx.AsyncClient) -> None:
+    """Wait for the server to accept requests."""
+    deadline = time.monotonic() + READY_TIMEOUT
+    while True:
+        try:
+            await client.get("/metrics")
+        except httpx.TransportError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+        else:
+            return
+
+
+async def _load(path: str, concurrency: int, duration: float) -> list[float]:
+    """Send requests from concurrent clients until `duration` is over.
+
+    Returns the latency of each successful request.
+    """
+    latencies: list[float] = []
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(
+        base_url=f"http://127.0.0.1:{PORT}", limits=limits
+    ) as client:
+        await _wait_until_ready(client)
+        deadline = time.perf_counter() + duration
+
+        async def worker() -> None:
+            while (start := time.perf_counter()) < deadline:
+                response = await client.get(path)
+                if response.is_success:
+                    latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+
+def _load_process(path: str, concurrency: int, duration: float) -> list[float]:
+    """Run `_load` in a client process."""
+    return asyncio.run(_load(path, concurrency, duration))
+
+
+def _run(workers: int, args: argparse.Namespace) -> str:
+    """Load a server with `workers` worker processes, and report timings."""
+    env = {**os.environ, "WEB_CONCURRENCY": str(workers), "SERVER_PORT": str(PORT)}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "app.serve"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        per_process = max(1, args.concurrency // args.client_processes)
+        with ProcessPoolExecutor(args.client_processes) as executor:
+            # Warm up the pools and caches of every worker:
+            list(
+                executor.map(
+                    _load_process,
+                    [args.path] * args.client_processes,
+                    [per_process] * args.client_processes,
+                    [1.0] * args.client_processes,
+                )
+            )
+            results = executor.map(
+                _load_process,
+                [args.path] * args.client_processes,
+                [per_process] * args.client_processes,
+                [args.duration] * args.client_processes,
+            )
+            latencies = [latency for result in results for latency in result]
+    finally:
+        server.terminate()
+        server.wait()
+    quantiles = statistics.quantiles(latencies, n=100)
+    return (
+        f"{workers:>8} {len(latencies) / args.duration:>10.0f}/s"
+        f" {quantiles[49] * 1000:>8.2f} {quantiles[98] * 1000:>8.2f}"
+    )
+
+
+def main(args: argparse.Namespace) -> None:
+    """Run the load test for each number of workers."""
+    print(f"{os.cpu_count()} cores, {args.concurrency} clients on {args.path}")  # noqa: T201
+    print(f"{'workers':>8} {'throughput':>12} {'p50 ms':>8} {'p99 ms':>8}")  # noqa: T201
+    for workers in args.workers:
+        print(_run(workers, args))  # noqa: T201
+
+
+if __name__ == "__main__":
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=str(__doc__).splitlines()[0])
+    parser.add_argument("--path", default="/users?limit=100")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=sorted({1, *(2**i for i in range(cores.bit_length())), cores}),
+    )
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--client-processes", type=int, default=max(1, cores // 2))
+    parser.add_argument("--duration", type=float, default=10)
+    main(parser.parse_args())
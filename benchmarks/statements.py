@@ -0,0 +1,139 @@
+"""Benchmark the CPU time per call of looking up a user by ID.
+
+Compares building the statement on every call, as the repository used to, with
+executing the statement built once by `app.repository.repository`, and with
+`AsyncRepository.get_user` itself, the user cache disabled:
+
+    uv run python -m benchmarks.statements --url postgresql+psycopg://... \
+        --prepare-thresholds none 0 5
+
+Reports the CPU time of the event loop's thread, which is the application's
+share, the wall time per call, and the hit rate of SQLAlchemy's compiled cache.
+On PostgreSQL, each of `--prepare-thresholds` is tried as psycopg's
+`prepare_threshold`, `none` to never prepare statements on the server. Without
+`--url`, a SQLite file in a temporary directory stands in for PostgreSQL.
+"""
+
+import argparse
+import asyncio
+import tempfile
+import time
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+from typing import Any
+from uuid import UUID
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+
+from app.metrics import STATEMENT_CACHE, instrument_engine
+from app.models import User
+from app.repository import AsyncRepository, Base
+from app.repository.cache import user_cache
+from app.repository.repository import (
+    GET_USER,
+    USER_COLUMNS,
+    UserDAO,
+    row_to_user,
+)
+
+Lookup = Callable[[AsyncSession, UUID], Awaitable[User | None]]
+
+
+async def _built_per_call(session: AsyncSession, user_id: UUID) -> User | None:
+    """Look up a user with a statement built for this call."""
+    result = await session.execute(select(*USER_COLUMNS).where(UserDAO.id == user_id))
+    row = result.first()
+    return row_to_user(row) if row else None
+
+
+async def _pre_built(session: AsyncSession, user_id: UUID) -> User | None:
+    """Look up a user with the statement built once."""
+    result = await session.execute(GET_USER, {"user_id": user_id})
+    row = result.first()
+    return row_to_user(row) if row else None
+
+
+LOOKUPS: dict[str, Lookup] = {
+    "built per call": _built_per_call,
+    "pre-built": _pre_built,
+    "get_user": AsyncRepository.get_user,
+}
+
+
+async def _seed(engine: AsyncEngine, count: int) -> list[UUID]:
+    """Create the tables and `count` users, returning their IDs."""
+    users = [User(name=f"user{i}", fullname=f"User {i}") for i in range(count)]
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
+        await connection.run_sync(Base.metadata.create_all)
+        await connection.execute(
+            insert(UserDAO),
+            [
+                {"id": user.id, "name": user.name, "fullname": user.fullname}
+                for user in users
+            ],
+        )
+    return [user.id for user in users]
+
+
+def _cache_lookups(name: str) -> tuple[float, float]:
+    """Return the compiled cache hits and misses of an instrumented engine so far."""
+    values = STATEMENT_CACHE._values  # noqa: SLF001
+    return values.get((name, "hit"), 0), values.get((name, "miss"), 0)
+
+
+async def _measure(
+    engine: AsyncEngine, name: str, lookup: Lookup, user_ids: list[UUID]
+) -> str:
+    """Look up every user in turn on one session, and report the time per call."""
+    async with AsyncSession(engine) as session:
+        # Warm up the connection, and the compiled cache:
+        await lookup(session, user_ids[0])
+        hits_before, misses_before = _cache_lookups(name)
+        cpu_start, wall_start = time.thread_time(), time.perf_counter()
+        for user_id in user_ids:
+            await lookup(session, user_id)
+        cpu = (time.thread_time() - cpu_start) / len(user_ids)
+        wall = (time.perf_counter() - wall_start) / len(user_ids)
+    hits_after, misses_after = _cache_lookups(name)
+    hits, misses = hits_after - hits_before, misses_after - misses_before
+    return (
+        f" {cpu * 1e6:>8.1f} {wall * 1e6:>8.1f} {hits / ((hits + misses) or 1):>8.1%}"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    """Run the benchmark for each way of looking up a user, and prepare threshold."""
+    user_cache.enabled = False
+    print(  # noqa: T201
+        f"{'prepare':>7} {'lookup':<15} {'CPU us':>8} {'wall us':>8} {'cached':>8}"
+    )
+    with tempfile.TemporaryDirectory() as directory:
+        if args.url:
+            thresholds = args.prepare_thresholds
+        else:
+            thresholds = ["none"]
+            args.url = f"sqlite+aiosqlite:///{Path(directory) / 'benchmark.db'}"
+        for threshold in thresholds:
+            connect_args: dict[str, Any] = {}
+            if args.url.startswith("postgresql"):
+                prepare = None if threshold == "none" else int(threshold)
+                connect_args["prepare_threshold"] = prepare
+            engine = create_async_engine(args.url, connect_args=connect_args)
+            user_ids = await _seed(engine, args.users)
+            AsyncRepository.engine = engine
+            name = f"benchmark-{threshold}"
+            instrument_engine(engine.sync_engine, name)
+            for label, lookup in LOOKUPS.items():
+                row = await _measure(engine, name, lookup, user_ids)
+                print(f"{threshold:>7} {label:<15}{row}")  # noqa: T201
+            await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=str(__doc__).splitlines()[0])
+    parser.add_argument("--url", help="database URL, defaults to a SQLite file")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--prepare-thresholds", nargs="+", default=["none", "0", "5"])
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,90 @@
+"""Benchmark throughput and latency of user inserts across batch windows.
+
+Compares committing every user in its own transaction, like `POST /users` does by
+default, with group-committing concurrent users through `BatchWriter`:
+
+    uv run python -m benchmarks.write_batching --url postgresql+psycopg://...
+
+Without `--url`, a SQLite file in a temporary directory stands in for PostgreSQL.
+"""
+
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+
+from app.models import User
+from app.repository import AsyncRepository, Base
+from app.repository.writer import BatchWriter
+
+
+async def _unbatched(user: User) -> None:
+    """Insert and commit a single user, like `POST /users` without batching."""
+    async with AsyncSession(AsyncRepository.engine) as session, session.begin():
+        await AsyncRepository.add_user(session, user)
+
+
+async def _run(
+    engine: AsyncEngine, args: argparse.Namespace, window: float | None
+) -> str:
+    """Insert `--requests` users from `--concurrency` clients, and report timings."""
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
+        await connection.run_sync(Base.metadata.create_all)
+    writer = None
+    if window is not None:
+        writer = BatchWriter(args.batch_size, window / 1000)
+        writer.start()
+    save = writer.save if writer else _unbatched
+    latencies: list[float] = []
+    remaining = iter(range(args.requests))
+
+    async def client() -> None:
+        for i in remaining:
+            start = time.perf_counter()
+            await save(User(name=f"user{i}", fullname="Benchmark User"))
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+    if writer:
+        await writer.stop()
+    quantiles = statistics.quantiles(latencies, n=100)
+    label = "unbatched" if window is None else f"{window:g} ms"
+    return (
+        f"{label:>10} {args.requests / elapsed:>10.0f}/s"
+        f" {quantiles[49] * 1000:>8.2f} {quantiles[98] * 1000:>8.2f}"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    """Run the benchmark for each batch window."""
+    with tempfile.TemporaryDirectory() as directory:
+        if args.url:
+            engine = create_async_engine(args.url, pool_size=args.concurrency)
+        else:
+            # SQLite allows a single writer at a time:
+            path = Path(directory) / "benchmark.db"
+            engine = create_async_engine(f"sqlite+aiosqlite:///{path}", pool_size=1)
+        AsyncRepository.engine = engine
+        print(f"{'window':>10} {'throughput':>12} {'p50 ms':>8} {'p99 ms':>8}")  # noqa: T201
+        for window in [None, *args.windows]:
+            print(await _run(engine, args, window))  # noqa: T201
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=str(__doc__).splitlines()[0])
+    parser.add_argument("--url", help="database URL, defaults to a SQLite file")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument(
+        "--windows", type=float, nargs="+", default=[0, 1, 2, 5, 10, 20]
+    )
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,49 @@
+"""Fixtures shared by the fast tests."""
+
+from collections.abc import AsyncIterator, Awaitable, Callable
+
+import pytest
+from pytest_mock import MockFixture
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import StaticPool
+
+from app.repository import AsyncRepository, Base
+from app.repository.cache import user_cache
+from app.repository.repository import UserDAO
+
+CountUsers = Callable[[], Awaitable[int | None]]
+
+
+@pytest.fixture
+def anyio_backend() -> str:
+    """Run the async tests on asyncio only."""
+    return "asyncio"
+
+
+@pytest.fixture(autouse=True)
+def clear_user_cache() -> None:
+    """Start every test with an empty user cache."""
+    user_cache.clear()
+
+
+@pytest.fixture
+async def engine(mocker: MockFixture) -> AsyncIterator[AsyncEngine]:
+    """Fixture to back the repository with an in-memory SQLite database."""
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    mocker.patch.object(AsyncRepository, "engine", engine, create=True)
+    yield engine
+    await engine.dispose()
+
+
+@pytest.fixture
+def count_users(engine: AsyncEngine) -> CountUsers:
+    """Fixture counting the users committed to the `engine` database."""
+
+    async def count() -> int | None:
+        async with engine.connect() as connection:
+            return await connection.scalar(select(func.count()).select_from(UserDAO))
+
+    return count
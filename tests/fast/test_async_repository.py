@@ -0,0 +1,410 @@
+"""Test asynchronous repository."""
+
+from collections.abc import AsyncIterator
+from pathlib import Path
+from uuid import uuid4
+
+import pytest
+from pytest_mock import MockFixture
+from sqlalchemy import insert, text, update
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+from sqlalchemy.pool import QueuePool, StaticPool
+
+from app.models import User
+from app.repository import AsyncRepository, Base
+from app.repository.cache import user_cache
+from app.repository.limiter import ConcurrencyLimiter, OverloadedError
+from app.repository.replicas import ReplicaSet
+from app.repository.repository import UserDAO, user_partition
+
+from .conftest import CountUsers
+
+pytestmark = pytest.mark.anyio
+
+PARTITIONS = ("user_account_p0", "user_account_p1")
+
+
+def test_create_engine_uses_pool_settings(mocker: MockFixture) -> None:
+    """Should create one pooled async engine configured from the environment."""
+    instrument_engine = mocker.patch(
+        "app.repository.async_repository.instrument_engine"
+    )
+    create_async_engine = mocker.patch(
+        "app.repository.async_repository.create_async_engine"
+    )
+    mocker.patch("app.repository.repository.DATABASE_POOL_SIZE", 20)
+    mocker.patch.object(AsyncRepository, "replicas")
+
+    AsyncRepository.create_engine()
+
+    create_async_engine.assert_called_once()
+    assert create_async_engine.call_args.kwargs["pool_size"] == 20  # noqa: PLR2004
+    assert AsyncRepository.engine is create_async_engine.return_value
+    instrument_engine.assert_called_once_with(
+        AsyncRepository.engine.sync_engine, "primary"
+    )
+    assert AsyncRepository.replicas.engines == []
+
+
+def test_create_engine_with_replicas(mocker: MockFixture) -> None:
+    """Should create one pooled async engine per read replica."""
+    instrument_engine = mocker.patch(
+        "app.repository.async_repository.instrument_engine"
+    )
+    create_async_engine = mocker.patch(
+        "app.repository.async_repository.create_async_engine"
+    )
+    urls = ["postgresql+psycopg://replica0/db", "postgresql+psycopg://replica1/db"]
+    mocker.patch("app.repository.async_repository.DATABASE_REPLICA_URLS", urls)
+    mocker.patch.object(AsyncRepository, "replicas")
+
+    AsyncRepository.create_engine()
+
+    assert [call.args[0] for call in create_async_engine.call_args_list[1:]] == urls
+    assert len(AsyncRepository.replicas.engines) == len(urls)
+    assert [call.args[1] for call in instrument_engine.call_args_list] == [
+        "primary",
+        "replica0",
+        "replica1",
+    ]
+
+
+async def test_dispose_engine(mocker: MockFixture) -> None:
+    """Should dispose of the pooled connections on shutdown."""
+    engine = mocker.patch.object(
+        AsyncRepository, "engine", mocker.AsyncMock(), create=True
+    )
+    replicas = mocker.patch.object(AsyncRepository, "replicas", mocker.AsyncMock())
+
+    await AsyncRepository.dispose_engine()
+    replicas.dispose.assert_awaited_once_with()
+
+    engine.dispose.assert_awaited_once_with()
+
+
+async def test_reset_after_fork(mocker: MockFixture) -> None:
+    """Should give the child new pools for the primary and the replicas."""
+    primary = create_async_engine("sqlite+aiosqlite://")
+    replica = create_async_engine("sqlite+aiosqlite://")
+    mocker.patch.object(AsyncRepository, "engine", primary, create=True)
+    mocker.patch.object(AsyncRepository, "replicas", ReplicaSet([replica]))
+    pools = [primary.pool, replica.pool]
+
+    AsyncRepository.reset_after_fork()
+
+    assert primary.pool is not pools[0]
+    assert replica.pool is not pools[1]
+
+
+def test_reset_after_fork_without_engine(mocker: MockFixture) -> None:
+    """Should do nothing in a process that has no engine."""
+    mocker.patch.object(AsyncRepository, "engine", create=True)
+    del AsyncRepository.engine
+
+    AsyncRepository.reset_after_fork()
+
+
+async def test_create_schema_versions_users_on_sqlite(mocker: MockFixture) -> None:
+    """Should create the tables, and increment versions like PostgreSQL does."""
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    mocker.patch.object(AsyncRepository, "engine", engine, create=True)
+
+    await AsyncRepository.create_schema()
+    # Creating the schema again keeps the users and the trigger:
+    await AsyncRepository.create_schema()
+    a, b = User(name="a", fullname="A"), User(name="b", fullname="B")
+    async with AsyncRepository.transaction() as session:
+        await AsyncRepository.add_users(session, [a, b])
+    async with AsyncRepository.transaction() as session:
+        await session.execute(update(UserDAO).values(fullname="C"))
+        # An update setting the version, as the ORM does, is left alone:
+        await session.execute(
+            update(UserDAO).where(UserDAO.id == b.id).values(version=5)
+        )
+
+    async with AsyncRepository.read_session() as session:
+        users = await AsyncRepository.get_users(session, [a.id, b.id])
+    assert users[a.id].version == 2  # noqa: PLR2004
+    assert users[b.id].version == 5  # noqa: PLR2004
+    await engine.dispose()
+
+
+async def test_get_session_commits_once(count_users: CountUsers) -> None:
+    """Should commit all work done in the request when it succeeds."""
+    sessions = AsyncRepository.get_session()
+    await AsyncRepository.add_user(
+        await anext(sessions), User(name="testuser", fullname="Test User")
+    )
+    with pytest.raises(StopAsyncIteration):
+        await anext(sessions)
+
+    assert await count_users() == 1
+
+
+async def test_get_session_rolls_back_on_error(count_users: CountUsers) -> None:
+    """Should roll back all work done in the request when it raises."""
+    sessions = AsyncRepository.get_session()
+    await AsyncRepository.add_user(
+        await anext(sessions), User(name="testuser", fullname="Test User")
+    )
+    with pytest.raises(RuntimeError):
+        await sessions.athrow(RuntimeError("request failed"))
+
+    assert await count_users() == 0
+
+
+async def test_add_users_rolls_back_only_the_failed_batch(
+    engine: AsyncEngine, count_users: CountUsers
+) -> None:
+    """Should insert a batch in one go, rolling back only a batch that fails."""
+    users = [User(name=f"test{i}", fullname="") for i in range(3)]
+
+    async with AsyncSession(engine) as session, session.begin():
+        await AsyncRepository.add_users(session, users)
+        with pytest.raises(IntegrityError):
+            await AsyncRepository.add_users(
+                session, [User(name="test", fullname=""), users[0]]
+            )
+
+    assert await count_users() == 3  # noqa: PLR2004
+
+
+async def test_get_user(engine: AsyncEngine) -> None:
+    """Should retrieve a user by ID, or None if there is no such user."""
+    user = User(name="testuser", fullname="Test User")
+    async with AsyncSession(engine) as session, session.begin():
+        await AsyncRepository.add_user(session, user)
+
+    async with AsyncSession(engine) as session:
+        assert await AsyncRepository.get_user(session, user.id) == user
+        assert (
+            await AsyncRepository.get_user(session, User(name="", fullname="").id)
+            is None
+        )
+
+
+async def test_list_and_stream_users(engine: AsyncEngine) -> None:
+    """Should page and stream through all users in primary key order."""
+    async with AsyncSession(engine) as session, session.begin():
+        await AsyncRepository.add_users(
+            session, [User(name=f"test{i}", fullname="") for i in range(5)]
+        )
+
+    async with AsyncSession(engine) as session:
+        first_page = await AsyncRepository.list_users(session, 3)
+        second_page = await AsyncRepository.list_users(session, 3, first_page[-1].id)
+    streamed = [user async for user in AsyncRepository.stream_users(2)]
+
+    assert [user.id for user in first_page + second_page] == [
+        user.id for user in streamed
+    ]
+    assert len(streamed) == 5  # noqa: PLR2004
+    assert streamed == sorted(streamed, key=lambda user: user.id)
+
+
+@pytest.fixture
+async def partitioned_engine(
+    tmp_path: Path, mocker: MockFixture
+) -> AsyncIterator[AsyncEngine]:
+    """Fixture standing in for a user table split into two partitions."""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'users.db'}")
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+        await connection.execute(
+            text("CREATE TABLE user_account_p0 AS SELECT * FROM user_account")
+        )
+        await connection.execute(
+            text("CREATE TABLE user_account_p1 AS SELECT * FROM user_account")
+        )
+    mocker.patch.object(AsyncRepository, "engine", engine, create=True)
+    mocker.patch.object(
+        AsyncRepository, "get_user_partitions", return_value=list(PARTITIONS)
+    )
+    yield engine
+    await engine.dispose()
+
+
+def _checked_out(engine: AsyncEngine) -> int:
+    """Count the connections of an engine in use."""
+    assert isinstance(engine.pool, QueuePool)
+    return engine.pool.checkedout()
+
+
+async def _add_to_partition(engine: AsyncEngine, partition: str, count: int) -> None:
+    """Add users to one partition of the user table."""
+    async with engine.begin() as connection:
+        await connection.execute(
+            insert(user_partition(partition)),
+            [
+                {"id": uuid4(), "name": f"{partition}{i}", "fullname": "", "version": 1}
+                for i in range(count)
+            ],
+        )
+
+
+@pytest.mark.usefixtures("engine")
+async def test_get_user_partitions_without_partitioning() -> None:
+    """Should take a table that is not partitioned as its only partition."""
+    assert await AsyncRepository.get_user_partitions() == ["user_account"]
+
+
+async def test_scan_users_reads_all_partitions(
+    partitioned_engine: AsyncEngine, mocker: MockFixture
+) -> None:
+    """Should stream the users of every partition, in order within each."""
+    mocker.patch("app.repository.async_repository.DATABASE_SCAN_PARALLELISM", 1)
+    await _add_to_partition(partitioned_engine, PARTITIONS[0], 5)
+    await _add_to_partition(partitioned_engine, PARTITIONS[1], 3)
+
+    scanned = [user async for user in AsyncRepository.scan_users(2)]
+
+    for partition in PARTITIONS:
+        users = [user for user in scanned if user.name.startswith(partition)]
+        assert users == sorted(users, key=lambda user: user.id)
+    assert len(scanned) == 8  # noqa: PLR2004
+    assert _checked_out(partitioned_engine) == 0
+
+
+async def test_scan_users_stopped_early(partitioned_engine: AsyncEngine) -> None:
+    """Should stop the scans and return their connections when the stream closes."""
+    await _add_to_partition(partitioned_engine, PARTITIONS[0], 5)
+    await _add_to_partition(partitioned_engine, PARTITIONS[1], 5)
+
+    users = AsyncRepository.scan_users(1)
+    await anext(users)
+    await users.aclose()
+
+    assert _checked_out(partitioned_engine) == 0
+
+
+async def test_streams_go_through_the_limiter(
+    partitioned_engine: AsyncEngine, mocker: MockFixture
+) -> None:
+    """Should count the connections of scans and streams like sessions."""
+    mocker.patch("app.repository.async_repository.DATABASE_SCAN_PARALLELISM", 1)
+    limiter = ConcurrencyLimiter(1, 0, 1)
+    mocker.patch.object(AsyncRepository, "limiter", limiter)
+    await _add_to_partition(partitioned_engine, PARTITIONS[0], 5)
+
+    users = AsyncRepository.scan_users(1)
+    await anext(users)
+    assert limiter.active == 1
+    with pytest.raises(OverloadedError):
+        await anext(AsyncRepository.stream_users(1))
+    await users.aclose()
+
+    assert limiter.active == 0
+
+
+@pytest.mark.usefixtures("partitioned_engine")
+async def test_scan_users_raises_when_a_scan_fails(mocker: MockFixture) -> None:
+    """Should raise the error of a failed scan, rather than end the stream early."""
+    mocker.patch.object(
+        AsyncRepository, "get_user_partitions", return_value=["missing"]
+    )
+
+    with pytest.raises(OperationalError, match="no such table"):
+        [user async for user in AsyncRepository.scan_users(2)]
+
+
+@pytest.mark.usefixtures("engine")
+async def test_ping() -> None:
+    """Should reach the database with a single cheap query."""
+    await AsyncRepository.ping()
+
+
+async def test_get_user_reads_through_cache(engine: AsyncEngine) -> None:
+    """Should serve repeated lookups from the cache until the user is written."""
+    user = User(name="testuser", fullname="Test User")
+
+    async with AsyncSession(engine) as session:
+        assert await AsyncRepository.get_user(session, user.id) is None
+    async with AsyncSession(engine) as session, session.begin():
+        await AsyncRepository.add_user(session, user)
+    async with AsyncSession(engine) as session:
+        assert await AsyncRepository.get_user(session, user.id) == user
+        assert await AsyncRepository.get_user(session, user.id) == user
+
+    assert user_cache.hits == 1
+    assert user_cache.misses == 2  # noqa: PLR2004
+
+
+async def test_write_invalidates_cache_on_commit(engine: AsyncEngine) -> None:
+    """Should drop written users from the cache once committed, not before."""
+    user = User(name="testuser", fullname="Test User")
+
+    async with AsyncSession(engine) as session, session.begin():
+        await AsyncRepository.add_users(session, [user])
+        # A read before the commit caches the user as missing:
+        user_cache.set(user.id, None)
+    async with AsyncSession(engine) as session:
+        assert await AsyncRepository.get_user(session, user.id) == user
+
+
+async def test_get_users(engine: AsyncEngine) -> None:
+    """Should retrieve many users in one query, caching found and missing IDs."""
+    users = [User(name=f"test{i}", fullname="") for i in range(3)]
+    missing_id = User(name="", fullname="").id
+    async with AsyncSession(engine) as session, session.begin():
+        await AsyncRepository.add_users(session, users)
+
+    async with AsyncSession(engine) as session:
+        assert await AsyncRepository.get_user(session, users[0].id) == users[0]
+        found = await AsyncRepository.get_users(
+            session, [users[0].id, users[1].id, missing_id]
+        )
+        assert found == {users[0].id: users[0], users[1].id: users[1]}
+        # Everything is cached now, so no query is needed:
+        found = await AsyncRepository.get_users(session, [users[1].id, missing_id])
+        assert found == {users[1].id: users[1]}
+
+    assert user_cache.hits == 3  # noqa: PLR2004
+
+
+async def test_search_users(engine: AsyncEngine) -> None:
+    """Should filter by exact name, name prefix and fullname substring."""
+    users = [
+        User(name="alice", fullname="Alice Liddell"),
+        User(name="alison", fullname="Alison Hargreaves"),
+        User(name="al_bert", fullname="Albert 100% Einstein"),
+        User(name="bob", fullname="Bob Alison"),
+    ]
+    async with AsyncSession(engine) as session, session.begin():
+        await AsyncRepository.add_users(session, users)
+
+    async def search(**filters: str) -> set[str]:
+        async with AsyncSession(engine) as session:
+            found = await AsyncRepository.search_users(session, 10, None, **filters)
+        return {user.name for user in found}
+
+    assert await search(name="alice") == {"alice"}
+    assert await search(prefix="ali") == {"alice", "alison"}
+    assert await search(prefix="al_") == {"al_bert"}
+    assert await search(q="ALISON") == {"alison", "bob"}
+    assert await search(q="0% e") == {"al_bert"}
+    assert await search(prefix="ali", q="liddell") == {"alice"}
+
+    async with AsyncSession(engine) as session:
+        first_page = await AsyncRepository.search_users(session, 1, prefix="ali")
+        second_page = await AsyncRepository.search_users(
+            session, 1, first_page[0].id, prefix="ali"
+        )
+    assert {first_page[0].name, second_page[0].name} == {"alice", "alison"}
+
+
+async def test_get_user_version(engine: AsyncEngine) -> None:
+    """Should get the version of a user, from the cache if it is there."""
+    user = User(name="test", fullname="Test")
+    async with AsyncSession(engine) as session, session.begin():
+        await AsyncRepository.add_user(session, user)
+
+    async with AsyncSession(engine) as session:
+        assert await AsyncRepository.get_user_version(session, user.id) == 1
+        assert await AsyncRepository.get_user_version(session, uuid4()) is None
+        await AsyncRepository.get_user(session, user.id)
+        await AsyncRepository.get_user(session, missing := uuid4())
+        await session.execute(update(UserDAO).values(version=2))
+        # Served from the cache, consistent with the cached user:
+        assert await AsyncRepository.get_user_version(session, user.id) == 1
+        assert await AsyncRepository.get_user_version(session, missing) is None
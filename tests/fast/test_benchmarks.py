@@ -0,0 +1,43 @@
+"""Test the comparison of benchmark results with a baseline."""
+
+from typing import Any
+
+from benchmarks.in_process import compare
+
+
+def _result(
+    scenario: str = "GET /users", p95_ms: float = 10, throughput: float = 1000
+) -> dict[str, Any]:
+    """Make the result of a scenario on SQLite at 1000 rows."""
+    return {
+        "backend": "sqlite",
+        "scenario": scenario,
+        "rows": 1000,
+        "p95_ms": p95_ms,
+        "throughput": throughput,
+    }
+
+
+def test_compare_within_threshold() -> None:
+    """Should not report changes within the threshold, in either direction."""
+    baseline = [_result()]
+
+    assert compare([_result(p95_ms=11.9, throughput=801)], baseline, 0.2) == []
+    assert compare([_result(p95_ms=5, throughput=2000)], baseline, 0.2) == []
+
+
+def test_compare_reports_regressions() -> None:
+    """Should report a higher p95 latency and a lower throughput beyond it."""
+    regressions = compare([_result(p95_ms=12.1, throughput=799)], [_result()], 0.2)
+
+    assert regressions == [
+        "GET /users on sqlite at 1000 rows: p95 10.00 -> 12.10 ms",
+        "GET /users on sqlite at 1000 rows: throughput 1000 -> 799/s",
+    ]
+
+
+def test_compare_skips_results_missing_from_baseline() -> None:
+    """Should only compare results that are in the baseline."""
+    results = [_result(scenario="GET /health", p95_ms=100, throughput=1)]
+
+    assert compare(results, [_result()], 0.2) == []
@@ -0,0 +1,95 @@
+"""Test user cache."""
+
+from uuid import uuid4
+
+from pytest_mock import MockFixture
+
+from app.models import User
+from app.repository.cache import UserCache
+
+
+def test_get_miss_then_hit() -> None:
+    """Should count a miss before the user is cached and a hit after."""
+    cache = UserCache(maxsize=10, ttl=60, negative_ttl=5)
+    user = User(name="testuser", fullname="Test User")
+
+    assert cache.get(user.id) == (False, None)
+    cache.set(user.id, user)
+    assert cache.get(user.id) == (True, user)
+    assert cache.stats() == {
+        "enabled": True,
+        "size": 1,
+        "maxsize": 10,
+        "hits": 1,
+        "misses": 1,
+        "evictions": 0,
+    }
+
+
+def test_negative_entry() -> None:
+    """Should cache a missing user as None."""
+    cache = UserCache(maxsize=10, ttl=60, negative_ttl=5)
+    user_id = uuid4()
+
+    cache.set(user_id, None)
+
+    assert cache.get(user_id) == (True, None)
+
+
+def test_entries_expire(mocker: MockFixture) -> None:
+    """Should expire users after the TTL and misses after the negative TTL."""
+    monotonic = mocker.patch("app.repository.cache.time.monotonic", return_value=0)
+    cache = UserCache(maxsize=10, ttl=60, negative_ttl=5)
+    user = User(name="testuser", fullname="Test User")
+    missing_id = uuid4()
+    cache.set(user.id, user)
+    cache.set(missing_id, None)
+
+    monotonic.return_value = 10
+    assert cache.get(user.id) == (True, user)
+    assert cache.get(missing_id) == (False, None)
+
+    monotonic.return_value = 61
+    assert cache.get(user.id) == (False, None)
+    assert cache.stats()["size"] == 0
+
+
+def test_least_recently_used_is_evicted() -> None:
+    """Should evict the least recently used user when full."""
+    cache = UserCache(maxsize=2, ttl=60, negative_ttl=5)
+    users = [User(name=f"test{i}", fullname="") for i in range(3)]
+    cache.set(users[0].id, users[0])
+    cache.set(users[1].id, users[1])
+    cache.get(users[0].id)
+
+    cache.set(users[2].id, users[2])
+
+    assert cache.get(users[1].id) == (False, None)
+    assert cache.get(users[0].id) == (True, users[0])
+    assert cache.stats()["evictions"] == 1
+
+
+def test_invalidate_and_clear() -> None:
+    """Should drop invalidated users, and everything on clear."""
+    cache = UserCache(maxsize=10, ttl=60, negative_ttl=5)
+    users = [User(name=f"test{i}", fullname="") for i in range(2)]
+    for user in users:
+        cache.set(user.id, user)
+
+    cache.invalidate(users[0].id)
+    assert cache.get(users[0].id) == (False, None)
+    assert cache.get(users[1].id) == (True, users[1])
+
+    cache.clear()
+    assert cache.stats()["size"] == cache.stats()["hits"] == 0
+
+
+def test_disabled() -> None:
+    """Should neither cache nor count anything when disabled."""
+    cache = UserCache(maxsize=10, ttl=60, negative_ttl=5, enabled=False)
+    user = User(name="testuser", fullname="Test User")
+
+    cache.set(user.id, user)
+
+    assert cache.get(user.id) == (False, None)
+    assert cache.stats()["misses"] == 0
@@ -0,0 +1,172 @@
+"""Test response compression."""
+
+import gzip
+import zlib
+from collections.abc import AsyncIterator
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.applications import Starlette
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+from starlette.types import Message, Receive, Scope, Send
+
+from app.compression import CompressionMiddleware, choose_encoding
+
+BODY = b"x" * 2000
+
+
+async def _stream() -> AsyncIterator[bytes]:
+    """Stream the body in two chunks, with an empty one in between."""
+    yield BODY
+    yield b""
+    yield BODY
+
+
+async def _receive() -> Message:
+    """Receive an empty request, for apps that never read it."""
+    return {"type": "http.request", "body": b""}
+
+
+def _client(*, enabled: bool = True) -> TestClient:
+    """Create a client for an app with large, small and streamed responses."""
+    app = Starlette(
+        routes=[
+            Route(
+                "/large",
+                lambda _: Response(
+                    BODY, media_type="application/json", headers={"ETag": '"1"'}
+                ),
+            ),
+            Route("/small", lambda _: Response(b"{}", media_type="application/json")),
+            Route("/image", lambda _: Response(BODY, media_type="image/png")),
+            Route(
+                "/stream",
+                lambda _: StreamingResponse(_stream(), media_type="text/csv"),
+            ),
+            Route(
+                "/stream-sized",
+                lambda _: StreamingResponse(
+                    _stream(),
+                    media_type="text/csv",
+                    headers={"Content-Length": str(len(BODY) * 2)},
+                ),
+            ),
+        ],
+    )
+    app.add_middleware(CompressionMiddleware, minimum_size=1000, enabled=enabled)
+    return TestClient(app)
+
+
+@pytest.mark.parametrize(
+    ("accept_encoding", "encoding"),
+    [
+        ("gzip", "gzip"),
+        ("gzip, deflate, br", "gzip"),
+        ("br;q=1.0, gzip;q=0.5", "gzip"),
+        ("GZIP", "gzip"),
+        ("gzip;q=0", None),
+        ("gzip;q=invalid", None),
+        ("identity", None),
+        ("", None),
+    ],
+)
+def test_choose_encoding(accept_encoding: str, encoding: str | None) -> None:
+    """Should choose a supported encoding the client accepts."""
+    assert choose_encoding(accept_encoding) == encoding
+
+
+def test_large_response_is_compressed() -> None:
+    """Should compress a response of at least the minimum size."""
+    response = _client().get("/large", headers={"Accept-Encoding": "gzip"})
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.headers["ETag"] == 'W/"1"'
+    assert int(response.headers["Content-Length"]) < len(BODY)
+    assert response.content == BODY
+
+
+@pytest.mark.parametrize("path", ["/small", "/image"])
+def test_response_is_not_compressed(path: str) -> None:
+    """Should not compress small responses or binary formats."""
+    response = _client().get(path, headers={"Accept-Encoding": "gzip"})
+
+    assert "Content-Encoding" not in response.headers
+
+
+@pytest.mark.parametrize("path", ["/stream", "/stream-sized"])
+def test_streamed_response_is_compressed(path: str) -> None:
+    """Should compress streamed responses chunk by chunk."""
+    with _client().stream("GET", path, headers={"Accept-Encoding": "gzip"}) as response:
+        raw = b"".join(response.iter_raw())
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "Content-Length" not in response.headers
+    assert gzip.decompress(raw) == BODY * 2
+
+
+@pytest.mark.anyio
+async def test_streamed_chunks_are_sent_right_away() -> None:
+    """Should send each streamed chunk compressed in full, not held back."""
+    sent: list[Message] = []
+
+    async def app(_: Scope, __: Receive, send: Send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-type", b"text/csv")],
+            }
+        )
+        await send(
+            {"type": "http.response.body", "body": b"id,name\n", "more_body": True}
+        )
+        await send({"type": "http.response.body", "body": b"", "more_body": True})
+        await send({"type": "http.response.body", "body": b"1,a\n", "more_body": True})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message: Message) -> None:
+        sent.append(message)
+
+    scope = {"type": "http", "headers": [(b"accept-encoding", b"gzip")]}
+    await CompressionMiddleware(app)(scope, _receive, send)
+
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    assert [decompressor.decompress(message["body"]) for message in sent[1:]] == [
+        b"id,name\n",
+        b"1,a\n",
+        b"",
+    ]
+
+
+def test_compression_not_accepted_or_disabled() -> None:
+    """Should not compress if the client does not accept it, or if disabled."""
+    response = _client().get("/large", headers={"Accept-Encoding": "identity"})
+    assert "Content-Encoding" not in response.headers
+
+    response = _client(enabled=False).get("/large", headers={"Accept-Encoding": "gzip"})
+    assert "Content-Encoding" not in response.headers
+
+
+@pytest.mark.anyio
+async def test_other_messages_are_passed_through() -> None:
+    """Should pass on messages that are not part of the response body."""
+    sent: list[Message] = []
+
+    async def app(_: Scope, __: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.trailers", "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def send(message: Message) -> None:
+        sent.append(message)
+
+    scope = {"type": "http", "headers": [(b"accept-encoding", b"gzip")]}
+    await CompressionMiddleware(app)(scope, _receive, send)
+
+    assert [message["type"] for message in sent] == [
+        "http.response.trailers",
+        "http.response.start",
+        "http.response.body",
+    ]
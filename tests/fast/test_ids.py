@@ -0,0 +1,49 @@
+"""Test user IDs."""
+
+from uuid import UUID
+
+from pytest_mock import MockFixture
+
+from app.models import User
+from app.models.ids import new_user_id, uuid7
+
+
+def test_uuid7_layout(mocker: MockFixture) -> None:
+    """Should put the millisecond timestamp first and set version and variant."""
+    timestamp_ms = 1_700_000_000_123
+    mocker.patch(
+        "app.models.ids.time.time_ns", return_value=timestamp_ms * 1_000_000 + 456_789
+    )
+
+    user_id = uuid7()
+
+    assert user_id.version == 7  # noqa: PLR2004
+    assert user_id.variant == "specified in RFC 4122"
+    assert user_id.int >> 80 == timestamp_ms
+
+
+def test_uuid7_is_time_ordered(mocker: MockFixture) -> None:
+    """Should sort IDs generated in later milliseconds after earlier ones."""
+    time_ns = mocker.patch("app.models.ids.time.time_ns")
+    ids = []
+    for ms in range(100):
+        time_ns.return_value = (1_700_000_000_000 + ms) * 1_000_000
+        ids.append(uuid7())
+
+    assert ids == sorted(ids)
+
+
+def test_new_user_id_version(mocker: MockFixture) -> None:
+    """Should generate version 7 IDs by default and version 4 IDs if configured."""
+    assert new_user_id().version == 7  # noqa: PLR2004
+    assert User(name="testuser", fullname="Test User").id.version == 7  # noqa: PLR2004
+
+    mocker.patch("app.models.ids.USER_ID_VERSION", "4")
+    assert new_user_id().version == 4  # noqa: PLR2004
+
+
+def test_existing_ids_are_accepted() -> None:
+    """Should keep accepting existing version 4 IDs."""
+    user_id = UUID("9f1c5c1e-2b6a-4d8e-9a51-0c3c2f7f4a10")
+
+    assert User(id=user_id, name="testuser", fullname="Test User").id == user_id
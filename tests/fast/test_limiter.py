@@ -0,0 +1,151 @@
+"""Test load shedding in front of the connection pool."""
+
+import asyncio
+import time
+from collections import Counter
+from collections.abc import AsyncIterator
+from pathlib import Path
+from typing import Any
+from uuid import UUID, uuid4
+
+import httpx
+import pytest
+from pytest_mock import MockFixture
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+
+from app import api
+from app.metrics import render
+from app.repository import AsyncRepository, Base
+from app.repository.limiter import ConcurrencyLimiter, OverloadedError
+from app.repository.writer import BatchWriter
+
+pytestmark = pytest.mark.anyio
+
+# Seconds the stand-in database takes to answer every query:
+QUERY_TIME = 0.3
+
+
+async def test_acquire_within_capacity() -> None:
+    """Should let requests through at once up to the capacity."""
+    limiter = ConcurrencyLimiter(2, 0, 1)
+
+    async with limiter.acquire(), limiter.acquire():
+        assert limiter.active == 2  # noqa: PLR2004
+
+    assert limiter.active == 0
+
+
+async def test_acquire_waits_in_queue() -> None:
+    """Should let a queued request through once capacity is freed."""
+    limiter = ConcurrencyLimiter(1, 1, 1)
+    admitted = asyncio.Event()
+
+    async def queued() -> None:
+        async with limiter.acquire():
+            admitted.set()
+
+    async with limiter.acquire():
+        task = asyncio.create_task(queued())
+        await asyncio.sleep(0)
+        assert limiter.waiting == 1
+        assert not admitted.is_set()
+    await task
+
+    assert admitted.is_set()
+    assert limiter.waiting == 0
+
+
+async def test_acquire_rejects_when_queue_is_full() -> None:
+    """Should reject at once rather than queue beyond the queue size."""
+    limiter = ConcurrencyLimiter(1, 0, 1)
+
+    async with limiter.acquire():
+        with pytest.raises(OverloadedError, match="queue is full"):
+            async with limiter.acquire():
+                pass
+
+    assert 'db_requests_rejected_total{reason="queue_full"}' in render()
+
+
+async def test_acquire_rejects_after_timeout() -> None:
+    """Should reject a request that waited in the queue for too long."""
+    limiter = ConcurrencyLimiter(1, 1, 0.01)
+
+    async with limiter.acquire():
+        with pytest.raises(OverloadedError, match="Timed out"):
+            async with limiter.acquire():
+                pass
+
+    assert limiter.waiting == 0
+    assert 'db_requests_rejected_total{reason="timeout"}' in render()
+
+
+@pytest.fixture
+async def slow_engine(
+    tmp_path: Path, mocker: MockFixture
+) -> AsyncIterator[AsyncEngine]:
+    """Fixture standing in for a database answering every query slowly."""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'slow.db'}")
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def connect(connection: Any, _: Any) -> None:
+        connection.create_function("sleep", 1, time.sleep)
+
+    async def get_user(session: AsyncSession, _: UUID) -> None:
+        await session.execute(text("SELECT sleep(:seconds)"), {"seconds": QUERY_TIME})
+
+    mocker.patch.object(AsyncRepository, "engine", engine, create=True)
+    mocker.patch.object(AsyncRepository, "get_user", get_user)
+    yield engine
+    await engine.dispose()
+
+
+@pytest.mark.usefixtures("slow_engine")
+async def test_slow_database_sheds_load(mocker: MockFixture) -> None:
+    """Should reject the requests beyond capacity and queue with 503 quickly."""
+    mocker.patch.object(
+        AsyncRepository, "limiter", ConcurrencyLimiter(2, 2, QUERY_TIME / 3)
+    )
+    transport = httpx.ASGITransport(app=api)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        responses = await asyncio.gather(
+            *(client.get(f"/users/{uuid4()}") for _ in range(8))
+        )
+
+    statuses = Counter(response.status_code for response in responses)
+    assert statuses == {404: 2, 503: 6}
+    for response in responses:
+        if response.status_code == 503:  # noqa: PLR2004
+            assert response.headers["Retry-After"] == "1"
+            assert response.elapsed.total_seconds() < QUERY_TIME
+
+
+async def test_batched_writes_hold_no_session(
+    tmp_path: Path, mocker: MockFixture
+) -> None:
+    """Should batch concurrent writes beyond the limiter's capacity together."""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'users.db'}")
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    mocker.patch.object(AsyncRepository, "engine", engine, create=True)
+    mocker.patch.object(AsyncRepository, "limiter", ConcurrencyLimiter(1, 0, 1))
+    mocker.patch("app.main.USERS_WRITE_BATCHING", new=True)
+    writer = BatchWriter(max_size=100, window=0.1)
+    mocker.patch("app.main.user_writer", writer)
+    add_users = mocker.spy(AsyncRepository, "add_users")
+    writer.start()
+
+    transport = httpx.ASGITransport(app=api)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        responses = await asyncio.gather(
+            *(
+                client.post("/users", json={"name": f"user{i}", "fullname": "User"})
+                for i in range(20)
+            )
+        )
+    await writer.stop()
+    await engine.dispose()
+
+    assert {response.status_code for response in responses} == {200}
+    assert add_users.call_count == 1
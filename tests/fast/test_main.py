@@ -1,28 +1,78 @@
 """Test models."""
 
+import asyncio
+import csv
+import time
+from collections.abc import AsyncIterator, Iterator
 from http import HTTPStatus
 from uuid import UUID, uuid4
 
 import pytest
 from fastapi.testclient import TestClient
 from pytest_mock import MockFixture
+from sqlalchemy.exc import IntegrityError, OperationalError
 
 from app import api
-from app.models.user import User
+from app.main import get_read_session
+from app.models import User, encode_cursor
+from app.repository import AsyncRepository
+from app.responses import UserJSONResponse
+
+
+async def _aiter(users: list[User]) -> AsyncIterator[User]:
+    """Turn a list of users into an async iterator, like a streamed result."""
+    for user in users:
+        yield user
 
 
 @pytest.fixture
-def client() -> TestClient:
+def client(mocker: MockFixture) -> Iterator[TestClient]:
     """Fixture to create a test client for the FastAPI application."""
-    return TestClient(api)
+    session = mocker.MagicMock()
+    api.dependency_overrides[AsyncRepository.get_session] = lambda: session
+    api.dependency_overrides[get_read_session] = lambda: session
+    yield TestClient(api)
+    api.dependency_overrides.clear()
+
+
+@pytest.fixture(autouse=True)
+def schema_check_cache(mocker: MockFixture) -> None:
+    """Start every test with an empty schema check cache."""
+    mocker.patch("app.health._schema_check", None)
 
 
 def test_health_check(client: TestClient, mocker: MockFixture) -> None:
-    """Health check endpoint should return status OK."""
+    """Health check endpoint should return status OK if the database is reachable."""
+    ping = mocker.patch("app.repository.AsyncRepository.ping", return_value=None)
+    check = mocker.patch("app.repository.Repository.check")
+
+    response = client.get("/health")
+    assert response.status_code == HTTPStatus.OK, (
+        f"Health check failed: {response.text}"
+    )
+    assert response.json() == {"status": "ok"}, "Health check response should be 'ok'"
+    ping.assert_awaited_once_with()
+    check.assert_not_called()
+
+
+def test_health_check_database_down(client: TestClient, mocker: MockFixture) -> None:
+    """Health check endpoint should return 503 if the database is not reachable."""
+    mocker.patch(
+        "app.repository.AsyncRepository.ping",
+        side_effect=OperationalError("SELECT 1", None, Exception("refused")),
+    )
+
+    response = client.get("/health")
+    assert response.status_code == HTTPStatus.SERVICE_UNAVAILABLE
+    assert response.json() == {"detail": "Database not reachable."}
+
+
+def test_schema_health_check(client: TestClient, mocker: MockFixture) -> None:
+    """Schema health check endpoint should return status OK."""
     current_database_schema_revision = "revision_1"
     current_head = "revision_1"
     mocker.patch(
-        "app.repository.Repository.get_current_revision",
+        "app.repository.AsyncRepository.get_current_revision",
         return_value=current_database_schema_revision,
     )
     mocker.patch("app.repository.Repository.check", return_value=True)
@@ -30,7 +80,7 @@ def test_health_check(client: TestClient, mocker: MockFixture) -> None:
         "app.repository.Repository.get_current_head", return_value=current_head
     )
 
-    response = client.get("/health")
+    response = client.get("/health/schema")
     assert response.status_code == HTTPStatus.OK, (
         f"Health check failed: {response.text}"
     )
@@ -41,13 +91,15 @@ def test_health_check(client: TestClient, mocker: MockFixture) -> None:
     }, "Health check response should be 'ok'"
 
 
-def test_health_check_no_revision(client: TestClient, mocker: MockFixture) -> None:
-    """Health check endpoint should return 500 if no revision is found."""
+def test_schema_health_check_no_revision(
+    client: TestClient, mocker: MockFixture
+) -> None:
+    """Schema health check endpoint should return 500 if no revision is found."""
     current_database_schema_revision = None
     current_head = "revision_1"
 
     mocker.patch(
-        "app.repository.Repository.get_current_revision",
+        "app.repository.AsyncRepository.get_current_revision",
         return_value=current_database_schema_revision,
     )
     mocker.patch("app.repository.Repository.check", return_value=False)
@@ -55,7 +107,7 @@ def test_health_check_no_revision(client: TestClient, mocker: MockFixture) -> No
         "app.repository.Repository.get_current_head", return_value=current_head
     )
 
-    response = client.get("/health")
+    response = client.get("/health/schema")
     assert response.status_code == HTTPStatus.INTERNAL_SERVER_ERROR
     detail = response.json().get("detail", "")
     assert "Database schema not up to date." in detail
@@ -66,10 +118,47 @@ def test_health_check_no_revision(client: TestClient, mocker: MockFixture) -> No
     assert f"and current head is '{current_head}'" in detail
 
 
+def test_schema_health_check_is_cached(client: TestClient, mocker: MockFixture) -> None:
+    """Schema health check should only run again once the cached result expires."""
+    mocker.patch(
+        "app.repository.AsyncRepository.get_current_revision", return_value="r1"
+    )
+    check = mocker.patch("app.repository.Repository.check", return_value=True)
+    mocker.patch("app.repository.Repository.get_current_head", return_value="r1")
+
+    client.get("/health/schema")
+    client.get("/health/schema")
+    assert check.call_count == 1, "Schema check should be cached"
+
+    mocker.patch("app.health.HEALTH_SCHEMA_TTL", -1)
+    client.get("/health/schema")
+    assert check.call_count == 2, "Schema check should run again after the TTL"  # noqa: PLR2004
+
+
+def test_failed_schema_health_check_is_cached_briefly(
+    client: TestClient, mocker: MockFixture
+) -> None:
+    """A failed schema check should be cached, but only for the failure TTL."""
+    mocker.patch(
+        "app.repository.AsyncRepository.get_current_revision", return_value="r1"
+    )
+    check = mocker.patch("app.repository.Repository.check", return_value=False)
+    mocker.patch("app.repository.Repository.get_current_head", return_value="r2")
+
+    client.get("/health/schema")
+    response = client.get("/health/schema")
+    assert response.status_code == HTTPStatus.INTERNAL_SERVER_ERROR
+    assert check.call_count == 1, "Failed schema check should be cached"
+
+    mocker.patch("app.health.HEALTH_SCHEMA_FAILURE_TTL", -1)
+    client.get("/health/schema")
+    assert check.call_count == 2, "Schema check should run again after the TTL"  # noqa: PLR2004
+
+
 def test_user_save(client: TestClient, mocker: MockFixture) -> None:
     """Should return the user with a valid uuid as id."""
     # Mock the database save method
-    mocker.patch("app.repository.Repository.add_user", return_value=None)
+    mocker.patch("app.repository.AsyncRepository.add_user", return_value=None)
 
     # Create a user instance
     user = {"name": "testuser", "fullname": "Test User"}
@@ -88,7 +177,7 @@ def test_user_list(client: TestClient, mocker: MockFixture) -> None:
     expected_number_of_users = 2
     # Mock the database list method
     mocker.patch(
-        "app.repository.Repository.list_users",
+        "app.repository.AsyncRepository.list_users",
         return_value=[
             User(id=uuid4(), name="test1", fullname="Test One"),
             User(id=uuid4(), name="test2", fullname="Test Two"),
@@ -121,7 +210,7 @@ def test_user_get(client: TestClient, mocker: MockFixture) -> None:
     user_id = uuid4()
 
     mocker.patch(
-        "app.repository.Repository.get_user",
+        "app.repository.AsyncRepository.get_user",
         return_value=User(name="testuser", fullname="Test User", id=user_id),
     )
 
@@ -138,7 +227,7 @@ def test_user_get(client: TestClient, mocker: MockFixture) -> None:
 def test_user_get_not_found(client: TestClient, mocker: MockFixture) -> None:
     """Should return 404 Not Found for non-existing user."""
     user_id = uuid4()
-    mocker.patch("app.repository.Repository.get_user", return_value=None)
+    mocker.patch("app.repository.AsyncRepository.get_user", return_value=None)
 
     response = client.get(f"/users/{user_id}")
     assert response.status_code == HTTPStatus.NOT_FOUND, (
@@ -147,3 +236,491 @@ def test_user_get_not_found(client: TestClient, mocker: MockFixture) -> None:
     assert response.json() == {"detail": "User not found"}, (
         "Response should indicate that the user was not found"
     )
+
+
+def test_lifespan_creates_and_disposes_engine(mocker: MockFixture) -> None:
+    """Should create the engine and check the schema once on startup."""
+    create_engine = mocker.patch("app.repository.AsyncRepository.create_engine")
+    dispose_engine = mocker.patch("app.repository.AsyncRepository.dispose_engine")
+    get_schema_check = mocker.patch("app.main.get_schema_check")
+
+    with TestClient(api) as client:
+        create_engine.assert_called_once_with()
+        # Let the schema check run in the background:
+        assert client.portal is not None
+        client.portal.call(asyncio.sleep, 0.01)
+        get_schema_check.assert_awaited_once_with()
+        dispose_engine.assert_not_called()
+
+    dispose_engine.assert_called_once_with()
+
+
+def test_lifespan_starts_without_database(
+    mocker: MockFixture, caplog: pytest.LogCaptureFixture
+) -> None:
+    """Should start up even if the schema cannot be checked yet."""
+    mocker.patch("app.repository.AsyncRepository.create_engine")
+    mocker.patch("app.repository.AsyncRepository.dispose_engine")
+    mocker.patch(
+        "app.main.get_schema_check",
+        side_effect=OperationalError("SELECT 1", None, Exception("refused")),
+    )
+
+    with TestClient(api) as client:
+        assert client.portal is not None
+        client.portal.call(asyncio.sleep, 0.01)
+
+    assert "Could not check the database schema on startup." in caplog.text
+
+
+def test_user_list_next_cursor(client: TestClient, mocker: MockFixture) -> None:
+    """Should return one page of users and a cursor for the next page."""
+    users = [User(id=uuid4(), name=f"test{i}", fullname="Test") for i in range(3)]
+    list_users = mocker.patch(
+        "app.repository.AsyncRepository.list_users", return_value=users
+    )
+
+    response = client.get("/users", params={"limit": 2})
+
+    assert response.status_code == HTTPStatus.OK, (
+        f"Failed to get user list: {response.text}"
+    )
+    assert [user["id"] for user in response.json()] == [
+        str(users[0].id),
+        str(users[1].id),
+    ]
+    assert response.headers["X-Next-Cursor"] == encode_cursor(users[1].id)
+    # One extra row is fetched to detect the next page:
+    assert list_users.call_args.args[1:] == (3, None)
+
+
+def test_user_list_last_page(client: TestClient, mocker: MockFixture) -> None:
+    """Should continue after the cursor and not return a cursor on the last page."""
+    after = uuid4()
+    list_users = mocker.patch(
+        "app.repository.AsyncRepository.list_users",
+        return_value=[User(id=uuid4(), name="test", fullname="Test")],
+    )
+
+    response = client.get("/users", params={"cursor": encode_cursor(after)})
+
+    assert response.status_code == HTTPStatus.OK, (
+        f"Failed to get user list: {response.text}"
+    )
+    assert len(response.json()) == 1
+    assert "X-Next-Cursor" not in response.headers
+    assert list_users.call_args.args[2] == after
+
+
+def test_user_list_invalid_cursor(client: TestClient) -> None:
+    """Should return 400 Bad Request for a malformed cursor."""
+    response = client.get("/users", params={"cursor": "not-a-cursor"})
+
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert response.json() == {"detail": "Invalid cursor"}
+
+
+def test_user_list_limit_is_bounded(client: TestClient) -> None:
+    """Should reject page sizes above the configured maximum."""
+    response = client.get("/users", params={"limit": 1_000_000})
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+def test_user_export_ndjson(client: TestClient, mocker: MockFixture) -> None:
+    """Should stream all users as newline-delimited JSON."""
+    mocker.patch("app.main.USERS_EXPORT_CHUNK_SIZE", 2)
+    users = [User(id=uuid4(), name=f"test{i}", fullname="Test") for i in range(3)]
+    mocker.patch(
+        "app.repository.AsyncRepository.stream_users", return_value=_aiter(users)
+    )
+
+    response = client.get("/users/export")
+
+    assert response.status_code == HTTPStatus.OK, (
+        f"Failed to export users: {response.text}"
+    )
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = response.text.splitlines()
+    assert [User.model_validate_json(line) for line in lines] == users
+
+
+def test_user_export_csv(client: TestClient, mocker: MockFixture) -> None:
+    """Should stream all users as CSV with a header row."""
+    mocker.patch("app.main.USERS_EXPORT_CHUNK_SIZE", 3)
+    users = [User(id=uuid4(), name=f"test{i}", fullname="Test") for i in range(3)]
+    mocker.patch(
+        "app.repository.AsyncRepository.stream_users", return_value=_aiter(users)
+    )
+
+    response = client.get("/users/export", params={"format": "csv"})
+
+    assert response.status_code == HTTPStatus.OK, (
+        f"Failed to export users: {response.text}"
+    )
+    assert response.headers["content-type"].startswith("text/csv")
+    rows = list(csv.reader(response.text.splitlines()))
+    assert rows[0] == ["id", "name", "fullname"]
+    assert rows[1:] == [[str(user.id), user.name, user.fullname] for user in users]
+
+
+def test_user_export_parallel(client: TestClient, mocker: MockFixture) -> None:
+    """Should scan the partitions of the user table in parallel when asked."""
+    users = [User(id=uuid4(), name=f"test{i}", fullname="Test") for i in range(3)]
+    scan_users = mocker.patch(
+        "app.repository.AsyncRepository.scan_users", return_value=_aiter(users)
+    )
+
+    response = client.get("/users/export", params={"parallel": True})
+
+    assert response.status_code == HTTPStatus.OK
+    scan_users.assert_called_once()
+    lines = response.text.splitlines()
+    assert [User.model_validate_json(line) for line in lines] == users
+
+
+def test_user_bulk_json_array(client: TestClient, mocker: MockFixture) -> None:
+    """Should insert users from a JSON array in chunks and return their IDs."""
+    mocker.patch("app.main.USERS_BULK_CHUNK_SIZE", 2)
+    add_users = mocker.patch(
+        "app.repository.AsyncRepository.add_users", return_value=None
+    )
+    users = [{"name": f"test{i}", "fullname": "Test"} for i in range(3)]
+
+    response = client.post("/users/bulk", json=users)
+
+    assert response.status_code == HTTPStatus.OK, (
+        f"Failed to create users: {response.text}"
+    )
+    assert [len(call.args[1]) for call in add_users.call_args_list] == [2, 1]
+    inserted = [user.id for call in add_users.call_args_list for user in call.args[1]]
+    assert response.json() == {
+        "inserted": [str(user_id) for user_id in inserted],
+        "errors": [],
+    }
+
+
+def test_user_bulk_ndjson(client: TestClient, mocker: MockFixture) -> None:
+    """Should insert users from an NDJSON stream and report failed chunks."""
+    mocker.patch("app.main.USERS_BULK_CHUNK_SIZE", 2)
+    add_users = mocker.patch(
+        "app.repository.AsyncRepository.add_users",
+        side_effect=[None, IntegrityError("INSERT", None, Exception("duplicate key"))],
+    )
+    users = [User(name=f"test{i}", fullname="Test") for i in range(4)]
+    body = "\n".join(user.model_dump_json() for user in users) + "\n\n"
+
+    response = client.post(
+        "/users/bulk",
+        content=body,
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+
+    assert response.status_code == HTTPStatus.OK, (
+        f"Failed to create users: {response.text}"
+    )
+    assert add_users.call_count == 2  # noqa: PLR2004
+    assert response.json() == {
+        "inserted": [str(users[0].id), str(users[1].id)],
+        "errors": [{"chunk": 1, "count": 2, "detail": "duplicate key"}],
+    }
+
+
+def test_user_bulk_invalid_line(client: TestClient, mocker: MockFixture) -> None:
+    """Should reject an NDJSON upload with an invalid line, reporting its number."""
+    add_users = mocker.patch(
+        "app.repository.AsyncRepository.add_users", return_value=None
+    )
+    body = '{"name": "test1", "fullname": "Test"}\n{"name": "test2"}'
+
+    response = client.post(
+        "/users/bulk",
+        content=body,
+        headers={"Content-Type": "application/x-ndjson"},
+    )
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+    assert response.json()["detail"][0]["loc"] == ["body", 2, "fullname"]
+    add_users.assert_not_called()
+
+
+def test_user_bulk_invalid_json(client: TestClient) -> None:
+    """Should reject a body that is not a JSON array of users."""
+    response = client.post("/users/bulk", json={"name": "test"})
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+def test_user_cache_stats(client: TestClient) -> None:
+    """Should report the user cache counters."""
+    response = client.get("/cache/users")
+
+    assert response.status_code == HTTPStatus.OK
+    assert set(response.json()) == {
+        "enabled",
+        "size",
+        "maxsize",
+        "hits",
+        "misses",
+        "evictions",
+    }
+
+
+def test_user_lookup(client: TestClient, mocker: MockFixture) -> None:
+    """Should return found users in request order and report missing IDs."""
+    users = [User(id=uuid4(), name=f"test{i}", fullname="Test") for i in range(2)]
+    missing_id = uuid4()
+    get_users = mocker.patch(
+        "app.repository.AsyncRepository.get_users",
+        return_value={user.id: user for user in users},
+    )
+    ids = [str(users[1].id), str(missing_id), str(users[0].id), str(users[1].id)]
+
+    response = client.post("/users/lookup", json={"ids": ids})
+
+    assert response.status_code == HTTPStatus.OK, (
+        f"Failed to look up users: {response.text}"
+    )
+    assert [user["id"] for user in response.json()["users"]] == [
+        str(users[1].id),
+        str(users[0].id),
+    ]
+    assert response.json()["missing"] == [str(missing_id)]
+    # Duplicate IDs are looked up once:
+    assert get_users.call_args.args[1] == [users[1].id, missing_id, users[0].id]
+
+
+def test_user_lookup_too_many_ids(client: TestClient) -> None:
+    """Should reject lookups of more IDs than the configured maximum."""
+    ids = [str(uuid4()) for _ in range(1001)]
+
+    response = client.post("/users/lookup", json={"ids": ids})
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+def test_user_search(client: TestClient, mocker: MockFixture) -> None:
+    """Should pass the filters on to the repository and paginate the results."""
+    users = [User(id=uuid4(), name=f"test{i}", fullname="Test") for i in range(3)]
+    search_users = mocker.patch(
+        "app.repository.AsyncRepository.search_users", return_value=users
+    )
+
+    response = client.get(
+        "/users/search", params={"prefix": "te", "q": "Tes", "limit": 2}
+    )
+
+    assert response.status_code == HTTPStatus.OK, (
+        f"Failed to search users: {response.text}"
+    )
+    assert len(response.json()) == 2  # noqa: PLR2004
+    assert response.headers["X-Next-Cursor"] == encode_cursor(users[1].id)
+    assert search_users.call_args.args[1:] == (3, None)
+    assert search_users.call_args.kwargs == {"name": None, "prefix": "te", "q": "Tes"}
+
+
+def test_user_search_requires_a_filter(client: TestClient) -> None:
+    """Should return 400 Bad Request if no filter is given."""
+    response = client.get("/users/search")
+
+    assert response.status_code == HTTPStatus.BAD_REQUEST
+    assert response.json() == {"detail": "One of 'name', 'prefix' or 'q' is required"}
+
+
+def test_user_search_substring_too_short(client: TestClient) -> None:
+    """Should reject substrings too short to be served by the trigram index."""
+    response = client.get("/users/search", params={"q": "ab"})
+
+    assert response.status_code == HTTPStatus.UNPROCESSABLE_ENTITY
+
+
+@pytest.mark.parametrize(
+    ("last_write", "primary"),
+    [(None, False), (-60.0, False), (-1.0, True)],
+)
+def test_user_get_reads_own_writes(
+    mocker: MockFixture, last_write: float | None, *, primary: bool
+) -> None:
+    """Should read from the primary only within the read-your-writes window."""
+    mocker.patch("app.main.DATABASE_READ_YOUR_WRITES", 5)
+    read_session = mocker.patch("app.repository.AsyncRepository.read_session")
+    mocker.patch("app.repository.AsyncRepository.get_user", return_value=None)
+    client = TestClient(api)
+    if last_write is not None:
+        client.cookies["last_write"] = str(time.time() + last_write)
+
+    client.get(f"/users/{uuid4()}")
+
+    read_session.assert_called_once_with(primary=primary)
+
+
+@pytest.mark.parametrize("last_write", ["", "abc", "inf"])
+def test_user_get_ignores_invalid_last_write(
+    mocker: MockFixture, last_write: str
+) -> None:
+    """Should read from a replica, not fail, if the last write cookie is invalid."""
+    mocker.patch("app.main.DATABASE_READ_YOUR_WRITES", 5)
+    read_session = mocker.patch("app.repository.AsyncRepository.read_session")
+    mocker.patch("app.repository.AsyncRepository.get_user", return_value=None)
+    client = TestClient(api)
+    client.cookies["last_write"] = last_write
+
+    response = client.get(f"/users/{uuid4()}")
+
+    assert response.status_code == HTTPStatus.NOT_FOUND
+    read_session.assert_called_once_with(primary=False)
+
+
+@pytest.mark.parametrize(("replicas", "pinned"), [([], False), (["replica"], True)])
+def test_user_save_pins_to_primary(
+    client: TestClient, mocker: MockFixture, replicas: list, *, pinned: bool
+) -> None:
+    """Should pin the client to the primary after a write, if there are replicas."""
+    mocker.patch("app.main.DATABASE_READ_YOUR_WRITES", 5)
+    mocker.patch("app.repository.AsyncRepository.add_user", return_value=None)
+    mocker.patch.object(AsyncRepository.replicas, "engines", replicas)
+
+    response = client.post("/users", json={"name": "test", "fullname": "Test"})
+
+    assert ("last_write" in response.cookies) is pinned
+
+
+def test_user_bulk_pins_to_primary(client: TestClient, mocker: MockFixture) -> None:
+    """Should pin the client to the primary after a bulk write too."""
+    mocker.patch("app.main.DATABASE_READ_YOUR_WRITES", 5)
+    mocker.patch("app.repository.AsyncRepository.add_users", return_value=None)
+    mocker.patch.object(AsyncRepository.replicas, "engines", ["replica"])
+
+    response = client.post("/users/bulk", json=[{"name": "test", "fullname": "T"}])
+
+    assert "last_write" in response.cookies
+
+
+def test_user_save_batched(client: TestClient, mocker: MockFixture) -> None:
+    """Should hand the user to the batch writer if write batching is enabled."""
+    mocker.patch("app.main.USERS_WRITE_BATCHING", new=True)
+    save = mocker.patch("app.main.user_writer.save")
+    add_user = mocker.patch("app.repository.AsyncRepository.add_user")
+
+    response = client.post("/users", json={"name": "test", "fullname": "Test"})
+
+    assert response.status_code == HTTPStatus.OK
+    save.assert_awaited_once()
+    assert save.call_args.args[0].id == UUID(response.json()["id"])
+    add_user.assert_not_called()
+
+
+def test_lifespan_starts_and_stops_batch_writer(mocker: MockFixture) -> None:
+    """Should start the batch writer if enabled, and flush it on shutdown."""
+    mocker.patch("app.repository.AsyncRepository.create_engine")
+    mocker.patch("app.repository.AsyncRepository.dispose_engine")
+    mocker.patch("app.main.get_schema_check")
+    mocker.patch("app.main.USERS_WRITE_BATCHING", new=True)
+    start = mocker.patch("app.main.user_writer.start")
+    stop = mocker.patch("app.main.user_writer.stop")
+
+    with TestClient(api):
+        start.assert_called_once_with()
+        stop.assert_not_called()
+
+    stop.assert_awaited_once_with()
+
+
+def test_user_list_is_compressed(client: TestClient, mocker: MockFixture) -> None:
+    """Should compress large pages of users if the client accepts it."""
+    users = [User(id=uuid4(), name=f"test{i}", fullname="Test") for i in range(100)]
+    mocker.patch("app.repository.AsyncRepository.list_users", return_value=users)
+
+    response = client.get("/users", headers={"Accept-Encoding": "gzip"})
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert [User.model_validate(user) for user in response.json()] == users
+
+
+def test_user_list_etag(client: TestClient, mocker: MockFixture) -> None:
+    """Should tag a page of users with the IDs and versions of the users fetched."""
+    users = [User(name=f"test{i}", fullname="Test") for i in range(3)]
+    list_users = mocker.patch(
+        "app.repository.AsyncRepository.list_users", return_value=users
+    )
+
+    etag = client.get("/users", params={"limit": 2}).headers["ETag"]
+    assert client.get("/users", params={"limit": 2}).headers["ETag"] == etag
+    assert client.get("/users").headers["Cache-Control"] == "no-cache"
+    # A user updated, or the one fetched to find the next page left out:
+    users[1].version = 2
+    assert client.get("/users", params={"limit": 2}).headers["ETag"] != etag
+    users[1].version = 1
+    list_users.return_value = users[:2]
+    assert client.get("/users", params={"limit": 2}).headers["ETag"] != etag
+
+
+@pytest.mark.parametrize("tag", ["{}", "W/{}", '"0", {}', "*"])
+def test_user_list_not_modified(
+    client: TestClient, mocker: MockFixture, tag: str
+) -> None:
+    """Should return 304 Not Modified without serializing the users if unchanged."""
+    users = [User(name="test", fullname="Test")]
+    mocker.patch("app.repository.AsyncRepository.list_users", return_value=users)
+    etag = client.get("/users").headers["ETag"]
+    dump = mocker.spy(UserJSONResponse, "render")
+
+    response = client.get("/users", headers={"If-None-Match": tag.format(etag)})
+
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert response.headers["ETag"] == etag
+    assert not response.content
+    dump.assert_not_called()
+
+
+def test_user_list_modified(client: TestClient, mocker: MockFixture) -> None:
+    """Should return the users if the page changed since the given ETag."""
+    mocker.patch("app.repository.AsyncRepository.list_users", return_value=[])
+
+    response = client.get("/users", headers={"If-None-Match": '"0"'})
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["ETag"] != '"0"'
+
+
+def test_user_get_etag(client: TestClient, mocker: MockFixture) -> None:
+    """Should tag a user with its version."""
+    user = User(name="test", fullname="Test")
+    user.version = 3
+    mocker.patch("app.repository.AsyncRepository.get_user", return_value=user)
+
+    response = client.get(f"/users/{user.id}")
+
+    assert response.headers["ETag"] == '"3"'
+    assert response.headers["Cache-Control"] == "no-cache"
+
+
+def test_user_get_not_modified(client: TestClient, mocker: MockFixture) -> None:
+    """Should return 304 Not Modified without loading the user if unchanged."""
+    mocker.patch("app.repository.AsyncRepository.get_user_version", return_value=3)
+    get_user = mocker.patch("app.repository.AsyncRepository.get_user")
+
+    response = client.get(f"/users/{uuid4()}", headers={"If-None-Match": '"3"'})
+
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+    assert response.headers["ETag"] == '"3"'
+    get_user.assert_not_called()
+
+
+@pytest.mark.parametrize("version", [4, None])
+def test_user_get_modified(
+    client: TestClient, mocker: MockFixture, version: int | None
+) -> None:
+    """Should load the user if it changed or is gone since the given ETag."""
+    mocker.patch(
+        "app.repository.AsyncRepository.get_user_version", return_value=version
+    )
+    get_user = mocker.patch(
+        "app.repository.AsyncRepository.get_user", return_value=None
+    )
+
+    response = client.get(f"/users/{uuid4()}", headers={"If-None-Match": '"3"'})
+
+    assert response.status_code == HTTPStatus.NOT_FOUND
+    get_user.assert_awaited_once()
@@ -0,0 +1,199 @@
+"""Test the in-memory repository, and the application running on it."""
+
+from collections.abc import Iterator
+from uuid import UUID
+
+import pytest
+from fastapi.testclient import TestClient
+from pytest_mock import MockFixture
+from sqlalchemy.exc import IntegrityError
+
+from app import api
+from app.models import User
+from app.repository import AsyncRepository, MemoryRepository
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def empty_repository() -> None:
+    """Start every test without any users."""
+    MemoryRepository.create_engine()
+
+
+async def _add(*users: User) -> None:
+    """Add and commit users."""
+    async with MemoryRepository.transaction() as session:
+        await MemoryRepository.add_users(session, users)
+
+
+async def test_transaction_commits_writes() -> None:
+    """Should make the users visible, in order of ID, once committed."""
+    users = sorted(
+        (User(name=f"user{i}", fullname=f"User {i}") for i in range(3)),
+        key=lambda user: user.id,
+    )
+    async with MemoryRepository.transaction() as session:
+        for user in reversed(users):
+            await MemoryRepository.add_user(session, user)
+        assert await MemoryRepository.list_users(session, 10) == []
+
+    async with MemoryRepository.read_session() as session:
+        assert await MemoryRepository.list_users(session, 10) == users
+
+
+async def test_transaction_rolls_back_on_error() -> None:
+    """Should drop the writes of a transaction that raises."""
+
+    async def failing_request() -> None:
+        async with MemoryRepository.transaction() as session:
+            await MemoryRepository.add_user(session, User(name="a", fullname="A"))
+            raise RuntimeError
+
+    with pytest.raises(RuntimeError):
+        await failing_request()
+
+    assert MemoryRepository.users == {}
+
+
+async def test_transaction_rejects_duplicate_on_commit() -> None:
+    """Should fail to commit a user whose ID was taken in the meantime."""
+    user = User(name="a", fullname="A")
+
+    async def racing_request() -> None:
+        async with MemoryRepository.transaction() as session:
+            await MemoryRepository.add_user(session, user)
+            await _add(user)
+
+    with pytest.raises(IntegrityError, match="Duplicate user ID"):
+        await racing_request()
+
+
+async def test_add_users_is_all_or_nothing() -> None:
+    """Should add none of the users if one of their IDs is taken."""
+    taken = User(name="a", fullname="A")
+    await _add(taken)
+
+    async with MemoryRepository.transaction() as session:
+        with pytest.raises(IntegrityError):
+            await MemoryRepository.add_users(
+                session, [User(name="b", fullname="B"), taken]
+            )
+        assert session.added == {}
+
+
+async def test_get_users() -> None:
+    """Should find users and their versions by ID."""
+    user, missing = User(name="a", fullname="A"), User(name="b", fullname="B")
+    await _add(user)
+
+    async with MemoryRepository.read_session() as session:
+        assert await MemoryRepository.get_user(session, user.id) == user
+        assert await MemoryRepository.get_user(session, missing.id) is None
+        assert await MemoryRepository.get_user_version(session, user.id) == 1
+        assert await MemoryRepository.get_user_version(session, missing.id) is None
+        assert await MemoryRepository.get_users(session, [user.id, missing.id]) == {
+            user.id: user
+        }
+
+
+async def test_list_users_keyset_pages() -> None:
+    """Should page through the users in order of ID."""
+    users = sorted(
+        (User(name=f"user{i}", fullname=f"User {i}") for i in range(5)),
+        key=lambda user: user.id,
+    )
+    await _add(*users)
+
+    async with MemoryRepository.read_session() as session:
+        first = await MemoryRepository.list_users(session, 2)
+        second = await MemoryRepository.list_users(session, 2, first[-1].id)
+
+    assert first + second == users[:4]
+
+
+async def test_search_users() -> None:
+    """Should apply the filters like the SQL search does."""
+    alice = User(id=UUID(int=1), name="alice", fullname="Alice Smith")
+    bob = User(id=UUID(int=2), name="bob", fullname="Bob SMITHSON")
+    alfred = User(id=UUID(int=3), name="alfred", fullname="Alfred Jones")
+    await _add(alfred, bob, alice)
+
+    async with MemoryRepository.read_session() as session:
+        assert await MemoryRepository.search_users(session, 10, name="bob") == [bob]
+        assert await MemoryRepository.search_users(session, 10, prefix="al") == [
+            alice,
+            alfred,
+        ]
+        assert await MemoryRepository.search_users(session, 10, q="smith") == [
+            alice,
+            bob,
+        ]
+        assert await MemoryRepository.search_users(session, 1, q="smith") == [alice]
+        assert await MemoryRepository.search_users(
+            session, 10, alice.id, q="smith"
+        ) == [bob]
+
+
+async def test_stream_users() -> None:
+    """Should stream all users in order of ID, in chunks."""
+    users = sorted(
+        (User(name=f"user{i}", fullname=f"User {i}") for i in range(5)),
+        key=lambda user: user.id,
+    )
+    await _add(*users)
+
+    assert [user async for user in MemoryRepository.stream_users(2)] == users
+
+
+async def test_scan_users() -> None:
+    """Should scan the users in order of ID, as a single partition."""
+    users = sorted(
+        (User(name=f"user{i}", fullname=f"User {i}") for i in range(3)),
+        key=lambda user: user.id,
+    )
+    await _add(*users)
+
+    assert [user async for user in MemoryRepository.scan_users(2)] == users
+
+
+async def test_connection_methods_do_nothing() -> None:
+    """Should behave like an always reachable database without migrations."""
+    await MemoryRepository.ping()
+    await MemoryRepository.create_schema()
+    assert await MemoryRepository.get_current_revision() is None
+    await MemoryRepository.dispose_engine()
+
+
+@pytest.fixture
+def client(mocker: MockFixture) -> Iterator[TestClient]:
+    """Fixture running the application on the in-memory repository."""
+    mocker.patch("app.main.DATABASE_BACKEND", "memory")
+    mocker.patch("app.main.UserRepository", MemoryRepository)
+    mocker.patch("app.repository.UserRepository", MemoryRepository)
+    api.dependency_overrides[AsyncRepository.get_session] = MemoryRepository.get_session
+    with TestClient(api) as client:
+        yield client
+    api.dependency_overrides.clear()
+
+
+def test_application_on_memory_backend(client: TestClient) -> None:
+    """Should serve users end to end without a database."""
+    created = client.post("/users", json={"name": "alice", "fullname": "Alice"})
+    assert created.status_code == 200  # noqa: PLR2004
+    user_id = created.json()["id"]
+
+    listed = client.get("/users")
+    assert [user["id"] for user in listed.json()] == [user_id]
+    etag = listed.headers["ETag"]
+    assert client.get("/users", headers={"If-None-Match": etag}).status_code == 304  # noqa: PLR2004
+    assert client.get(f"/users/{user_id}").json()["name"] == "alice"
+    assert client.get("/users/search", params={"prefix": "al"}).json()[0]["id"] == (
+        user_id
+    )
+
+    bulk = client.post(
+        "/users/bulk",
+        json=[{"id": user_id, "name": "alice", "fullname": "Alice"}],
+    )
+    assert bulk.json()["errors"][0]["detail"] == f"Duplicate user ID {user_id}"
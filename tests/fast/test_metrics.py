@@ -0,0 +1,155 @@
+"""Test metrics."""
+
+import contextlib
+from http import HTTPStatus
+from pathlib import Path
+
+import pytest
+from fastapi.testclient import TestClient
+from pytest_mock import MockFixture
+from sqlalchemy import create_engine, literal, select, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.pool import StaticPool
+
+from app import api
+from app.metrics import (
+    POOL_CHECKOUT_WAIT,
+    REGISTRY,
+    STATEMENT_CACHE,
+    STATEMENT_DURATION,
+    STATEMENT_ROWS,
+    Counter,
+    Histogram,
+    TimedQueuePool,
+    instrument_engine,
+    render,
+)
+
+
+def test_histogram_buckets(mocker: MockFixture) -> None:
+    """Should count observations in cumulative buckets, with a sum and a count."""
+    mocker.patch("app.metrics.REGISTRY", [])
+    histogram = Histogram("test_seconds", "Test.", ("route",), buckets=(0.1, 1.0))
+
+    histogram.observe(0.05, "/a")
+    histogram.observe(0.5, "/a")
+    histogram.observe(5, "/a")
+
+    assert list(histogram.collect()) == [
+        "# HELP test_seconds Test.",
+        "# TYPE test_seconds histogram",
+        'test_seconds_bucket{route="/a",le="0.1"} 1',
+        'test_seconds_bucket{route="/a",le="1.0"} 2',
+        'test_seconds_bucket{route="/a",le="+Inf"} 3',
+        'test_seconds_sum{route="/a"} 5.55',
+        'test_seconds_count{route="/a"} 3',
+    ]
+
+
+def test_counter_and_render(mocker: MockFixture) -> None:
+    """Should render every registered metric."""
+    mocker.patch("app.metrics.REGISTRY", [])
+    counter = Counter("test_total", "Test.")
+
+    counter.inc()
+    counter.inc(amount=2)
+
+    assert (
+        render() == "# HELP test_total Test.\n# TYPE test_total counter\ntest_total 3\n"
+    )
+
+
+def test_instrument_engine() -> None:
+    """Should record statement latencies, row counts and checkout waits."""
+    engine = create_engine("sqlite://", poolclass=TimedQueuePool)
+    instrument_engine(engine, "test")
+    checkouts = POOL_CHECKOUT_WAIT._values.get((), ([], [0.0, 0]))[1][1]  # noqa: SLF001
+
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE t (x INTEGER)"))
+        connection.execute(text("INSERT INTO t VALUES (1), (2)"))
+        connection.execute(text("SELECT x FROM t"))
+
+    metrics = render()
+    assert STATEMENT_DURATION._values[("test", "SELECT")][1][1] == 1  # noqa: SLF001
+    assert STATEMENT_DURATION._values[("test", "OTHER")][1][1] == 1  # noqa: SLF001
+    assert STATEMENT_ROWS._values[("test", "INSERT")] == 2  # noqa: SLF001, PLR2004
+    assert POOL_CHECKOUT_WAIT._values[()][1][1] == checkouts + 1  # noqa: SLF001
+    assert 'db_pool_checked_out{engine="test"} 0' in metrics
+    engine.dispose()
+
+
+def test_instrument_engine_forgets_failed_statements() -> None:
+    """Should leave nothing behind on the connection for statements that fail."""
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    instrument_engine(engine, "failing")
+
+    with engine.connect() as connection:
+        for _ in range(5):
+            with contextlib.suppress(OperationalError):
+                connection.execute(text("SELECT x FROM missing"))
+        assert "statement_start" not in connection.info
+        connection.execute(text("SELECT 1"))
+
+    assert STATEMENT_DURATION._values[("failing", "SELECT")][1][1] == 1  # noqa: SLF001
+    engine.dispose()
+
+
+def test_instrument_engine_lets_connection_errors_through(tmp_path: Path) -> None:
+    """Should not fail itself when the database cannot be connected to."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'missing' / 'db.sqlite'}")
+    instrument_engine(engine, "unreachable")
+
+    with pytest.raises(OperationalError):
+        engine.connect()
+    engine.dispose()
+
+
+def test_instrument_engine_counts_compiled_cache_hits() -> None:
+    """Should count the statements found in, or added to, the compiled cache."""
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    instrument_engine(engine, "cached")
+    statement = select(literal(1))
+
+    with engine.connect() as connection:
+        connection.exec_driver_sql("CREATE TABLE t (x INTEGER)")
+        for _ in range(3):
+            connection.execute(statement)
+
+    assert STATEMENT_CACHE._values[("cached", "uncached")] == 1  # noqa: SLF001
+    assert STATEMENT_CACHE._values[("cached", "miss")] == 1  # noqa: SLF001
+    assert STATEMENT_CACHE._values[("cached", "hit")] == 2  # noqa: SLF001, PLR2004
+    assert 'db_compiled_cache_total{engine="cached",result="hit"} 2' in render()
+    engine.dispose()
+
+
+def test_instrument_engine_without_pool_statistics() -> None:
+    """Should leave out pool gauges for pools that do not report them."""
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    instrument_engine(engine, "static")
+
+    assert 'engine="static"' not in render()
+    engine.dispose()
+
+
+def test_metrics_endpoint(mocker: MockFixture) -> None:
+    """Should expose the request latency per route in the Prometheus format."""
+    mocker.patch("app.repository.AsyncRepository.ping", return_value=None)
+    client = TestClient(api)
+
+    client.get("/health")
+    client.get("/no-such-route")
+    response = client.get("/metrics")
+
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert (
+        'http_request_duration_seconds_count{method="GET",route="/health",status="200"}'
+        in response.text
+    )
+    assert (
+        'http_request_duration_seconds_count{method="GET",route="unmatched",status="404"}'
+        in response.text
+    )
+    assert "user_cache_hits_total" in response.text
+    assert all(metric in REGISTRY for metric in (STATEMENT_DURATION, STATEMENT_ROWS))
@@ -0,0 +1,228 @@
+"""Test the helpers for chunked, online migrations."""
+
+import logging
+from collections.abc import Iterator
+from pathlib import Path
+
+import pytest
+from alembic.migration import MigrationContext
+from alembic.operations import Operations
+from pytest_mock import MockFixture
+from sqlalchemy import (
+    Column,
+    ColumnElement,
+    Engine,
+    Integer,
+    MetaData,
+    String,
+    Table,
+    column,
+    create_engine,
+    func,
+    insert,
+    inspect,
+    select,
+    update,
+)
+from sqlalchemy.sql import Executable
+
+from alembic import op
+from app.migrations import (
+    PROGRESS,
+    backfill,
+    create_index_concurrently,
+    drop_index_concurrently,
+    run_in_chunks,
+)
+
+ROWS = 1000
+
+ITEM = Table(
+    "item",
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("name", String),
+    Column("name_upper", String),
+)
+
+ITEM_COPY = Table(
+    "item_copy",
+    MetaData(),
+    Column("id", Integer, primary_key=True),
+    Column("name", String),
+)
+
+
+@pytest.fixture
+def engine(tmp_path: Path) -> Iterator[Engine]:
+    """Fixture with a table of items, whose `name_upper` is to be filled."""
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrations.db'}")
+    ITEM.create(engine)
+    with engine.begin() as connection:
+        connection.execute(
+            insert(ITEM), [{"id": i, "name": f"item{i}"} for i in range(ROWS)]
+        )
+    yield engine
+    engine.dispose()
+
+
+def _fill(in_chunk: ColumnElement[bool]) -> Executable:
+    """Fill `name_upper` in a chunk of items."""
+    return update(ITEM).where(in_chunk).values(name_upper=func.upper(ITEM.c.name))
+
+
+def _unfilled(engine: Engine) -> int | None:
+    """Count the items whose `name_upper` is not filled."""
+    with engine.connect() as connection:
+        return connection.scalar(
+            select(func.count()).where(ITEM.c.name_upper.is_(None))
+        )
+
+
+def test_backfill_commits_chunks(engine: Engine, mocker: MockFixture) -> None:
+    """Should fill every row, pausing between chunks, and forget its progress."""
+    sleep = mocker.patch("app.migrations.time.sleep")
+
+    rows = backfill(
+        engine,
+        "fill",
+        ITEM.c.id,
+        {"name_upper": func.upper(ITEM.c.name)},
+        batch_size=300,
+        pause=0.5,
+    )
+
+    assert rows == ROWS
+    assert _unfilled(engine) == 0
+    assert sleep.call_args_list == [mocker.call(0.5)] * 3
+    with engine.connect() as connection:
+        assert connection.scalar(select(func.count()).select_from(PROGRESS)) == 0
+
+
+def test_backfill_leaves_out_rows_not_matching(engine: Engine) -> None:
+    """Should only change the rows matching `where`, counting chunks by them."""
+    with engine.begin() as connection:
+        connection.execute(
+            update(ITEM).where(ITEM.c.id < 500).values(name_upper="kept")  # noqa: PLR2004
+        )
+
+    rows = backfill(
+        engine,
+        "fill",
+        ITEM.c.id,
+        {"name_upper": func.upper(ITEM.c.name)},
+        where=ITEM.c.name_upper.is_(None),
+        batch_size=100,
+    )
+
+    assert rows == 500  # noqa: PLR2004
+    with engine.connect() as connection:
+        assert connection.scalar(select(ITEM.c.name_upper).where(ITEM.c.id == 0)) == (
+            "kept"
+        )
+    assert _unfilled(engine) == 0
+
+
+def test_backfill_needs_a_table_column(engine: Engine) -> None:
+    """Should refuse a key that does not belong to a table, having none to update."""
+    with pytest.raises(TypeError, match="not a column of a table"):
+        backfill(engine, "fill", column("id"), {"name_upper": "x"})
+
+
+@pytest.mark.parametrize(("failed_chunk", "resumed_rows"), [(3, 800), (1, 1000)])
+def test_run_in_chunks_resumes_after_failure(
+    engine: Engine, failed_chunk: int, resumed_rows: int
+) -> None:
+    """Should resume after the last chunk committed before a failure."""
+    chunks = 0
+
+    def failing_fill(in_chunk: ColumnElement[bool]) -> Executable:
+        nonlocal chunks
+        chunks += 1
+        if chunks == failed_chunk:
+            raise RuntimeError
+        return _fill(in_chunk)
+
+    with pytest.raises(RuntimeError):
+        run_in_chunks(engine, "fill", ITEM.c.id, failing_fill, batch_size=100)
+
+    assert _unfilled(engine) == resumed_rows
+    assert run_in_chunks(engine, "fill", ITEM.c.id, _fill) == resumed_rows
+    assert _unfilled(engine) == 0
+
+
+def test_run_in_chunks_logs_progress(
+    engine: Engine, mocker: MockFixture, caplog: pytest.LogCaptureFixture
+) -> None:
+    """Should log the rows done and their rate as it goes, and once done."""
+    mocker.patch("app.migrations.DATABASE_MIGRATION_LOG_INTERVAL", 0)
+
+    with caplog.at_level(logging.INFO, logger="app.migrations"):
+        run_in_chunks(engine, "fill", ITEM.c.id, _fill, batch_size=400)
+
+    assert "fill: 400 rows" in caplog.text
+    assert "fill: 800 rows" in caplog.text
+    assert f"fill: done, {ROWS} rows" in caplog.text
+
+
+def test_create_and_drop_index_concurrently(engine: Engine) -> None:
+    """Should create an index once, even if asked again, and drop it."""
+    with engine.connect() as connection:
+        # Run in a transaction as on PostgreSQL, which the helpers step out of:
+        context = MigrationContext.configure(
+            connection, opts={"transactional_ddl": True}
+        )
+        with Operations.context(context), context.begin_transaction():
+            create_index_concurrently("ix_item_name", "item", ["name"])
+            create_index_concurrently("ix_item_name", "item", ["name"])
+            indexes = inspect(connection).get_indexes("item")
+            drop_index_concurrently("ix_item_name", "item")
+            drop_index_concurrently("ix_item_name", "item")
+
+        assert [index["name"] for index in indexes] == ["ix_item_name"]
+        assert inspect(connection).get_indexes("item") == []
+
+
+def test_migration_runs_again_after_failed_chunk(engine: Engine) -> None:
+    """Should run a migration again after a chunk failed, resuming the copy."""
+    chunks = 0
+
+    def failing_copy(in_chunk: ColumnElement[bool]) -> Executable:
+        nonlocal chunks
+        chunks += 1
+        if chunks == 3:  # noqa: PLR2004
+            raise RuntimeError
+        return insert(ITEM_COPY).from_select(
+            ["id", "name"], select(ITEM.c.id, ITEM.c.name).where(in_chunk)
+        )
+
+    def upgrade() -> None:
+        op.create_table(
+            "item_copy",
+            Column("id", Integer, primary_key=True),
+            Column("name", String),
+            if_not_exists=True,
+        )
+        with op.get_context().autocommit_block():
+            run_in_chunks(
+                op.get_bind().engine, "copy", ITEM.c.id, failing_copy, batch_size=100
+            )
+
+    with engine.connect() as connection:
+        context = MigrationContext.configure(
+            connection, opts={"transactional_ddl": True}
+        )
+        with (
+            pytest.raises(RuntimeError),
+            Operations.context(context),
+            context.begin_transaction(),
+        ):
+            upgrade()
+        # The table was committed before the chunks, and is kept:
+        assert inspect(connection).has_table("item_copy")
+
+        with Operations.context(context), context.begin_transaction():
+            upgrade()
+
+    with engine.connect() as connection:
+        assert connection.scalar(select(func.count()).select_from(ITEM_COPY)) == ROWS
@@ -0,0 +1,128 @@
+"""Test read replicas."""
+
+import asyncio
+from collections.abc import AsyncIterator
+from pathlib import Path
+
+import pytest
+from pytest_mock import MockFixture
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from app.metrics import render
+from app.models import User
+from app.repository import AsyncRepository, Base
+from app.repository.limiter import ConcurrencyLimiter
+from app.repository.replicas import ReplicaSet
+
+pytestmark = pytest.mark.anyio
+
+
+async def _create_database(path: Path) -> AsyncEngine:
+    """Create a SQLite database file standing in for a PostgreSQL instance."""
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}")
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    return engine
+
+
+@pytest.fixture
+async def databases(
+    tmp_path: Path, mocker: MockFixture
+) -> AsyncIterator[tuple[AsyncEngine, list[AsyncEngine]]]:
+    """Back the repository with a primary and two replicas, each in its own file."""
+    primary = await _create_database(tmp_path / "primary.db")
+    replicas = [await _create_database(tmp_path / f"replica{i}.db") for i in range(2)]
+    mocker.patch.object(AsyncRepository, "engine", primary, create=True)
+    mocker.patch.object(AsyncRepository, "replicas", ReplicaSet(replicas))
+    yield primary, replicas
+    await AsyncRepository.dispose_engine()
+
+
+async def test_choose_round_robin(
+    databases: tuple[AsyncEngine, list[AsyncEngine]],
+) -> None:
+    """Should spread reads across the replicas."""
+    _, replicas = databases
+
+    chosen = [AsyncRepository.get_read_engine() for _ in range(4)]
+
+    assert chosen == [*replicas, *replicas]
+
+
+async def test_check_takes_failing_replica_out_of_rotation(tmp_path: Path) -> None:
+    """Should only hand out replicas that pass their health check."""
+    healthy = await _create_database(tmp_path / "replica.db")
+    failing = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/missing/replica.db")
+    replicas = ReplicaSet([healthy, failing])
+
+    await replicas.check()
+    assert replicas.healthy == [healthy]
+    assert {replicas.choose() for _ in range(3)} == {healthy}
+
+    # Recover the failing replica:
+    (tmp_path / "missing").mkdir()
+    await replicas.check()
+    assert replicas.healthy == [healthy, failing]
+    await replicas.dispose()
+
+
+async def test_read_falls_back_to_primary(
+    databases: tuple[AsyncEngine, list[AsyncEngine]],
+) -> None:
+    """Should read from the primary if asked to, or if no replica is healthy."""
+    primary, _ = databases
+
+    assert AsyncRepository.get_read_engine(primary=True) is primary
+    AsyncRepository.replicas.healthy = []
+    assert AsyncRepository.get_read_engine() is primary
+
+
+@pytest.mark.usefixtures("databases")
+async def test_writes_go_to_primary_and_reads_to_replicas() -> None:
+    """Should write to the primary, and not see the write on an unsynced replica."""
+    user = User(name="test", fullname="Test")
+    async for session in AsyncRepository.get_session():
+        await AsyncRepository.add_user(session, user)
+
+    async with AsyncRepository.read_session() as session:
+        assert await AsyncRepository.get_user(session, user.id) is None
+        assert await AsyncRepository.get_users(session, [user.id]) == {}
+    # Not cached as missing, as the replica may only lag behind:
+    async with AsyncRepository.read_session(primary=True) as session:
+        assert await AsyncRepository.get_user(session, user.id) == user
+
+
+async def test_each_engine_has_its_own_limiter(
+    databases: tuple[AsyncEngine, list[AsyncEngine]], mocker: MockFixture
+) -> None:
+    """Should count the sessions of the primary and of each replica apart."""
+    _, replicas = databases
+    mocker.patch.object(AsyncRepository, "limiter", ConcurrencyLimiter(1, 0, 1))
+
+    async with AsyncRepository.read_session() as session:
+        assert session.bind is replicas[0]
+        assert AsyncRepository.replicas.limiters[replicas[0]].active == 1
+        assert AsyncRepository.replicas.limiters[replicas[1]].active == 0
+        assert AsyncRepository.limiter.active == 0
+        metrics = render()
+
+    assert 'db_sessions_active{engine="primary"} 0' in metrics
+    assert 'db_sessions_active{engine="replica0"} 1' in metrics
+    assert 'db_queue_depth{engine="replica1"} 0' in metrics
+
+
+async def test_monitor_checks_periodically(mocker: MockFixture) -> None:
+    """Should keep checking the replicas until cancelled."""
+    replicas = ReplicaSet([mocker.MagicMock()])
+    check = mocker.patch.object(replicas, "check")
+
+    monitor = asyncio.create_task(replicas.monitor(interval=0))
+    await asyncio.sleep(0.01)
+    monitor.cancel()
+
+    assert check.await_count > 1
+
+
+async def test_monitor_without_replicas() -> None:
+    """Should return at once if there are no replicas to check."""
+    await ReplicaSet([]).monitor()
@@ -0,0 +1,236 @@
+"""Test repository."""
+
+from collections.abc import Iterator
+from uuid import uuid4
+
+import pytest
+from pytest_mock import MockFixture
+from sqlalchemy import Engine, create_engine, func, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+
+from app.models import User
+from app.repository import Base, Repository
+from app.repository.repository import (
+    DATABASE_MAX_OVERFLOW,
+    DATABASE_POOL_SIZE,
+    DATABASE_QUERY_CACHE_SIZE,
+    UserDAO,
+    engine_options,
+    pool_limits,
+)
+
+
+def test_create_engine_uses_pool_settings(mocker: MockFixture) -> None:
+    """Should create one pooled engine configured from the environment."""
+    instrument_engine = mocker.patch("app.repository.repository.instrument_engine")
+    create_engine = mocker.patch("app.repository.repository.create_engine")
+    mocker.patch("app.repository.repository.DATABASE_POOL_SIZE", 20)
+    mocker.patch("app.repository.repository.DATABASE_MAX_OVERFLOW", 5)
+    mocker.patch("app.repository.repository.DATABASE_ECHO", False)  # noqa: FBT003
+
+    Repository.create_engine()
+
+    create_engine.assert_called_once()
+    kwargs = create_engine.call_args.kwargs
+    assert kwargs["pool_size"] == 20  # noqa: PLR2004
+    assert kwargs["max_overflow"] == 5  # noqa: PLR2004
+    assert kwargs["echo"] is False
+    assert Repository.engine is create_engine.return_value
+    instrument_engine.assert_called_once_with(Repository.engine, "sync")
+
+
+def test_dispose_engine(mocker: MockFixture) -> None:
+    """Should dispose of the pooled connections on shutdown."""
+    engine = mocker.patch.object(Repository, "engine", create=True)
+
+    Repository.dispose_engine()
+
+    engine.dispose.assert_called_once_with()
+
+
+def test_pool_limits_default_to_pool_settings(mocker: MockFixture) -> None:
+    """Should use the configured pool without a connection budget."""
+    mocker.patch("app.repository.repository.DATABASE_MAX_CONNECTIONS", 0)
+
+    assert pool_limits(8) == (DATABASE_POOL_SIZE, DATABASE_MAX_OVERFLOW)
+
+
+@pytest.mark.parametrize(
+    ("workers", "expected"),
+    [(1, (5, 10)), (4, (5, 10)), (8, (5, 2)), (20, (3, 0))],
+)
+def test_pool_limits_split_connections_between_workers(
+    mocker: MockFixture, workers: int, expected: tuple[int, int]
+) -> None:
+    """Should never let the pools of all workers exceed the connection budget."""
+    mocker.patch("app.repository.repository.DATABASE_POOL_SIZE", 5)
+    mocker.patch("app.repository.repository.DATABASE_MAX_OVERFLOW", 10)
+    mocker.patch("app.repository.repository.DATABASE_MAX_CONNECTIONS", 60)
+
+    assert pool_limits(workers) == expected
+    assert sum(expected) * workers <= 60  # noqa: PLR2004
+
+
+def test_pool_limits_reject_too_many_workers(mocker: MockFixture) -> None:
+    """Should fail if some workers would get no connection at all."""
+    mocker.patch("app.repository.repository.DATABASE_MAX_CONNECTIONS", 3)
+
+    with pytest.raises(ValueError, match="4 workers"):
+        pool_limits(4)
+
+
+def test_pool_limits_keep_one_sqlite_connection(mocker: MockFixture) -> None:
+    """Should use a single connection, shared by all requests, on SQLite."""
+    mocker.patch("app.repository.repository.DATABASE_BACKEND", "sqlite")
+
+    assert pool_limits(8) == (1, 0)
+
+
+@pytest.mark.parametrize(("threshold", "expected"), [("3", 3), ("", None)])
+def test_engine_options_prepare_statements_on_postgresql(
+    mocker: MockFixture, threshold: str, expected: int | None
+) -> None:
+    """Should have psycopg prepare statements after the configured executions."""
+    mocker.patch("app.repository.repository.DATABASE_BACKEND", "postgresql")
+    mocker.patch("app.repository.repository.DATABASE_PREPARE_THRESHOLD", threshold)
+
+    options = engine_options()
+
+    assert options["connect_args"] == {"prepare_threshold": expected}
+    assert options["query_cache_size"] == DATABASE_QUERY_CACHE_SIZE
+
+
+def test_engine_options_without_postgresql(mocker: MockFixture) -> None:
+    """Should leave out the psycopg options on other databases."""
+    mocker.patch("app.repository.repository.DATABASE_BACKEND", "sqlite")
+
+    assert "connect_args" not in engine_options()
+
+
+def test_reset_after_fork_keeps_parent_connections(engine: Engine) -> None:
+    """Should give the child a new pool without closing the parent's connections."""
+    connection = engine.connect()
+    pool = engine.pool
+
+    Repository.reset_after_fork()
+
+    assert engine.pool is not pool
+    assert not connection.closed
+    connection.close()
+    pool.dispose()
+
+
+def test_reset_after_fork_without_engine(mocker: MockFixture) -> None:
+    """Should do nothing in a process that has no engine."""
+    mocker.patch.object(Repository, "engine", create=True)
+    del Repository.engine
+
+    Repository.reset_after_fork()
+
+
+@pytest.fixture
+def engine(mocker: MockFixture) -> Iterator[Engine]:
+    """Fixture to back the repository with an in-memory SQLite database."""
+    engine = create_engine("sqlite://", poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    mocker.patch.object(Repository, "engine", engine, create=True)
+    yield engine
+    engine.dispose()
+
+
+def test_get_session_commits_once(engine: Engine) -> None:
+    """Should commit all work done in the request when it succeeds."""
+    user = User(name="testuser", fullname="Test User")
+
+    sessions = Repository.get_session()
+    Repository.add_user(next(sessions), user)
+    with pytest.raises(StopIteration):
+        next(sessions)
+
+    with engine.connect() as connection:
+        assert connection.scalar(select(func.count()).select_from(UserDAO)) == 1
+
+
+def test_get_session_rolls_back_on_error(engine: Engine) -> None:
+    """Should roll back all work done in the request when it raises."""
+    user = User(name="testuser", fullname="Test User")
+
+    sessions = Repository.get_session()
+    Repository.add_user(next(sessions), user)
+    with pytest.raises(RuntimeError):
+        sessions.throw(RuntimeError("request failed"))
+
+    with engine.connect() as connection:
+        assert connection.scalar(select(func.count()).select_from(UserDAO)) == 0
+
+
+def test_list_users_keyset_pages(engine: Engine) -> None:
+    """Should page through all users in primary key order without overlap."""
+    with Session(engine) as session, session.begin():
+        for i in range(5):
+            Repository.add_user(session, User(name=f"test{i}", fullname=""))
+
+    with Session(engine) as session:
+        first_page = Repository.list_users(session, 3)
+        second_page = Repository.list_users(session, 3, first_page[-1].id)
+
+    ids = [user.id for user in first_page + second_page]
+    assert len(first_page) == 3  # noqa: PLR2004
+    assert len(second_page) == 2  # noqa: PLR2004
+    assert ids == sorted(ids)
+    assert len(set(ids)) == 5  # noqa: PLR2004
+
+
+def test_stream_users(engine: Engine) -> None:
+    """Should stream every user in primary key order."""
+    with Session(engine) as session, session.begin():
+        for i in range(5):
+            Repository.add_user(session, User(name=f"test{i}", fullname=""))
+
+    ids = [user.id for user in Repository.stream_users(2)]
+
+    assert len(ids) == 5  # noqa: PLR2004
+    assert ids == sorted(ids)
+
+
+def test_add_users_rolls_back_only_the_failed_batch(engine: Engine) -> None:
+    """Should insert a batch in one go, rolling back only a batch that fails."""
+    users = [User(name=f"test{i}", fullname="") for i in range(3)]
+
+    with Session(engine) as session, session.begin():
+        Repository.add_users(session, users)
+        with pytest.raises(IntegrityError):
+            Repository.add_users(session, [User(name="test", fullname=""), users[0]])
+
+    with engine.connect() as connection:
+        assert connection.scalar(select(func.count()).select_from(UserDAO)) == 3  # noqa: PLR2004
+
+
+def test_get_user_reads_columns(engine: Engine) -> None:
+    """Should read a user straight from its columns, mapping no fullname to ''."""
+    user_id = uuid4()
+    with engine.begin() as connection:
+        connection.execute(insert(UserDAO).values(id=user_id, name="test"))
+
+    with Session(engine) as session:
+        user = Repository.get_user(session, user_id)
+        assert Repository.get_user(session, uuid4()) is None
+        assert not session.identity_map, "No ORM instances should be loaded"
+
+    assert user == User(id=user_id, name="test", fullname="")
+
+
+def test_user_version_is_incremented_on_update(engine: Engine) -> None:
+    """Should start a user at version 1 and increment it on every update."""
+    user = User(name="test", fullname="Test")
+    with Session(engine) as session, session.begin():
+        Repository.add_user(session, user)
+    with Session(engine) as session, session.begin():
+        session.get_one(UserDAO, user.id).name = "renamed"
+
+    with Session(engine) as session:
+        updated = Repository.get_user(session, user.id)
+    assert updated is not None
+    assert updated.version == 2  # noqa: PLR2004
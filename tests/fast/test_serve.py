@@ -0,0 +1,47 @@
+"""Test the production server entry point."""
+
+import pytest
+from pytest_mock import MockFixture
+
+from app.serve import main, worker_count
+
+
+def test_worker_count_defaults_to_cores(
+    mocker: MockFixture, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Should run one worker per core unless configured."""
+    monkeypatch.delenv("WEB_CONCURRENCY", raising=False)
+    mocker.patch("os.process_cpu_count", return_value=6)
+
+    assert worker_count() == 6  # noqa: PLR2004
+
+    monkeypatch.setenv("WEB_CONCURRENCY", "3")
+    assert worker_count() == 3  # noqa: PLR2004
+
+
+def test_main_runs_workers(
+    mocker: MockFixture, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Should run the workers, telling them how many they are."""
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    run = mocker.patch("uvicorn.run")
+
+    main()
+
+    run.assert_called_once()
+    assert run.call_args.args == ("app:api",)
+    assert run.call_args.kwargs["workers"] == 4  # noqa: PLR2004
+
+
+def test_main_fails_if_connections_do_not_go_round(
+    mocker: MockFixture, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """Should not start workers that could not all connect."""
+    monkeypatch.setenv("WEB_CONCURRENCY", "4")
+    mocker.patch("app.repository.repository.DATABASE_MAX_CONNECTIONS", 2)
+    run = mocker.patch("uvicorn.run")
+
+    with pytest.raises(ValueError, match="DATABASE_MAX_CONNECTIONS"):
+        main()
+
+    run.assert_not_called()
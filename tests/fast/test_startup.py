@@ -0,0 +1,117 @@
+"""Test the startup time and its profiling."""
+
+import importlib
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from pytest_mock import MockFixture
+
+from app import startup
+from app.startup import ImportProfiler, profile_imports, report_startup, timed_phase
+
+# Generous, to catch heavy imports creeping back rather than small regressions:
+IMPORT_TIME_BUDGET = 3.0
+CHILD_SLEEP = 0.01
+
+
+def _run(code: str) -> str:
+    """Run Python code in a fresh interpreter and return its output."""
+    return subprocess.run(  # noqa: S603
+        [sys.executable, "-c", code],
+        capture_output=True,
+        check=True,
+        text=True,
+    ).stdout
+
+
+def test_import_app_within_budget() -> None:
+    """Should import the application within the time budget."""
+    seconds = float(
+        _run(
+            "import time; start = time.perf_counter(); import app; "
+            "print(time.perf_counter() - start)"
+        )
+    )
+
+    assert seconds < IMPORT_TIME_BUDGET
+
+
+def test_import_app_skips_migrations_and_driver() -> None:
+    """Should import Alembic and psycopg only when they are needed."""
+    output = _run(
+        "import sys, app; "
+        "print(sorted(m for m in ('alembic', 'psycopg') if m in sys.modules))"
+    )
+
+    assert output.strip() == "[]"
+
+
+def test_import_profiler(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Should record self and cumulative times of nested imports."""
+    package = tmp_path / "profiled"
+    package.mkdir()
+    (package / "__init__.py").write_text("from . import child\n")
+    (package / "child.py").write_text(f"import time\ntime.sleep({CHILD_SLEEP})\n")
+    monkeypatch.syspath_prepend(tmp_path)
+    profiler = ImportProfiler()
+
+    monkeypatch.setattr(sys, "meta_path", [profiler, *sys.meta_path])
+    importlib.import_module("profiled")
+
+    parent_self, parent_cumulative = profiler.timings["profiled"]
+    child_self, child_cumulative = profiler.timings["profiled.child"]
+    assert child_self >= CHILD_SLEEP
+    assert child_cumulative == child_self
+    assert parent_cumulative >= parent_self + child_cumulative
+    header, *rows = profiler.report(top=1).splitlines()
+    assert "cumulative ms" in header
+    assert len(rows) == 1
+    assert rows[0].endswith("| profiled")
+
+
+def test_import_profiler_skips_missing_modules() -> None:
+    """Should let the import of a missing module fail as usual."""
+    assert ImportProfiler().find_spec("app_missing_module", None) is None
+
+
+def test_import_profiler_skips_builtin_modules() -> None:
+    """Should leave the loaders of built-in modules alone."""
+    spec = ImportProfiler().find_spec("itertools", None)
+
+    assert spec is not None
+    assert spec.loader is not None
+    assert spec.loader.exec_module.__name__ == "exec_module"
+
+
+def test_report_startup(
+    mocker: MockFixture, capsys: pytest.CaptureFixture[str]
+) -> None:
+    """Should report the startup phases on stderr only if profiling."""
+    mocker.patch.dict(startup._phases, clear=True)  # noqa: SLF001
+    with timed_phase("warm up"):
+        pass
+
+    report_startup()
+    assert capsys.readouterr().err == ""
+
+    mocker.patch("app.startup.STARTUP_PROFILE", new=True)
+    report_startup()
+    assert "| warm up" in capsys.readouterr().err
+
+
+def test_profile_imports(
+    mocker: MockFixture, capsys: pytest.CaptureFixture[str]
+) -> None:
+    """Should report the slowest imports on stderr if profiling."""
+    mocker.patch.dict(startup._phases, clear=True)  # noqa: SLF001
+    mocker.patch("app.startup.STARTUP_PROFILE", new=True)
+    meta_path = list(sys.meta_path)
+
+    with profile_imports("json.tool"):
+        import json.tool  # noqa: F401, PLC0415
+
+    assert sys.meta_path == meta_path
+    assert "import json.tool" in startup._phases  # noqa: SLF001
+    assert "Slowest imports of json.tool:" in capsys.readouterr().err
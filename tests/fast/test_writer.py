@@ -0,0 +1,158 @@
+"""Test the batch writer."""
+
+import asyncio
+
+import pytest
+from pytest_mock import MockFixture
+from sqlalchemy.exc import IntegrityError, OperationalError
+
+from app.metrics import render
+from app.models import User
+from app.repository import AsyncRepository
+from app.repository.limiter import OverloadedError
+from app.repository.writer import BatchWriter
+
+from .conftest import CountUsers
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_concurrent_saves_are_committed_together(
+    count_users: CountUsers, mocker: MockFixture
+) -> None:
+    """Should insert users saved within the window in one batch."""
+    add_users = mocker.spy(AsyncRepository, "add_users")
+    writer = BatchWriter(max_size=100, window=0.05)
+    writer.start()
+    users = [User(name=f"test{i}", fullname="Test") for i in range(10)]
+
+    await asyncio.gather(*(writer.save(user) for user in users))
+    await writer.stop()
+
+    assert add_users.call_count == 1
+    assert await count_users() == len(users)
+
+
+async def test_full_batch_is_flushed_before_the_window(
+    count_users: CountUsers, mocker: MockFixture
+) -> None:
+    """Should flush a batch as soon as it holds `max_size` users."""
+    add_users = mocker.spy(AsyncRepository, "add_users")
+    writer = BatchWriter(max_size=2, window=60)
+    writer.start()
+    users = [User(name=f"test{i}", fullname="Test") for i in range(4)]
+
+    async with asyncio.timeout(5):
+        await asyncio.gather(*(writer.save(user) for user in users))
+    await writer.stop()
+
+    assert [len(call.args[1]) for call in add_users.call_args_list] == [2, 2]
+    assert await count_users() == len(users)
+
+
+async def test_failing_user_does_not_fail_the_batch(count_users: CountUsers) -> None:
+    """Should only fail the caller whose user could not be inserted."""
+    existing = User(name="existing", fullname="Test")
+    writer = BatchWriter(max_size=100, window=0.05)
+    writer.start()
+    await writer.save(existing)
+
+    results = await asyncio.gather(
+        writer.save(User(name="new", fullname="Test")),
+        writer.save(existing),
+        return_exceptions=True,
+    )
+    await writer.stop()
+
+    assert results[0] is None
+    assert isinstance(results[1], IntegrityError)
+    assert await count_users() == 2  # noqa: PLR2004
+
+
+@pytest.mark.usefixtures("engine")
+async def test_database_error_fails_the_whole_batch(mocker: MockFixture) -> None:
+    """Should not retry users one by one if the database itself failed."""
+    add_users = mocker.patch.object(
+        AsyncRepository,
+        "add_users",
+        side_effect=OperationalError("INSERT", None, Exception("refused")),
+    )
+    writer = BatchWriter(max_size=100, window=0.05)
+    writer.start()
+
+    results = await asyncio.gather(
+        *(writer.save(User(name=f"test{i}", fullname="Test")) for i in range(3)),
+        return_exceptions=True,
+    )
+    await writer.stop()
+
+    assert add_users.call_count == 1
+    assert all(isinstance(result, OperationalError) for result in results)
+
+
+@pytest.mark.usefixtures("engine")
+async def test_unexpected_error_is_raised_to_callers(mocker: MockFixture) -> None:
+    """Should not leave callers waiting if a batch fails unexpectedly."""
+    mocker.patch.object(AsyncRepository, "add_users", side_effect=RuntimeError)
+    writer = BatchWriter(max_size=100, window=0)
+    writer.start()
+
+    with pytest.raises(RuntimeError):
+        await writer.save(User(name="test", fullname="Test"))
+    await writer.stop()
+
+
+async def test_full_queue_is_rejected(mocker: MockFixture) -> None:
+    """Should reject users beyond the queue size while a batch is being written."""
+    written = asyncio.Event()
+
+    async def add_users(*_: object) -> None:
+        await written.wait()
+
+    mocker.patch.object(AsyncRepository, "add_users", side_effect=add_users)
+    mocker.patch.object(AsyncRepository, "engine", create=True)
+    mocker.patch("sqlalchemy.ext.asyncio.AsyncSession.begin")
+    writer = BatchWriter(max_size=100, window=0, queue_size=1)
+    writer.start()
+    saves = []
+    # The first user is being written, and the second waits in the queue:
+    for i in range(2):
+        saves.append(
+            asyncio.create_task(writer.save(User(name=f"test{i}", fullname="Test")))
+        )
+        await asyncio.sleep(0.01)
+
+    with pytest.raises(OverloadedError, match="write queue is full"):
+        await writer.save(User(name="rejected", fullname="Test"))
+    written.set()
+    await asyncio.gather(*saves)
+    await writer.stop()
+
+    assert 'db_requests_rejected_total{reason="write_queue_full"}' in render()
+
+
+async def test_stop_flushes_queued_users(count_users: CountUsers) -> None:
+    """Should commit the queued users before stopping."""
+    writer = BatchWriter(max_size=100, window=60)
+    writer.start()
+    save = asyncio.create_task(writer.save(User(name="test", fullname="Test")))
+    await asyncio.sleep(0)
+
+    await writer.stop()
+
+    assert save.done()
+    assert await count_users() == 1
+    await writer.stop()
+
+
+async def test_cancelled_caller_is_skipped(count_users: CountUsers) -> None:
+    """Should still insert the user of a caller that gave up waiting."""
+    writer = BatchWriter(max_size=100, window=0.05)
+    writer.start()
+    save = asyncio.create_task(writer.save(User(name="test", fullname="Test")))
+    await asyncio.sleep(0)
+    save.cancel()
+
+    await writer.stop()
+
+    assert await count_users() == 1
@@ -1,12 +1,18 @@
 """Test repository for nrl_sdk_lib."""
 
 import os
+import re
 from http import HTTPStatus
 from pathlib import Path
 from typing import Any
+from uuid import uuid4
 
 import httpx
 import pytest
+from sqlalchemy import create_engine, insert, text
+
+from app.main import USERS_PAGE_SIZE
+from app.repository.repository import UserDAO, search_users_statement
 
 DATABASE_HOST = os.getenv("DATABASE_HOST")
 DATABASE_PORT = int(os.getenv("DATABASE_PORT", "5432"))
@@ -64,6 +70,16 @@ def test_get_health(http_service: str) -> None:
     assert response.status_code == HTTPStatus.OK, (
         f"Health check failed: {response.text}"
     )
+    assert response.json() == {"status": "ok"}, "Health check response should be 'ok'"
+
+
+def test_get_schema_health(http_service: str) -> None:
+    """Schema health check endpoint should return status OK."""
+    url = f"{http_service}/health/schema"
+    response = httpx.get(url)
+    assert response.status_code == HTTPStatus.OK, (
+        f"Health check failed: {response.text}"
+    )
     data = response.json()
     assert data["status"] == "ok", "Health check response should be 'ok'"
     assert "currentDatabaseSchemaRevision" in data, (
@@ -129,3 +145,72 @@ def test_get_user(http_service: str) -> None:
     assert retrieved_user["fullname"] == user_data["fullname"], (
         "User fullname should match"
     )
+
+
+@pytest.mark.usefixtures("http_service")
+@pytest.mark.parametrize(
+    ("filters", "index"),
+    [
+        ({"name": "user42"}, r"user_account_p\d+_name_idx"),
+        ({"prefix": "user42"}, r"user_account_p\d+_name_idx"),
+        ({"q": "ser 0004"}, r"user_account_p\d+_fullname_idx"),
+    ],
+)
+def test_search_uses_index(filters: dict[str, str], index: str) -> None:
+    """User searches should be served by an index, not by walking the IDs.
+
+    The query is the one `AsyncRepository.search_users` sends, ordered by ID and
+    limited to a page, for which the primary key could compete. user_account is
+    partitioned, so the plan scans the index of each partition, named by
+    PostgreSQL after the partition and column.
+    """
+    engine = create_engine(DATABASE_URL)
+    with engine.connect() as connection, connection.begin() as transaction:
+        # Enough users, rolled back afterwards, for the planner to weigh the
+        # indexes against each other, and no sequential scans of the tiny table:
+        connection.execute(
+            insert(UserDAO),
+            [
+                {"id": uuid4(), "name": f"user{i}", "fullname": f"User {i:05}"}
+                for i in range(10_000)
+            ],
+        )
+        connection.execute(text("ANALYZE user_account"))
+        connection.execute(text("SET LOCAL enable_seqscan = off"))
+        statement = search_users_statement(
+            USERS_PAGE_SIZE + 1, None, **filters
+        ).compile(dialect=connection.dialect)
+        plan = "\n".join(
+            connection.exec_driver_sql(
+                f"EXPLAIN {statement}", statement.params
+            ).scalars()
+        )
+        transaction.rollback()
+    engine.dispose()
+    assert re.search(index, plan), f"Expected {index} to be used:\n{plan}"
+
+
+def test_users_etag_changes_on_update(http_service: str) -> None:
+    """The ETag of the user list should change when a listed user is updated.
+
+    The update is sent outside the ORM, so the version is incremented by the
+    trigger of the `add_user_account_versions` migration.
+    """
+    url = f"{http_service}/users"
+    httpx.post(url, json={"name": "etag", "fullname": "ETag User"})
+    response = httpx.get(url, params={"limit": 1})
+    etag, user_id = response.headers["ETag"], response.json()[0]["id"]
+    response = httpx.get(url, params={"limit": 1}, headers={"If-None-Match": etag})
+    assert response.status_code == HTTPStatus.NOT_MODIFIED
+
+    engine = create_engine(DATABASE_URL)
+    with engine.begin() as connection:
+        connection.execute(
+            text("UPDATE user_account SET fullname = 'Updated' WHERE id = :id"),
+            {"id": user_id},
+        )
+    engine.dispose()
+
+    response = httpx.get(url, params={"limit": 1}, headers={"If-None-Match": etag})
+    assert response.status_code == HTTPStatus.OK
+    assert response.headers["ETag"] != etag